@@ -22,7 +22,8 @@ def cli():
 
 @cli.command()
 @click.option('--interactive', '-i', is_flag=True, help='启用交互式对话模式')
-def chat(interactive):
+@click.option('--no-cache', is_flag=True, help='不使用模型响应缓存，每次重新生成')
+def chat(interactive, no_cache):
     """启动对话模式"""
     from src.agents.test_agent import TestAgent
     
@@ -41,8 +42,18 @@ def chat(interactive):
                     console.print("👋 再见！")
                     break
                 
-                response = agent.chat(user_input)
-                console.print(f"[bold green]AI助手: [/bold green]{response}")
+                result = agent.chat_stream(user_input, use_cache=not no_cache)
+                console.print("[bold green]AI助手: [/bold green]", end="")
+                # 逐段输出，第一个 token 到达即开始显示
+                stream = result["response"]
+                for token in stream:
+                    console.print(token, end="", markup=False, highlight=False)
+                console.print()
+                stats = stream.stats
+                if stats.get("cached"):
+                    console.print("[dim]（来自响应缓存）[/dim]")
+                elif stats.get("tokens_per_second"):
+                    console.print(f"[dim]{stats['eval_count']} tokens · {stats['tokens_per_second']:.1f} tokens/s[/dim]")
                 
             except KeyboardInterrupt:
                 console.print("\n👋 再见！")
@@ -54,7 +65,9 @@ def chat(interactive):
 @click.option('--input', '-i', required=True, help='输入的功能描述文件')
 @click.option('--output', '-o', default='./output', help='输出目录')
 @click.option('--format', '-f', default='json', help='输出格式 (json/yaml/txt)')
-def generate(input, output, format):
+@click.option('--concurrency', '-c', default=None, type=int, help='同时生成的场景数（默认读取 GENERATION_CONCURRENCY）')
+@click.option('--no-cache', is_flag=True, help='不使用模型响应缓存，每次重新生成')
+def generate(input, output, format, concurrency, no_cache):
     """批量生成测试用例"""
     from src.generators.test_case_generator import TestCaseGenerator
     
@@ -69,13 +82,27 @@ def generate(input, output, format):
         with open(input, 'r', encoding='utf-8') as f:
             features = f.read()
         
-        test_cases = generator.generate_from_features(features, format)
+        def on_progress(done, total, scenario_name, ok):
+            status = "✅" if ok else "[red]❌[/red]"
+            console.print(f"  [{done}/{total}] {status} {scenario_name}")
+        
+        test_cases = generator.generate_from_features(features, format, concurrency, on_progress,
+                                                      use_cache=not no_cache)
         
         output_file = os.path.join(output, f'test_cases.{format}')
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write(test_cases)
         
         console.print(f"✅ 测试用例已生成到: {output_file}")
+        metrics = generator.llama_client.scheduler.metrics()
+        batch_wait = metrics["wait_seconds"]["batch"]
+        console.print(f"[dim]调度: {metrics['completed']} 次生成 · 合并 {metrics['coalesced']} 次 · "
+                      f"批量平均排队 {batch_wait['avg']:.1f}s（p95 {batch_wait['p95']:.1f}s）[/dim]")
+        prompt_eval = generator.llama_client.prompt_meter.report()
+        if prompt_eval["calls"]:
+            console.print(f"[dim]Prompt 评估: {prompt_eval['prompt_eval_tokens']} tokens · "
+                          f"{prompt_eval['prompt_eval_seconds']:.1f}s（占总耗时 {prompt_eval['prompt_eval_share']:.0%}）· "
+                          f"前缀缓存约省 {prompt_eval['saved_seconds_estimate']:.1f}s[/dim]")
         
     except Exception as e:
         console.print(f"[red]错误: {e}[/red]")
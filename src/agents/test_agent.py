@@ -3,41 +3,79 @@ AI测试代理 - 核心对话和功能分发模块
 """
 
 import os
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
 from ..generators.test_case_generator import TestCaseGenerator
 from ..generators.data_generator import DataGenerator
 from ..config.settings import Settings
-from ..utils.llama_client import LlamaClient
-from ..rag.retriever import Retriever
+from ..utils.llama_client import ChatStream, LlamaClient
+from ..utils.response_cache import CacheHint
 
 class TestAgent:
     """AI测试代理 - 智能测试助手"""
     
-    def __init__(self):
+    def __init__(self, warm_up: Optional[bool] = None):
         self.settings = Settings()
         # 配置LLaMA客户端
         self.llama_client = LlamaClient()
         self.test_case_generator = TestCaseGenerator()
         self.data_generator = DataGenerator()
         self.conversation_history = []
-        # 初始化RAG检索器
-        self.retriever = Retriever(file_path=os.path.join(os.path.dirname(__file__), '..', '..', 'faiss_index'))
+        # RAG检索器（嵌入模型 + 索引）在第一次使用时才创建，可在后台线程中预热
+        self._retriever = None
+        self._retriever_lock = threading.Lock()
+        self._warmup_thread = None
+        if self.settings.rag_warmup if warm_up is None else warm_up:
+            self.start_rag_warmup()
+        if self.settings.ollama_preload:
+            # 模型加载在 Ollama 进程内进行，这里只在后台发出请求
+            threading.Thread(target=self.llama_client.preload_model, name="model-preload", daemon=True).start()
+
+    @property
+    def retriever(self):
+        """RAG检索器；后台预热尚未完成时等待其完成，预热失败时在这里重试"""
+        with self._retriever_lock:
+            if self._retriever is None:
+                from ..rag.retriever import Retriever
+                self._retriever = Retriever(file_path=os.path.join(os.path.dirname(__file__), '..', '..', 'faiss_index'))
+            return self._retriever
+
+    @property
+    def rag_ready(self) -> bool:
+        return self._retriever is not None
+
+    def start_rag_warmup(self) -> None:
+        """在后台线程中加载嵌入模型和索引，不阻塞启动"""
+        if self._retriever is not None or self._warmup_thread is not None:
+            return
+        self._warmup_thread = threading.Thread(target=self._warm_up, name="rag-warmup", daemon=True)
+        self._warmup_thread.start()
+
+    def _warm_up(self) -> None:
+        try:
+            self.retriever
+        except Exception as e:
+            print(f"RAG warm-up failed, will retry on first use: {e}")
         
-    def chat(self, user_input: str) -> Dict:
-        """处理用户输入并返回包含响应和上下文的字典"""
+    def chat(self, user_input: str, use_cache: bool = True) -> Dict:
+        """
+        处理用户输入并返回包含响应和上下文的字典
+        
+        :param use_cache: 是否使用模型响应缓存；False 时重新生成（代理由多个会话共用，只能按调用传入）
+        """
         try:
             # 判断用户意图
             intent = self._analyze_intent(user_input)
             
             # 根据意图调用相应功能
             if intent == "generate_test_cases":
-                response = self._handle_test_case_generation(user_input)
+                response = self._handle_test_case_generation(user_input, use_cache)
                 return {"response": response, "context": None}
             elif intent == "generate_test_data":
                 response = self._handle_test_data_generation(user_input)
                 return {"response": response, "context": None}
             elif intent == "general_chat":
-                return self._handle_general_chat(user_input)
+                return self._handle_general_chat(user_input, use_cache)
             else:
                 response = self._handle_help()
                 return {"response": response, "context": None}
@@ -45,6 +83,29 @@ class TestAgent:
         except Exception as e:
             return {"response": f"抱歉，处理您的请求时出现错误：{str(e)}", "context": None}
     
+    def chat_stream(self, user_input: str, use_cache: bool = True) -> Dict:
+        """
+        流式版 chat：返回的 response 是 ChatStream，迭代得到逐段文本，结束后 stats 为本次生成的统计信息
+        
+        只有一般对话会流式调用模型；其他意图一次性产出完整结果（stats 为空）。
+        检索在返回前完成，因此 context 立即可用。
+        """
+        try:
+            intent = self._analyze_intent(user_input)
+            if intent == "general_chat":
+                prompt, system_prompt, retrieved_context = self._build_rag_prompt(user_input)
+                return {
+                    "response": self.llama_client.stream_content(
+                        prompt, system_prompt, use_cache=use_cache,
+                        cache_hint=CacheHint(user_input, retrieved_context),
+                    ),
+                    "context": retrieved_context,
+                }
+            result = self.chat(user_input, use_cache)
+        except Exception as e:
+            result = {"response": f"对话处理出现错误：{str(e)}", "context": None}
+        return {"response": ChatStream(iter([result["response"]]), {}), "context": result["context"]}
+    
     def _analyze_intent(self, user_input: str) -> str:
         """分析用户意图"""
         user_input_lower = user_input.lower()
@@ -66,7 +127,7 @@ class TestAgent:
         
         return "general_chat"
     
-    def _handle_test_case_generation(self, user_input: str) -> str:
+    def _handle_test_case_generation(self, user_input: str, use_cache: bool = True) -> str:
         """处理测试用例生成请求"""
         try:
             # 提取功能描述
@@ -76,7 +137,10 @@ class TestAgent:
                 return "请提供具体的功能描述，例如：'为用户登录功能生成测试用例'"
             
             # 生成测试用例
-            test_cases = self.test_case_generator.generate_from_description(feature_description)
+            test_cases, error = self.test_case_generator.generate_from_description(feature_description,
+                                                                                   use_cache=use_cache)
+            if error:
+                return f"生成测试用例时出现错误：{error}"
             
             return f"✅ 根据您的功能描述，我为您生成了以下测试用例：\n\n{test_cases}"
             
@@ -99,16 +163,15 @@ class TestAgent:
         except Exception as e:
             return f"生成测试数据时出现错误：{str(e)}"
     
-    def _handle_general_chat(self, user_input: str) -> Dict:
-        """处理一般对话，并使用RAG增强上下文"""
-        try:
-            # 1. 从知识库检索相关上下文
-            retrieved_context = self.retriever.query(user_input)
-            
-            # 2. 构建增强的提示
-            system_prompt = """你是一个专业的AI测试助手。请根据下面提供的"相关上下文"来回答用户的问题。如果上下文中没有相关信息，请根据你的通用知识回答，并说明信息并非来自知识库。"""
-            
-            enhanced_prompt = f"""
+    def _build_rag_prompt(self, user_input: str) -> Tuple[str, str, str]:
+        """检索上下文并构建增强提示，返回 (提示, 系统提示, 检索到的上下文)"""
+        # 1. 从知识库检索相关上下文
+        retrieved_context = self.retriever.query(user_input)
+        
+        # 2. 构建增强的提示
+        system_prompt = """你是一个专业的AI测试助手。请根据下面提供的"相关上下文"来回答用户的问题。如果上下文中没有相关信息，请根据你的通用知识回答，并说明信息并非来自知识库。"""
+        
+        enhanced_prompt = f"""
 相关上下文:
 ---
 {retrieved_context}
@@ -116,9 +179,18 @@ class TestAgent:
 
 用户问题: {user_input}
 """
+        return enhanced_prompt, system_prompt, retrieved_context
+    
+    def _handle_general_chat(self, user_input: str, use_cache: bool = True) -> Dict:
+        """处理一般对话，并使用RAG增强上下文"""
+        try:
+            enhanced_prompt, system_prompt, retrieved_context = self._build_rag_prompt(user_input)
             
             # 3. 使用LLaMA生成响应
-            response = self.llama_client.generate_content(enhanced_prompt, system_prompt)
+            response = self.llama_client.generate_content(
+                enhanced_prompt, system_prompt, use_cache=use_cache,
+                cache_hint=CacheHint(user_input, retrieved_context),
+            )
             return {"response": response, "context": retrieved_context}
             
         except Exception as e:
@@ -15,9 +15,29 @@ class Settings(BaseSettings):
     
     # LLaMA模型配置 (使用Ollama)
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    ollama_base_urls: str = os.getenv("OLLAMA_BASE_URLS", "")
+    ollama_health_interval: float = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
     llama_model: str = os.getenv("LLAMA_MODEL", "llama2:7b-chat")
     model_temperature: float = float(os.getenv("MODEL_TEMPERATURE", "0.7"))
     max_tokens: int = int(os.getenv("MAX_TOKENS", "2000"))
+    context_window: int = int(os.getenv("CONTEXT_WINDOW", "4096"))
+    ollama_num_parallel: int = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+    ollama_connect_timeout: float = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+    ollama_read_timeout: float = float(os.getenv("OLLAMA_READ_TIMEOUT", "60"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    llm_retry_backoff: float = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+    llm_retry_backoff_max: float = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "30"))
+    llm_breaker_threshold: int = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+    llm_breaker_reset: float = float(os.getenv("LLM_BREAKER_RESET", "30"))
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    ollama_preload: bool = os.getenv("OLLAMA_PRELOAD", "True").lower() == "true"
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+    llm_reserved_interactive: int = int(os.getenv("LLM_RESERVED_INTERACTIVE", "1"))
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "")
+    llm_cache_max_mb: int = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+    llm_cache_ttl: int = int(os.getenv("LLM_CACHE_TTL", "604800"))
+    llm_cache_semantic: bool = os.getenv("LLM_CACHE_SEMANTIC", "False").lower() == "true"
+    llm_cache_semantic_threshold: float = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0.95"))
     
     # 项目配置
     project_name: str = os.getenv("PROJECT_NAME", "AI测试用例生成器")
@@ -30,6 +50,41 @@ class Settings(BaseSettings):
     # 数据配置
     default_locale: str = os.getenv("DEFAULT_LOCALE", "zh_CN")
     default_test_framework: str = os.getenv("DEFAULT_TEST_FRAMEWORK", "pytest")
+    generation_concurrency: int = int(os.getenv("GENERATION_CONCURRENCY", "0"))
+    
+    # RAG配置
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "huggingface")
+    embedding_model_path: str = os.getenv("EMBEDDING_MODEL_PATH", "")
+    embedding_quantized: bool = os.getenv("EMBEDDING_QUANTIZED", "False").lower() == "true"
+    embedding_tolerance: float = float(os.getenv("EMBEDDING_TOLERANCE", "0.02"))
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    embedding_workers: int = int(os.getenv("EMBEDDING_WORKERS", "1"))
+    ingest_batch_size: int = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+    knowledge_include: str = os.getenv("KNOWLEDGE_INCLUDE", "*.txt,*.md")
+    knowledge_exclude: str = os.getenv("KNOWLEDGE_EXCLUDE", "")
+    knowledge_sharded: bool = os.getenv("KNOWLEDGE_SHARDED", "False").lower() == "true"
+    knowledge_shards: str = os.getenv("KNOWLEDGE_SHARDS", "auto")
+    shard_search_workers: int = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+    embedding_cache_max_mb: int = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+    query_cache_ttl: int = int(os.getenv("QUERY_CACHE_TTL", "600"))
+    faiss_index_spec: str = os.getenv("FAISS_INDEX_SPEC", "Flat")
+    faiss_nprobe: int = int(os.getenv("FAISS_NPROBE", "16"))
+    faiss_ef_search: int = int(os.getenv("FAISS_EF_SEARCH", "64"))
+    faiss_train_size: int = int(os.getenv("FAISS_TRAIN_SIZE", "20000"))
+    vector_store_load_mode: str = os.getenv("VECTOR_STORE_LOAD_MODE", "memory")
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    hybrid_candidates: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    rag_warmup: bool = os.getenv("RAG_WARMUP", "True").lower() == "true"
+    rerank_enabled: bool = os.getenv("RERANK_ENABLED", "False").lower() == "true"
+    rerank_model: str = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    rerank_candidates: int = int(os.getenv("RERANK_CANDIDATES", "20"))
+    rerank_timeout_ms: int = int(os.getenv("RERANK_TIMEOUT_MS", "300"))
+    context_reserve_tokens: int = int(os.getenv("CONTEXT_RESERVE_TOKENS", "512"))
+    context_dedupe_threshold: float = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.8"))
     
     # Google API Key
     google_api_key: Optional[str] = None
@@ -47,12 +102,17 @@ class Settings(BaseSettings):
         except:
             return False
     
+    def context_token_budget(self) -> int:
+        """检索上下文可用的 token 数：上下文窗口减去生成长度和提示词预留"""
+        return max(256, self.context_window - self.max_tokens - self.context_reserve_tokens)
+
     def get_model_config(self) -> dict:
         """获取模型配置"""
         return {
             "model": self.llama_model,
             "temperature": self.model_temperature,
             "max_tokens": self.max_tokens,
+            "context_window": self.context_window,
             "base_url": self.ollama_base_url
         }
 
@@ -5,26 +5,23 @@
 import json
 import yaml
 import re
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from ..config.settings import Settings
 from ..utils.llama_client import LlamaClient
+from ..utils.resilience import LlamaError
+from ..utils.scheduler import PRIORITY_BATCH
 
-class TestCaseGenerator:
-    """测试用例生成器"""
-    
-    def __init__(self):
-        self.settings = Settings()
-        # 配置LLaMA客户端
-        self.llama_client = LlamaClient()
-        
-    def generate_from_description(self, feature_description: str, test_framework: str = "pytest") -> str:
-        """根据功能描述生成测试用例"""
-        
-        system_prompt = f"""你是一个专业的测试工程师，需要根据功能描述生成详细的测试用例。
+# 进度回调：(已完成数, 总数, 场景名, 是否成功)
+ProgressCallback = Callable[[int, int, str, bool], None]
+
+# 系统提示词保持逐字节不变（不插入任何变量），Ollama 可以复用已计算的前缀 KV 缓存，
+# 测试框架等随调用变化的内容放在用户提示词中
+TEST_CASE_SYSTEM_PROMPT = """你是一个专业的测试工程师，需要根据功能描述生成详细的测试用例。
 
 请按照以下格式生成测试用例：
 
-## 功能：{{功能名称}}
+## 功能：{功能名称}
 
 ### 正向测试用例
 1. **测试用例名**: xxx
@@ -58,21 +55,67 @@ class TestCaseGenerator:
 2. 测试步骤清晰具体
 3. 预期结果明确可验证
 4. 优先级设置合理
+"""
+
+AUTOMATION_SYSTEM_PROMPT = """你是一个测试自动化专家，需要将测试用例转换为可执行的自动化测试代码。
+
+请生成：
+1. 完整的测试类和方法
+2. 必要的setup和teardown
+3. 断言和验证逻辑
+4. 适当的注释和文档
 
-测试框架：{test_framework}
+代码应该：
+- 遵循最佳实践
+- 易于维护和扩展
+- 包含错误处理
+- 具有良好的可读性
 """
+
+class TestCaseGenerator:
+    """测试用例生成器"""
+    
+    def __init__(self):
+        self.settings = Settings()
+        # 配置LLaMA客户端
+        self.llama_client = LlamaClient()
         
+    def generate_from_description(self, feature_description: str, test_framework: str = "pytest",
+                                  priority: Optional[int] = None, use_cache: bool = True) -> Tuple[str, Optional[str]]:
+        """
+        根据功能描述生成测试用例，返回 (测试用例, 错误说明)
+
+        失败时测试用例为空、错误说明非空，调用方据此提示错误，不会把错误说明当作测试用例展示。
+        priority 为调度优先级（默认按交互请求处理），use_cache 为 False 时重新生成。
+        """
+        prompt = self._test_case_prompt(feature_description, test_framework)
+        return self._generate(prompt, TEST_CASE_SYSTEM_PROMPT, use_cache, priority)
+    
+    def _generate(self, prompt: str, system_prompt: str, use_cache: bool = True,
+                  priority: Optional[int] = None) -> Tuple[str, Optional[str]]:
+        """生成一次内容，返回 (结果, 错误说明)；重试由 LlamaClient 完成"""
         try:
-            # 使用LLaMA生成响应
-            prompt = f"请为以下功能生成测试用例：{feature_description}"
-            response = self.llama_client.generate_content(prompt, system_prompt)
-            return response
-            
-        except Exception as e:
-            return f"生成测试用例时出现错误：{str(e)}"
+            return self.llama_client.generate(prompt, system_prompt, use_cache, priority), None
+        except LlamaError as e:
+            return "", str(e)
     
-    def generate_from_features(self, features_text: str, output_format: str = "json") -> str:
-        """从Gherkin格式的.feature文件内容中生成批量测试用例"""
+    @staticmethod
+    def _test_case_prompt(feature_description: str, test_framework: str) -> str:
+        return f"测试框架：{test_framework}\n\n请为以下功能生成测试用例：{feature_description}"
+    
+    def generate_from_features(self, features_text: str, output_format: str = "json",
+                               concurrency: Optional[int] = None,
+                               on_progress: Optional[ProgressCallback] = None, use_cache: bool = True) -> str:
+        """
+        从Gherkin格式的.feature文件内容中生成批量测试用例
+        
+        各场景并发发给模型，同时处理的场景数不超过 concurrency（默认 GENERATION_CONCURRENCY，
+        为 0 时取 OLLAMA_NUM_PARALLEL），输出顺序与文件中的场景顺序一致。
+        请求以批量优先级交给调度器，不会挤占对话等交互请求的槽位。
+        单个场景的可重试错误由 LlamaClient 单独重试；最终失败的场景 test_cases 为空，
+        失败原因记录在 error 字段中，不会被当作测试用例写入结果。
+        on_progress 在调用线程中回调，可以直接更新界面；use_cache 为 False 时全部重新生成。
+        """
         try:
             # 使用正则表达式分离Feature和Scenarios
             feature_header_match = re.search(r'^\s*Feature:(.*)', features_text, re.IGNORECASE | re.MULTILINE)
@@ -80,9 +123,8 @@ class TestCaseGenerator:
 
             scenarios = re.split(r'\n\s*(?=Scenario:)', features_text, flags=re.IGNORECASE)
             
-            all_test_cases = []
-            
             # 从第二个元素开始遍历，第一个是Feature描述
+            scenario_blocks = []
             for scenario_block in scenarios[1:]:
                 if not scenario_block.strip():
                     continue
@@ -90,14 +132,19 @@ class TestCaseGenerator:
                 # 提取Scenario的标题和步骤
                 scenario_lines = scenario_block.strip().split('\n')
                 scenario_name = scenario_lines[0].replace('Scenario:', '').strip()
-                
-                # 将整个Scenario作为描述传递
-                test_case = self.generate_from_description(scenario_block)
-                
-                all_test_cases.append({
+                scenario_blocks.append((scenario_name, scenario_block))
+            
+            # 将整个Scenario作为描述传递
+            results = self._generate_scenarios(scenario_blocks, concurrency, on_progress, use_cache)
+            all_test_cases = []
+            for (scenario_name, _), (test_case, error) in zip(scenario_blocks, results):
+                entry = {
                     'feature': f"{feature_name} - {scenario_name}",
                     'test_cases': test_case
-                })
+                }
+                if error:
+                    entry['error'] = error
+                all_test_cases.append(entry)
             
             # 根据格式返回结果
             if output_format == "json":
@@ -109,14 +156,50 @@ class TestCaseGenerator:
                 text_output = ""
                 for i, tc in enumerate(all_test_cases, 1):
                     text_output += f"\n{'='*50}\n功能 {i}: {tc['feature']}\n{'='*50}\n"
-                    text_output += tc['test_cases'] + "\n"
+                    if tc.get('error'):
+                        text_output += f"❌ 生成失败：{tc['error']}\n"
+                    else:
+                        text_output += tc['test_cases'] + "\n"
                 return text_output
                 
         except Exception as e:
             return f"生成测试用例时出现错误：{str(e)}"
     
-    def generate_api_test_cases(self, api_spec: Dict) -> str:
-        """根据API规范生成测试用例"""
+    def _generate_scenario(self, scenario_block: str, use_cache: bool = True) -> Tuple[str, Optional[str]]:
+        """生成单个场景的测试用例，返回 (结果, 错误说明)；重试由 LlamaClient 完成"""
+        prompt = self._test_case_prompt(scenario_block, self.settings.default_test_framework)
+        return self._generate(prompt, TEST_CASE_SYSTEM_PROMPT, use_cache, PRIORITY_BATCH)
+    
+    def _generate_scenarios(self, scenario_blocks: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                            on_progress: Optional[ProgressCallback] = None,
+                            use_cache: bool = True) -> List[Tuple[str, Optional[str]]]:
+        """有界并发地生成各场景，结果按输入顺序排列"""
+        total = len(scenario_blocks)
+        workers = (concurrency or self.settings.generation_concurrency
+                   or self.settings.ollama_num_parallel * len(self.llama_client.pool.endpoints))
+        workers = max(1, min(workers, total or 1))
+        results: List[Optional[Tuple[str, Optional[str]]]] = [None] * total
+        failed = 0
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scenario-gen") as executor:
+            futures = {
+                executor.submit(self._generate_scenario, block, use_cache): i
+                for i, (_, block) in enumerate(scenario_blocks)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                results[i] = future.result()
+                ok = results[i][1] is None
+                failed += not ok
+                if on_progress:
+                    on_progress(done, total, scenario_blocks[i][0], ok)
+        
+        if failed:
+            print(f"Scenario generation finished with {failed}/{total} failures.")
+        return results
+    
+    def generate_api_test_cases(self, api_spec: Dict) -> Tuple[str, Optional[str]]:
+        """根据API规范生成测试用例，返回 (测试用例, 错误说明)"""
         
         system_prompt = """你是一个API测试专家，需要根据API规范生成详细的测试用例。
 
@@ -135,40 +218,10 @@ class TestCaseGenerator:
 - 测试目的
 """
         
-        try:
-            # 使用LLaMA生成响应
-            prompt = f"请为以下API生成测试用例：{json.dumps(api_spec, ensure_ascii=False, indent=2)}"
-            response = self.llama_client.generate_content(prompt, system_prompt)
-            return response
-            
-        except Exception as e:
-            return f"生成API测试用例时出现错误：{str(e)}"
+        prompt = f"请为以下API生成测试用例：{json.dumps(api_spec, ensure_ascii=False, indent=2)}"
+        return self._generate(prompt, system_prompt)
     
-    def generate_automation_code(self, test_cases: str, framework: str = "pytest") -> str:
-        """将测试用例转换为自动化测试代码"""
-        
-        system_prompt = f"""你是一个测试自动化专家，需要将测试用例转换为可执行的自动化测试代码。
-
-使用测试框架：{framework}
-
-请生成：
-1. 完整的测试类和方法
-2. 必要的setup和teardown
-3. 断言和验证逻辑
-4. 适当的注释和文档
-
-代码应该：
-- 遵循最佳实践
-- 易于维护和扩展
-- 包含错误处理
-- 具有良好的可读性
-"""
-        
-        try:
-            # 使用LLaMA生成响应
-            prompt = f"请将以下测试用例转换为自动化测试代码：\n{test_cases}"
-            response = self.llama_client.generate_content(prompt, system_prompt)
-            return response
-            
-        except Exception as e:
-            return f"生成自动化测试代码时出现错误：{str(e)}" 
\ No newline at end of file
+    def generate_automation_code(self, test_cases: str, framework: str = "pytest") -> Tuple[str, Optional[str]]:
+        """将测试用例转换为自动化测试代码，返回 (代码, 错误说明)"""
+        prompt = f"使用测试框架：{framework}\n\n请将以下测试用例转换为自动化测试代码：\n{test_cases}"
+        return self._generate(prompt, AUTOMATION_SYSTEM_PROMPT)
@@ -1,4 +1,5 @@
 from .knowledge_base import KnowledgeBase
+from .sharded_knowledge_base import ShardedKnowledgeBase
 from .retriever import Retriever
 
-__all__ = ["KnowledgeBase", "Retriever"] 
\ No newline at end of file
+__all__ = ["KnowledgeBase", "ShardedKnowledgeBase", "Retriever"] 
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+属性索引 - 按块元数据（空间、作者、项目、日期）预先建立的过滤索引
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+ATTRIBUTES_FILE = "attributes.npz"
+
+# 取值离散的字段：每个取值一张位图
+CATEGORICAL_FIELDS = ("space", "project", "author")
+# 日期字段：按天（YYYYMMDD）排序的数组，支持区间查询
+DATE_FIELDS = ("created", "updated")
+
+FilterValue = Union[str, Sequence[str], Tuple[Optional[str], Optional[str]]]
+
+
+def parse_date(value) -> int:
+    """把 2024-05-01 / 2024-05-01T10:00:00.000Z / datetime 转成 20240501，无法解析时返回 0"""
+    text = str(value or "")[:10]
+    digits = text.replace("-", "").replace("/", "")
+    return int(digits) if len(digits) == 8 and digits.isdigit() else 0
+
+
+def filter_key(filters: Optional[Dict[str, FilterValue]]):
+    """过滤条件的规范化表示，可用作缓存键"""
+    if not filters:
+        return None
+    return tuple(sorted((field, repr(value)) for field, value in filters.items()))
+
+
+class AttributeIndex:
+    """
+    以块ID为文档键的元数据索引
+
+    - 离散字段：每个文档一个取值编码（-1 表示缺失），合并时为每个取值生成一张位图
+      （np.packbits，little 位序，与 faiss.IDSelectorBitmap 一致）；
+    - 日期字段：每个文档一个 YYYYMMDD 整数，另存按日期排序的文档下标，区间查询用二分。
+
+    与 LexicalIndex 一样，新增的块先暂存，删除只做标记，save 时一次性合并。
+    """
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.values: Dict[str, List[str]] = {field: [] for field in CATEGORICAL_FIELDS}
+        self.codes = {field: np.zeros(0, dtype=np.int32) for field in CATEGORICAL_FIELDS}
+        self.bitmaps = {field: np.zeros((0, 0), dtype=np.uint8) for field in CATEGORICAL_FIELDS}
+        self.dates = {field: np.zeros(0, dtype=np.int32) for field in DATE_FIELDS}
+        self.date_order = {field: np.zeros(0, dtype=np.int64) for field in DATE_FIELDS}
+        self._value_codes = {field: {} for field in CATEGORICAL_FIELDS}
+        self._alive = np.ones(0, dtype=bool)
+        self._position = {}
+        self._pending: List[Tuple[str, dict]] = []
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, ATTRIBUTES_FILE))
+
+    @classmethod
+    def load(cls, path: str) -> "AttributeIndex":
+        index = cls()
+        with np.load(os.path.join(path, ATTRIBUTES_FILE)) as data:
+            index.doc_ids = [doc_id.decode('utf-8') for doc_id in data["doc_ids"]]
+            for field in CATEGORICAL_FIELDS:
+                index.values[field] = [value.decode('utf-8') for value in data[f"{field}.values"]]
+                index.codes[field] = data[f"{field}.codes"]
+                index.bitmaps[field] = data[f"{field}.bitmaps"]
+            for field in DATE_FIELDS:
+                index.dates[field] = data[f"{field}.dates"]
+                index.date_order[field] = data[f"{field}.order"]
+        index._value_codes = {field: {value: code for code, value in enumerate(values)}
+                              for field, values in index.values.items()}
+        index._alive = np.ones(len(index.doc_ids), dtype=bool)
+        index._position = {doc_id: i for i, doc_id in enumerate(index.doc_ids)}
+        return index
+
+    def add(self, chunk_id: str, metadata: dict) -> None:
+        """暂存一个块的元数据，save 时合并"""
+        self._pending.append((chunk_id, metadata))
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        pending_ids = set()
+        for chunk_id in chunk_ids:
+            position = self._position.get(chunk_id)
+            if position is not None:
+                self._alive[position] = False
+            else:
+                pending_ids.add(chunk_id)
+        if pending_ids:
+            self._pending = [item for item in self._pending if item[0] not in pending_ids]
+
+    def merge(self) -> None:
+        """把暂存的新增块和删除标记合并，并重建位图与日期排序"""
+        if not self._pending and self._alive.all():
+            return
+        keep = np.flatnonzero(self._alive)
+        self.doc_ids = [self.doc_ids[i] for i in keep] + [chunk_id for chunk_id, _ in self._pending]
+        for field in CATEGORICAL_FIELDS:
+            known = self._value_codes[field]
+            new_codes = []
+            for _, metadata in self._pending:
+                value = metadata.get(field)
+                if value is None or value == "":
+                    new_codes.append(-1)
+                    continue
+                new_codes.append(known.setdefault(str(value), len(known)))
+            self.values[field] = list(known)
+            self.codes[field] = np.concatenate((self.codes[field][keep], np.array(new_codes, dtype=np.int32)))
+        for field in DATE_FIELDS:
+            new_dates = np.array([parse_date(metadata.get(field)) for _, metadata in self._pending], dtype=np.int32)
+            self.dates[field] = np.concatenate((self.dates[field][keep], new_dates))
+        self._alive = np.ones(len(self.doc_ids), dtype=bool)
+        self._position = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self._pending = []
+        self._build()
+
+    def _build(self) -> None:
+        num_docs = len(self.doc_ids)
+        num_bytes = (num_docs + 7) // 8
+        for field in CATEGORICAL_FIELDS:
+            codes = self.codes[field]
+            bitmaps = np.zeros((len(self.values[field]), num_bytes), dtype=np.uint8)
+            docs = np.flatnonzero(codes >= 0)
+            np.bitwise_or.at(bitmaps, (codes[docs], docs >> 3), (1 << (docs & 7)).astype(np.uint8))
+            self.bitmaps[field] = bitmaps
+        for field in DATE_FIELDS:
+            dates = self.dates[field]
+            dated = np.flatnonzero(dates > 0)
+            self.date_order[field] = dated[np.argsort(dates[dated], kind='stable')]
+
+    def save(self, path: str) -> None:
+        self.merge()
+        os.makedirs(path, exist_ok=True)
+        arrays = {"doc_ids": np.array([doc_id.encode('utf-8') for doc_id in self.doc_ids], dtype=bytes)}
+        for field in CATEGORICAL_FIELDS:
+            arrays[f"{field}.values"] = np.array([value.encode('utf-8') for value in self.values[field]], dtype=bytes)
+            arrays[f"{field}.codes"] = self.codes[field]
+            arrays[f"{field}.bitmaps"] = self.bitmaps[field]
+        for field in DATE_FIELDS:
+            arrays[f"{field}.dates"] = self.dates[field]
+            arrays[f"{field}.order"] = self.date_order[field]
+        target = os.path.join(path, ATTRIBUTES_FILE)
+        with open(target + ".tmp", 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(target + ".tmp", target)
+
+    def mask(self, filters: Dict[str, FilterValue]) -> np.ndarray:
+        """
+        计算满足所有过滤条件的文档掩码（按本索引的文档顺序）
+
+        离散字段的值可以是单个字符串或字符串列表（任一命中即可）；
+        日期字段的值是 (起, 止) 闭区间，任一端为 None 表示不限。
+        """
+        num_docs = len(self.doc_ids)
+        result = self._alive.copy()
+        for field, condition in filters.items():
+            if field in CATEGORICAL_FIELDS:
+                wanted = [condition] if isinstance(condition, str) else list(condition)
+                codes = [self._value_codes[field][value] for value in wanted if value in self._value_codes[field]]
+                if not codes:
+                    return np.zeros(num_docs, dtype=bool)
+                packed = np.bitwise_or.reduce(self.bitmaps[field][codes], axis=0)
+                result &= np.unpackbits(packed, count=num_docs, bitorder='little').astype(bool)
+            elif field in DATE_FIELDS:
+                start, end = condition
+                dates = self.dates[field]
+                order = self.date_order[field]
+                sorted_dates = dates[order]
+                low = np.searchsorted(sorted_dates, parse_date(start), 'left') if start else 0
+                high = np.searchsorted(sorted_dates, parse_date(end), 'right') if end else len(order)
+                in_range = np.zeros(num_docs, dtype=bool)
+                in_range[order[low:high]] = True
+                result &= in_range
+            else:
+                raise ValueError(f"不支持的过滤字段: {field}，可用字段: {CATEGORICAL_FIELDS + DATE_FIELDS}")
+        return result
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self._pending)
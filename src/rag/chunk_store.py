@@ -0,0 +1,229 @@
+"""
+块存储 - 追加写入的文本/元数据文件 + 偏移表，可内存映射后按需读取
+"""
+
+import os
+import json
+import mmap
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+DATA_FILE = "chunks.bin"
+OFFSETS_FILE = "chunk_offsets.npy"
+IDS_FILE = "chunk_ids.npy"
+ID_ORDER_FILE = "chunk_id_order.npy"
+
+# 数据文件中有效记录占比低于该值时压缩重写
+COMPACT_RATIO = 0.5
+
+
+def _encode(doc: Document) -> bytes:
+    return json.dumps(
+        {"page_content": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False,
+    ).encode('utf-8')
+
+
+def _write_tables(path: str, offsets: np.ndarray, ids: List[bytes]) -> None:
+    """写入偏移表、ID表和ID排序表（先写临时文件再替换）"""
+    id_array = np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")
+    arrays = {
+        OFFSETS_FILE: offsets,
+        IDS_FILE: id_array,
+        ID_ORDER_FILE: np.argsort(id_array, kind='stable').astype(np.int64),
+    }
+    for name, array in arrays.items():
+        with open(os.path.join(path, name + ".tmp"), 'wb') as f:
+            np.save(f, array)
+    for name in arrays:
+        os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+
+class ChunkStore:
+    """
+    按 FAISS 向量位置顺序索引的块
+
+    - chunks.bin：只追加的 UTF-8 JSON 记录（page_content + metadata）
+    - chunk_offsets.npy：形状 (n, 2)，第 i 个向量的记录位于 [start, end)
+    - chunk_ids.npy：第 i 个向量的块ID（定长字节串）
+    - chunk_id_order.npy：块ID的排序下标，用二分查找把ID映射回位置
+
+    所有文件都以 mmap 方式打开，打开成本与块数量无关，只有命中的记录才会被读取和解析。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode='r')
+        self.id_order = np.load(os.path.join(path, ID_ORDER_FILE), mmap_mode='r')
+        self._file = open(os.path.join(path, DATA_FILE), 'rb')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, name))
+                   for name in (DATA_FILE, OFFSETS_FILE, IDS_FILE, ID_ORDER_FILE))
+
+    @staticmethod
+    def save(path: str, ordered_ids: Sequence[str], docstore: Docstore) -> None:
+        """
+        按向量位置顺序保存块
+
+        docstore 是基于本目录块存储的 LazyDocstore 时，已有记录沿用原偏移，
+        只把新增的块追加到数据文件末尾；否则整体重写。
+        垃圾（已删除块的记录）占比过高时自动压缩。
+        """
+        os.makedirs(path, exist_ok=True)
+        data_path = os.path.join(path, DATA_FILE)
+        previous = docstore.store if isinstance(docstore, LazyDocstore) else None
+        if previous is not None and not previous.is_current_file(data_path):
+            previous = None
+        added = docstore.added if isinstance(docstore, LazyDocstore) else {}
+
+        offsets = np.empty((len(ordered_ids), 2), dtype=np.int64)
+        target = data_path if previous is not None else data_path + ".tmp"
+        with open(target, 'ab' if previous is not None else 'wb') as f:
+            position = f.seek(0, os.SEEK_END)
+            for i, chunk_id in enumerate(ordered_ids):
+                old = previous.position_of(chunk_id) if previous is not None and chunk_id not in added else None
+                if old is not None:
+                    offsets[i] = previous.offsets[old]
+                    continue
+                payload = _encode(docstore.search(chunk_id))
+                f.write(payload)
+                offsets[i] = (position, position + len(payload))
+                position += len(payload)
+        if previous is None:
+            os.replace(target, data_path)
+        _write_tables(path, offsets, [chunk_id.encode('utf-8') for chunk_id in ordered_ids])
+
+        live = int((offsets[:, 1] - offsets[:, 0]).sum()) if len(offsets) else 0
+        if live < os.path.getsize(data_path) * COMPACT_RATIO:
+            ChunkStore.compact(path)
+
+    @staticmethod
+    def compact(path: str) -> None:
+        """丢弃不再被引用的记录，按位置顺序重写数据文件"""
+        store = ChunkStore(path)
+        try:
+            data_path = os.path.join(path, DATA_FILE)
+            offsets = np.empty_like(np.asarray(store.offsets))
+            with open(data_path + ".tmp", 'wb') as f:
+                position = 0
+                for i, (start, end) in enumerate(store.offsets):
+                    f.write(store._data[int(start):int(end)])
+                    offsets[i] = (position, position + int(end - start))
+                    position += int(end - start)
+            ids = [bytes(chunk_id) for chunk_id in store.ids]
+        finally:
+            store.close()
+        os.replace(data_path + ".tmp", data_path)
+        _write_tables(path, offsets, ids)
+
+    def is_current_file(self, data_path: str) -> bool:
+        """打开的数据文件是否仍是磁盘上的那个（未被其他进程压缩替换）"""
+        try:
+            return os.stat(data_path).st_ino == self._inode
+        except FileNotFoundError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def id_at(self, position: int) -> str:
+        return self.ids[position].decode('utf-8')
+
+    def id_map(self) -> Dict[int, str]:
+        """位置 -> 块ID 的字典（只含ID，不读取文本）"""
+        return {position: chunk_id.decode('utf-8') for position, chunk_id in enumerate(self.ids)}
+
+    def position_of(self, chunk_id: str) -> Optional[int]:
+        """二分查找块ID对应的位置"""
+        key = chunk_id.encode('utf-8')
+        if len(self.ids) == 0 or len(key) > self.ids.dtype.itemsize:
+            return None
+        sorted_pos = int(np.searchsorted(self.ids, key, sorter=self.id_order))
+        if sorted_pos < len(self.id_order):
+            position = int(self.id_order[sorted_pos])
+            if self.ids[position] == key:
+                return position
+        return None
+
+    def positions_of(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        """批量查找块ID对应的位置，找不到的为 -1"""
+        keys = np.array([chunk_id.encode('utf-8') for chunk_id in chunk_ids], dtype=bytes)
+        if len(self.ids) == 0 or len(keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        sorted_ids = np.asarray(self.ids)[self.id_order]
+        sorted_pos = np.minimum(np.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+        found = sorted_ids[sorted_pos] == keys
+        return np.where(found, np.asarray(self.id_order)[sorted_pos], -1)
+
+    def document_at(self, position: int) -> Document:
+        start, end = (int(value) for value in self.offsets[position])
+        record = json.loads(self._data[start:end].decode('utf-8'))
+        return Document(id=self.id_at(position), page_content=record["page_content"],
+                        metadata=record["metadata"])
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class LazyDocstore(Docstore, AddableMixin):
+    """
+    基于 ChunkStore 的 Docstore
+
+    已保存的块在命中时才从磁盘读取；新增的块暂存在内存，删除只记录ID，
+    下一次 ChunkStore.save 时落盘。
+    """
+
+    def __init__(self, store: Optional[ChunkStore] = None):
+        self.store = store
+        self.added: Dict[str, Document] = {}
+        self.deleted: set = set()
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self.added:
+            return self.added[search]
+        position = self.store.position_of(search) if self.store is not None and search not in self.deleted else None
+        if position is None:
+            return f"ID {search} not found."
+        return self.store.document_at(position)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self.added)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for chunk_id in texts:
+            self.deleted.discard(chunk_id)
+        self.added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        for chunk_id in ids:
+            if self.added.pop(chunk_id, None) is None:
+                self.deleted.add(chunk_id)
+
+
+class PositionalIds(Mapping):
+    """只读视图使用的惰性 index_to_docstore_id：向量位置 -> 块ID"""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self.store):
+            raise KeyError(position)
+        return self.store.id_at(position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.store)))
+
+    def __len__(self) -> int:
+        return len(self.store)
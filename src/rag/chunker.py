@@ -0,0 +1,186 @@
+"""
+Markdown 切分器 - 按标题/表格/代码块结构切分，并把 frontmatter 写入块元数据
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+import yaml
+from langchain_core.documents import Document
+
+# 写入块元数据的 frontmatter 字段（ConfluencePageFetcher.save_page_as_md 输出的格式）
+FRONTMATTER_FIELDS = ("title", "id", "url", "space", "project", "author", "created", "updated")
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+
+_HEADING_RE = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)[ \t#]*$")
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_TABLE_RE = re.compile(r"^ {0,3}\|")
+# 超长段落优先在这些位置断开
+_BREAK_RE = re.compile(r"\n|(?<=[。！？；.!?;])\s*")
+
+
+def parse_frontmatter(text: str) -> Tuple[Dict[str, str], int]:
+    """
+    解析开头的 YAML frontmatter
+
+    :return: (字段字典, 正文起始偏移)；没有或无法解析时返回 ({}, 0)
+    """
+    if not text.startswith("---"):
+        return {}, 0
+    end = text.find("\n---", 3)
+    if end == -1:
+        return {}, 0
+    try:
+        meta = yaml.safe_load(text[3:end]) or {}
+    except yaml.YAMLError:
+        return {}, 0
+    if not isinstance(meta, dict):
+        return {}, 0
+    body = text.find("\n", end + 4)
+    return meta, len(text) if body == -1 else body + 1
+
+
+class _Block:
+    __slots__ = ("kind", "start", "end", "level", "title")
+
+    def __init__(self, kind: str, start: int, end: int, level: int = 0, title: str = ""):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.level = level
+        self.title = title
+
+
+def _iter_blocks(text: str, offset: int) -> Iterator[_Block]:
+    """
+    单遍扫描正文，产出结构块：heading / code / table / text
+
+    块的 [start, end) 是原文偏移（不含末尾换行），代码块和表格不会被拆开。
+    """
+    kind, start, end, fence = None, 0, 0, None
+    position = offset
+    for line in text[offset:].splitlines(keepends=True):
+        line_start, position = position, position + len(line)
+        content = line.rstrip("\r\n")
+        line_end = line_start + len(content)
+
+        if kind == "code":
+            end = line_end
+            if content.strip().startswith(fence) and content.strip().strip(fence[0]) == "":
+                yield _Block(kind, start, end)
+                kind = None
+            continue
+
+        fence_match = _FENCE_RE.match(content)
+        heading_match = _HEADING_RE.match(content)
+        if not content.strip():
+            line_kind = None
+        elif fence_match or heading_match:
+            line_kind = "new"
+        elif _TABLE_RE.match(content):
+            line_kind = "table"
+        else:
+            line_kind = "text"
+
+        if kind is not None and line_kind != kind:
+            yield _Block(kind, start, end)
+            kind = None
+        if fence_match:
+            kind, start, end, fence = "code", line_start, line_end, fence_match.group(1)
+        elif heading_match:
+            level = len(heading_match.group(1))
+            yield _Block("heading", line_start, line_end, level, heading_match.group(2))
+        elif line_kind is not None:
+            if kind is None:
+                kind, start = line_kind, line_start
+            end = line_end
+    if kind is not None:
+        yield _Block(kind, start, end)
+
+
+class MarkdownChunker:
+    """
+    结构感知的 Markdown 切分器
+
+    - 一级/二级标题总是开启新块，更深的标题在当前块已有一定长度时开启新块；
+    - 表格和代码块作为整体放入块中，只有单个结构块本身超过 chunk_size 时才按行拆开；
+    - 超长段落在换行或句末断开，实在断不开才按字符截断并保留 chunk_overlap 的重叠；
+    - 块元数据带 frontmatter 字段、所在标题路径（section）和 start_index。
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split_text(self, text: str) -> List[Tuple[int, int, str]]:
+        """返回 (start, end, section) 列表，start/end 为原文偏移"""
+        _, body = parse_frontmatter(text)
+        chunks: List[Tuple[int, int, str]] = []
+        headings: List[str] = []
+        chunk_start, chunk_end, section = None, None, ""
+        # 只有标题、还没有正文的块不单独成块，与下一节合并
+        has_body = False
+
+        def flush():
+            nonlocal chunk_start
+            if chunk_start is not None:
+                chunks.append((chunk_start, chunk_end, section))
+                chunk_start = None
+
+        for block in _iter_blocks(text, body):
+            if block.kind == "heading":
+                if chunk_start is not None and has_body and (
+                        block.level <= 2 or chunk_end - chunk_start >= self.chunk_size // 3):
+                    flush()
+                headings[block.level - 1:] = [block.title]
+                if chunk_start is not None and not has_body:
+                    section = " > ".join(h for h in headings if h)
+            if chunk_start is not None and block.end - chunk_start > self.chunk_size:
+                flush()
+            if block.end - block.start > self.chunk_size:
+                flush()
+                current = " > ".join(h for h in headings if h)
+                chunks.extend((start, end, current) for start, end in self._split_long(text, block))
+                continue
+            if chunk_start is None:
+                chunk_start, section, has_body = block.start, " > ".join(h for h in headings if h), False
+            chunk_end = block.end
+            has_body = has_body or block.kind != "heading"
+        flush()
+        return chunks
+
+    def _split_long(self, text: str, block: _Block) -> Iterator[Tuple[int, int]]:
+        """拆分单个超长结构块：代码/表格按行，正文按句，最后才按字符"""
+        start = block.start
+        while block.end - start > self.chunk_size:
+            limit = start + self.chunk_size
+            cut = text.rfind("\n", start + 1, limit)
+            if cut == -1 and block.kind == "text":
+                cut = max((m.end() for m in _BREAK_RE.finditer(text, start + 1, limit)
+                           if m.end() < limit), default=-1)
+            if cut <= start:
+                yield start, limit
+                start = max(limit - self.chunk_overlap, start + 1)
+                continue
+            yield start, cut
+            start = cut + 1 if text[cut] == "\n" else cut
+        if start < block.end:
+            yield start, block.end
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        chunks = []
+        for doc in documents:
+            text = doc.page_content
+            meta, _ = parse_frontmatter(text)
+            base = dict(doc.metadata)
+            base.update({field: str(meta[field]) for field in FRONTMATTER_FIELDS
+                         if meta.get(field) is not None})
+            for start, end, section in self.split_text(text):
+                raw = text[start:end]
+                content = raw.strip()
+                if not content:
+                    continue
+                metadata = dict(base, start_index=start + len(raw) - len(raw.lstrip()))
+                if section:
+                    metadata["section"] = section
+                chunks.append(Document(page_content=content, metadata=metadata))
+        return chunks
@@ -0,0 +1,151 @@
+"""
+上下文组装 - 去重、合并相邻块，并按 token 预算打包
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence, Set
+from langchain_core.documents import Document
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_SPACE_RE = re.compile(r"\s+")
+# 相邻块之间被切分器丢掉的分隔符（如段落间的空行）最多这么长时仍视为相接
+_MAX_GAP = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：中日韩字符按 1 个计，其余按 4 个字符 1 个计
+
+    Ollama 不提供分词接口，估算值略偏大，宁可少放一点上下文也不截断提示词。
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def shingles(text: str, size: int = 8) -> Set[int]:
+    """空白折叠后的字符 n-gram 哈希集合"""
+    text = _SPACE_RE.sub(" ", text).strip().lower()
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Group:
+    """同一来源中相互重叠或首尾相接的块合并后的片段"""
+
+    def __init__(self, rank: int, doc: Document):
+        self.rank = rank
+        self.source = doc.metadata.get("source")
+        self.start = doc.metadata.get("start_index")
+        self.text = doc.page_content
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def absorb(self, rank: int, doc: Document) -> bool:
+        """doc 与本片段在原文中重叠或相接时并入，返回是否合并"""
+        start = doc.metadata.get("start_index")
+        if self.start is None or start is None or doc.metadata.get("source") != self.source:
+            return False
+        text = doc.page_content
+        if start < self.start:
+            gap = self.start - (start + len(text))
+            if gap > _MAX_GAP:
+                return False
+            self.text = text + ("\n\n" if gap > 0 else "") + self.text[max(0, -gap):]
+            self.start = start
+        else:
+            gap = start - self.end
+            if gap > _MAX_GAP:
+                return False
+            self.text = self.text + ("\n\n" if gap > 0 else "") + text[max(0, -gap):]
+        self.rank = min(self.rank, rank)
+        return True
+
+
+class ContextBuilder:
+    """
+    把检索结果组装成发送给模型的上下文
+
+    1. 同一来源的相邻/重叠块（切分时的 chunk_overlap）按 start_index 合并成连续片段；
+    2. 字符 shingle 的 Jaccard 相似度超过阈值的片段视为重复，只保留排名靠前的；
+    3. 按排名依次放入，直到用完 token 预算。
+    """
+
+    def __init__(self, token_budget: int, dedupe_threshold: float = 0.8, separator: str = "\n\n"):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+        self.separator = separator
+
+    def _merge(self, docs: Sequence[Document]) -> List[_Group]:
+        groups: List[_Group] = []
+        for rank, doc in enumerate(docs):
+            if not any(group.absorb(rank, doc) for group in groups):
+                groups.append(_Group(rank, doc))
+        # 合并后的片段可能与其他片段接上，再做一轮直到稳定
+        merged = True
+        while merged:
+            merged = False
+            for i, group in enumerate(groups):
+                for other in groups[i + 1:]:
+                    doc = Document(page_content=other.text,
+                                   metadata={"source": other.source, "start_index": other.start})
+                    if group.absorb(other.rank, doc):
+                        groups.remove(other)
+                        merged = True
+                        break
+                if merged:
+                    break
+        return sorted(groups, key=lambda group: group.rank)
+
+    def _dedupe(self, groups: List[_Group]) -> List[_Group]:
+        kept: List[_Group] = []
+        kept_shingles: List[Set[int]] = []
+        for group in groups:
+            current = shingles(group.text)
+            if any(jaccard(current, other) >= self.dedupe_threshold for other in kept_shingles):
+                continue
+            kept.append(group)
+            kept_shingles.append(current)
+        return kept
+
+    def build(self, docs: Sequence[Document], token_budget: Optional[int] = None) -> str:
+        budget = self.token_budget if token_budget is None else token_budget
+        separator_tokens = estimate_tokens(self.separator)
+        parts: List[str] = []
+        used = 0
+        for group in self._dedupe(self._merge(docs)):
+            cost = estimate_tokens(group.text) + (separator_tokens if parts else 0)
+            if used + cost <= budget:
+                parts.append(group.text)
+                used += cost
+            elif not parts:
+                # 排名第一的片段本身超出预算时截断放入，保证至少有一段上下文
+                parts.append(self._truncate(group.text, budget))
+                break
+        return self.separator.join(parts)
+
+    @staticmethod
+    def _truncate(text: str, budget: int) -> str:
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def stats(self, docs: Sequence[Document]) -> Dict[str, int]:
+        """组装前后的 token 估算，便于观察去重与合并的效果"""
+        raw = sum(estimate_tokens(doc.page_content) for doc in docs)
+        return {"raw_tokens": raw, "context_tokens": estimate_tokens(self.build(docs)),
+                "budget": self.token_budget}
@@ -0,0 +1,174 @@
+"""
+嵌入缓存 - 以模型名+文本哈希为键，把向量持久化到SQLite
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingCache:
+    """
+    基于SQLite的嵌入向量缓存
+
+    向量以 float32 字节保存；总大小超过 max_bytes 时按最近访问时间淘汰到上限的 90%。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """缓存键：命名空间（模型名及用途）+ 文本内容的SHA256"""
+        return hashlib.sha256(f"{namespace}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, namespace: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """批量查询，未命中的位置为 None"""
+        keys = [self.make_key(namespace, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, namespace: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """批量写入，并在超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        rows = [
+            (self.make_key(namespace, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._total_bytes += sum(len(row[1]) for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # 先按数据库重新统计（其他进程可能也写入了），再批量删除最旧的条目
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                doomed.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def embed_queries(embeddings: Embeddings, texts: Sequence[str]) -> List[List[float]]:
+    """
+    一次前向计算嵌入多个查询
+
+    sentence-transformers 模型的查询与文档编码方式相同，没有专门的批量查询接口时
+    用 embed_documents 代替逐个 embed_query。
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(list(texts))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    给任意 Embeddings 加上持久化缓存
+
+    文档嵌入与查询嵌入使用不同的命名空间，兼容查询/文档编码方式不同的模型。
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def lookup_documents(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        return self.cache.get_many(f"{self.model_name}:doc", texts)
+
+    def store_documents(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        self.cache.put_many(f"{self.model_name}:doc", texts, vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.lookup_documents(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = self.embeddings.embed_documents(missing_texts)
+            self.store_documents(missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = list(vector)
+        return vectors
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """批量嵌入查询：一次读缓存，未命中的合并为一次前向计算"""
+        namespace = f"{self.model_name}:query"
+        vectors = self.cache.get_many(namespace, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = embed_queries(self.embeddings, missing_texts)
+            self.cache.put_many(namespace, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = list(vector)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        namespace = f"{self.model_name}:query"
+        vector = self.cache.get_many(namespace, [text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(namespace, [text], [vector])
+        return vector
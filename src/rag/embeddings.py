@@ -0,0 +1,159 @@
+"""
+嵌入后端 - 按配置创建 HuggingFace（PyTorch）或 ONNX Runtime（可选 int8 量化）嵌入模型
+"""
+
+import os
+from typing import Dict, List, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from ..config.settings import Settings
+
+BACKENDS = ("huggingface", "onnx")
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    用 ONNX Runtime 在 CPU 上运行 sentence-transformers 模型，不依赖 PyTorch
+
+    model_path 是本地模型目录，需包含 model.onnx（或量化后的 model_int8.onnx）和 tokenizer.json，
+    可用 `optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 <目录>` 导出，
+    再用 quantize_onnx_model 生成 int8 版本。输出做均值池化和 L2 归一化，与原模型一致。
+    """
+
+    def __init__(self, model_path: str, quantized: bool = False, batch_size: int = 64,
+                 max_length: int = 256, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 嵌入后端需要安装 onnxruntime 和 tokenizers：pip install onnxruntime tokenizers") from e
+        model_file = os.path.join(model_path, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"找不到 ONNX 模型文件: {model_file}")
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = max(1, batch_size)
+
+    def _embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + self.batch_size]))
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+            hidden = self.session.run(None, feeds)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+
+def create_embeddings(backend: str = "huggingface", model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                      model_path: str = "", quantized: bool = False, batch_size: int = 64,
+                      num_threads: int = 0) -> Embeddings:
+    """
+    按后端名创建嵌入模型；PyTorch 只在 huggingface 后端被用到时才导入
+
+    :param model_path: 本地模型目录，onnx 后端必填，huggingface 后端留空则按 model_name 下载
+    :param num_threads: 计算线程数，0 表示使用默认值（多进程建索引时用于避免超额订阅）
+    """
+    if backend == "onnx":
+        if not model_path:
+            raise ValueError("ONNX 嵌入后端需要配置 EMBEDDING_MODEL_PATH（本地模型目录）")
+        return OnnxEmbeddings(model_path, quantized=quantized, batch_size=batch_size, num_threads=num_threads)
+    if backend != "huggingface":
+        raise ValueError(f"不支持的嵌入后端: {backend}，可选: {BACKENDS}")
+    if num_threads:
+        try:
+            import torch
+            torch.set_num_threads(num_threads)
+        except ImportError:
+            pass
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_path or model_name,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+def embedding_config(settings: Settings) -> Dict:
+    """从配置生成 create_embeddings 的参数（可以传给子进程）"""
+    return {
+        "backend": settings.embedding_backend,
+        "model_name": settings.embedding_model,
+        "model_path": settings.embedding_model_path,
+        "quantized": settings.embedding_quantized,
+        "batch_size": settings.embedding_batch_size,
+    }
+
+
+def cache_namespace(config: Dict) -> str:
+    """嵌入缓存的命名空间：不同后端/量化方式的向量不能混用"""
+    if config["backend"] == "huggingface":
+        return config["model_name"]
+    return f"{config['model_name']}:{config['backend']}{':int8' if config['quantized'] else ''}"
+
+
+def quantize_onnx_model(model_path: str) -> str:
+    """对 model.onnx 做动态 int8 量化，生成 model_int8.onnx 并返回其路径"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    target = os.path.join(model_path, ONNX_INT8_MODEL_FILE)
+    quantize_dynamic(os.path.join(model_path, ONNX_MODEL_FILE), target, weight_type=QuantType.QInt8)
+    return target
+
+
+def check_tolerance(candidate: Embeddings, reference: Embeddings, texts: Sequence[str],
+                    tolerance: float = 0.02) -> Dict:
+    """
+    比较两个后端对同一批文本的向量
+
+    :return: 最小/平均余弦相似度，以及是否所有向量都满足 1 - cos <= tolerance
+    """
+    a = np.array(candidate.embed_documents(list(texts)), dtype=np.float32)
+    b = np.array(reference.embed_documents(list(texts)), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "passed": bool((1 - cosine).max() <= tolerance),
+    }
+
+
+if __name__ == '__main__':
+    # 用配置的后端与原始 PyTorch 模型对比，确认量化/导出后的向量仍在容差内
+    settings = Settings()
+    config = embedding_config(settings)
+    samples = [
+        "用户登录时密码错误三次后锁定账户",
+        "POST /api/v1/orders 返回 201 并生成订单号",
+        "Verify the checkout flow applies the discount code before tax.",
+        "ERR_500: 支付网关超时后应自动重试",
+    ]
+    report = check_tolerance(
+        create_embeddings(**config),
+        create_embeddings("huggingface", settings.embedding_model, batch_size=settings.embedding_batch_size),
+        samples,
+        settings.embedding_tolerance,
+    )
+    print(f"Embedding backend check ({cache_namespace(config)}): {report}")
@@ -0,0 +1,127 @@
+"""
+FAISS 索引工厂 - 按规格字符串创建、训练索引并设置检索参数
+"""
+
+from typing import Optional, Tuple
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from .chunk_store import LazyDocstore
+
+DEFAULT_INDEX_SPEC = "Flat"
+
+
+def create_index(spec: str, dim: int, train_vectors: Optional[np.ndarray] = None) -> Tuple[object, str]:
+    """
+    按 faiss.index_factory 规格创建索引，需要训练时用 train_vectors 训练
+
+    常用规格：Flat（精确）、IVF1024,Flat、HNSW32、IVF1024,PQ48。
+    样本不足以训练（如少于聚类中心数）时退回 Flat 并打印提示。
+    :return: (索引, 实际使用的规格)
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.index_factory(dim, spec)
+    if index.is_trained:
+        return index, spec
+    if train_vectors is None or len(train_vectors) == 0:
+        raise ValueError(f"索引类型 {spec} 需要训练样本")
+    try:
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    except RuntimeError as e:
+        print(f"Training {spec} index failed ({len(train_vectors)} samples), falling back to Flat: {e}")
+        return faiss.index_factory(dim, DEFAULT_INDEX_SPEC), DEFAULT_INDEX_SPEC
+    return index, spec
+
+
+def needs_training(spec: str, dim: int) -> bool:
+    """该规格的索引是否需要先训练"""
+    faiss = dependable_faiss_import()
+    return not faiss.index_factory(dim, spec).is_trained
+
+
+def supports_removal(index) -> bool:
+    """
+    索引能否按 LangChain 的方式删除向量
+
+    LangChain 删除后假定剩余向量的位置被压实，只有 Flat/PQ 等 IndexFlatCodes 满足；
+    IVF 删除后不重新编号，HNSW 则完全不支持删除。
+    """
+    faiss = dependable_faiss_import()
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+
+def apply_search_params(index, nprobe: int, ef_search: int) -> None:
+    """设置 IVF 的 nprobe 与 HNSW 的 efSearch，不适用的参数自动忽略"""
+    faiss = dependable_faiss_import()
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+def filtered_search(index, query: np.ndarray, k: int, mask: np.ndarray, nprobe: int, ef_search: int):
+    """
+    只在 mask 为 True 的向量位置中检索 top-k
+
+    支持 IDSelector 的索引（Flat、IVF、HNSW 等）在检索过程中跳过不满足条件的向量；
+    不支持的（如 IndexPQ）退回逐步扩大候选数再过滤。
+    :return: (距离, 位置)，形状均为 (len(query), k)，不足 k 个时位置为 -1
+    """
+    faiss = dependable_faiss_import()
+    query = np.ascontiguousarray(query, dtype=np.float32)
+    packed = np.packbits(mask, bitorder='little')
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(packed))
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef_search, k))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    try:
+        return index.search(query, k, params=params)
+    except RuntimeError:
+        pass
+
+    fetch = k
+    while True:
+        fetch = min(fetch * 4, index.ntotal)
+        distances, positions = index.search(query, fetch)
+        keep = (positions >= 0) & mask[np.maximum(positions, 0)]
+        if fetch >= index.ntotal or keep.sum(axis=1).min() >= k:
+            break
+    out_distances = np.full((len(query), k), np.inf, dtype=np.float32)
+    out_positions = np.full((len(query), k), -1, dtype=np.int64)
+    for row in range(len(query)):
+        hits = np.flatnonzero(keep[row])[:k]
+        out_distances[row, :len(hits)] = distances[row, hits]
+        out_positions[row, :len(hits)] = positions[row, hits]
+    return out_distances, out_positions
+
+
+def new_vector_store(embeddings, index) -> FAISS:
+    """用给定索引创建空的 LangChain FAISS 向量存储"""
+    return FAISS(embeddings, index, LazyDocstore(), {})
+
+
+def read_index_mmap(path: str, spec: str = DEFAULT_INDEX_SPEC):
+    """
+    以内存映射方式只读加载索引
+
+    IVF 的倒排表使用 IO_FLAG_MMAP，Flat/PQ 等使用 IO_FLAG_MMAP_IFC（faiss>=1.10）；
+    两个标志不能组合使用，按规格决定先尝试哪个，都不支持时退回普通加载。
+    """
+    faiss = dependable_faiss_import()
+    read_only = getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    flag_names = ("IO_FLAG_MMAP", "IO_FLAG_MMAP_IFC") if "IVF" in spec.upper() else ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP")
+    for flag_name in flag_names:
+        flag = getattr(faiss, flag_name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | read_only)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
@@ -0,0 +1,148 @@
+"""
+嵌入流水线 - 分批嵌入文档块并增量写入向量索引
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+import numpy as np
+from .embeddings import create_embeddings
+from .index_factory import DEFAULT_INDEX_SPEC, create_index, needs_training, new_vector_store
+
+# 子进程内的嵌入模型，由 _init_worker 初始化
+_worker_embeddings = None
+
+
+def _init_worker(embedding_config: Dict, num_threads: int) -> None:
+    """子进程初始化：每个进程只加载一次模型，并限制线程数避免CPU超额订阅"""
+    global _worker_embeddings
+    _worker_embeddings = create_embeddings(**embedding_config, num_threads=num_threads)
+
+
+def _embed_in_worker(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+class EmbeddingPipeline:
+    """
+    把 (Document, chunk_id) 流按批次嵌入并写入 FAISS
+
+    num_workers 为 1 时在当前进程用已加载的模型嵌入；大于 1 时启动进程池，
+    每个进程持有一份模型，批次按提交顺序写入索引，同时最多 2*num_workers 个批次在途，
+    因此内存占用只与批大小相关。
+
+    新建索引时按 index_spec 创建；需要训练的类型（IVF、PQ）先缓存最多 train_size
+    个向量作为训练样本，训练完成后再把缓存的批次写入。样本不足时退回 Flat，
+    实际使用的规格记录在 built_spec 中。
+    """
+
+    def __init__(self, embeddings, embedding_config: Dict, batch_size: int = 512, num_workers: int = 1,
+                 index_spec: str = DEFAULT_INDEX_SPEC, train_size: int = 20000):
+        self.embeddings = embeddings
+        # 子进程按同一份配置创建嵌入模型
+        self.embedding_config = embedding_config
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+        self.index_spec = index_spec
+        self.train_size = train_size
+        # 最近一次新建索引实际使用的规格（训练失败时为 Flat）
+        self.built_spec = index_spec
+
+    def _batches(self, chunks: Iterable[Tuple[Document, str]]) -> Iterator[List[Tuple[Document, str]]]:
+        iterator = iter(chunks)
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def embed_batches(self, chunks: Iterable[Tuple[Document, str]]) -> Iterator[Tuple[List[Tuple[Document, str]], List[List[float]]]]:
+        """按顺序产出 (批次, 向量)"""
+        if self.num_workers == 1:
+            for batch in self._batches(chunks):
+                yield batch, self.embeddings.embed_documents([doc.page_content for doc, _ in batch])
+            return
+
+        num_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        with ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.embedding_config, num_threads),
+        ) as executor:
+            pending = deque()
+            for batch in self._batches(chunks):
+                texts = [doc.page_content for doc, _ in batch]
+                cached = self._lookup(texts)
+                missing = [i for i, vector in enumerate(cached) if vector is None]
+                future = executor.submit(_embed_in_worker, [texts[i] for i in missing]) if missing else None
+                pending.append((batch, cached, missing, future))
+                if len(pending) >= 2 * self.num_workers:
+                    yield self._collect(*pending.popleft())
+            while pending:
+                yield self._collect(*pending.popleft())
+
+    def _lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """进程池模式下在主进程查询嵌入缓存（若 embeddings 带缓存）"""
+        lookup = getattr(self.embeddings, "lookup_documents", None)
+        return lookup(texts) if lookup else [None] * len(texts)
+
+    def _collect(self, batch, cached, missing, future):
+        if future is None:
+            return batch, cached
+        computed = future.result()
+        store = getattr(self.embeddings, "store_documents", None)
+        if store:
+            store([batch[i][0].page_content for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            cached[i] = vector
+        return batch, cached
+
+    def _create_from(self, buffered) -> FAISS:
+        """用缓存的批次（同时作为训练样本）创建指定类型的索引，并写入这些批次"""
+        dim = len(buffered[0][1][0])
+        sample = None
+        if needs_training(self.index_spec, dim):
+            sample = np.array([vector for _, vectors in buffered for vector in vectors], dtype=np.float32)
+            if len(sample) > self.train_size:
+                rng = np.random.default_rng(0)
+                sample = sample[rng.choice(len(sample), self.train_size, replace=False)]
+            print(f"Training {self.index_spec} index on {len(sample)} vectors...")
+        index, self.built_spec = create_index(self.index_spec, dim, sample)
+        vector_store = new_vector_store(self.embeddings, index)
+        for batch, vectors in buffered:
+            self._add(vector_store, batch, vectors)
+        return vector_store
+
+    def _add(self, vector_store: FAISS, batch, vectors) -> None:
+        text_embeddings = [(doc.page_content, vector) for (doc, _), vector in zip(batch, vectors)]
+        metadatas = [doc.metadata for doc, _ in batch]
+        ids = [chunk_id for _, chunk_id in batch]
+        vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        print(f"Embedded {len(batch)} chunks (index size: {vector_store.index.ntotal})")
+
+    def add_to(self, vector_store: Optional[FAISS], chunks: Iterable[Tuple[Document, str]]) -> Optional[FAISS]:
+        """
+        将块写入向量存储；vector_store 为 None 时按 index_spec 新建
+
+        :return: 写入后的向量存储（没有任何块且未传入存储时为 None）
+        """
+        buffered, buffered_count = [], 0
+        for batch, vectors in self.embed_batches(chunks):
+            if vector_store is not None:
+                self._add(vector_store, batch, vectors)
+                continue
+            buffered.append((batch, vectors))
+            buffered_count += len(batch)
+            if buffered_count >= self.train_size or not needs_training(self.index_spec, len(vectors[0])):
+                vector_store = self._create_from(buffered)
+                buffered = []
+
+        if vector_store is None and buffered:
+            vector_store = self._create_from(buffered)
+        return vector_store
@@ -1,53 +1,426 @@
 import os
+import threading
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from ..config.settings import Settings
+from .attribute_index import AttributeIndex, filter_key
+from .embedding_cache import CachedEmbeddings, EmbeddingCache, embed_queries
+from .embeddings import cache_namespace, create_embeddings, embedding_config
+from .chunker import MARKDOWN_SUFFIXES, MarkdownChunker
+from .chunk_store import ChunkStore, LazyDocstore, PositionalIds
+from .index_factory import apply_search_params, filtered_search, read_index_mmap, supports_removal
+from .ingest import EmbeddingPipeline
+from .lexical import LexicalIndex
+from .loader import iter_documents, iter_source_files, parse_patterns
+from .manifest import IndexManifest
+
+INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+
+class EmptyKnowledgeBaseError(ValueError):
+    """知识库目录中没有可索引的文档"""
+
+
+def create_knowledge_embeddings(settings: Settings):
+    """按配置创建嵌入模型；配置了嵌入缓存时建索引和查询都经过同一个缓存"""
+    config = embedding_config(settings)
+    embeddings = create_embeddings(**config)
+    if settings.embedding_cache_path:
+        cache = EmbeddingCache(
+            settings.embedding_cache_path,
+            max_bytes=settings.embedding_cache_max_mb * 1024 * 1024,
+        )
+        embeddings = CachedEmbeddings(embeddings, cache, cache_namespace(config))
+    return embeddings
+
+
+_shared_embeddings: Dict[Tuple, object] = {}
+_shared_embeddings_lock = threading.Lock()
+
+
+def get_knowledge_embeddings(settings: Settings):
+    """
+    进程内共享的嵌入模型（按嵌入配置和缓存路径区分）
+
+    知识库、各分片和语义响应缓存都用它，同一个模型只加载一次。
+    """
+    key = (tuple(sorted(embedding_config(settings).items())), settings.embedding_cache_path)
+    with _shared_embeddings_lock:
+        if key not in _shared_embeddings:
+            _shared_embeddings[key] = create_knowledge_embeddings(settings)
+        return _shared_embeddings[key]
+
 
 class KnowledgeBase:
     """
     管理知识库的创建和加载
     """
-    def __init__(self, file_path: str, vector_store_path: str = "faiss_index"):
+    def __init__(self, file_path: str, vector_store_path: str = "faiss_index", index_spec: str = None,
+                 load_mode: str = None, embeddings=None, recursive: bool = True):
         self.file_path = file_path
         self.vector_store_path = vector_store_path
-        self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        # 为 False 时只索引 file_path 目录下的文件（分片知识库的根目录分片）
+        self.recursive = recursive
+        self.settings = Settings()
+        self.index_spec = index_spec or self.settings.faiss_index_spec
+        # memory：完整加载到进程堆；mmap：只读内存映射，按需读取命中的块
+        self.load_mode = load_mode or self.settings.vector_store_load_mode
+        # 默认使用进程内共享的嵌入模型，避免重复加载
+        self.embeddings = embeddings or get_knowledge_embeddings(self.settings)
+        # start_index 供上下文组装时合并相邻块
+        self.text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100, add_start_index=True)
+        # Markdown（含 Confluence 导出）按标题/表格/代码块结构切分
+        self.markdown_splitter = MarkdownChunker(chunk_size=1000, chunk_overlap=100)
+        self.pipeline = EmbeddingPipeline(
+            self.embeddings,
+            embedding_config=embedding_config(self.settings),
+            batch_size=self.settings.ingest_batch_size,
+            num_workers=self.settings.embedding_workers,
+            index_spec=self.index_spec,
+            train_size=self.settings.faiss_train_size,
+        )
+        self.manifest = None
+        self.lexical_index = LexicalIndex()
+        self.attribute_index = AttributeIndex()
+        # (索引版本, 属性索引文档 -> 向量位置, 词法索引文档 -> 属性索引文档)
+        self._filter_maps = None
+        self._last_masks = None
         self.vector_store = self._load_or_create_vector_store()
 
-    def _load_documents(self):
-        if os.path.isdir(self.file_path):
-            # 读取目录下所有txt和md文件
-            documents = []
-            for fname in os.listdir(self.file_path):
-                if fname.endswith('.txt') or fname.endswith('.md'):
-                    fpath = os.path.join(self.file_path, fname)
-                    loader = TextLoader(fpath, encoding='utf-8')
-                    documents.extend(loader.load())
-            return documents
-        else:
-            loader = TextLoader(self.file_path, encoding='utf-8')
-            return loader.load()
+    def _iter_source_files(self) -> Iterator[str]:
+        """递归遍历知识库中符合包含/排除规则的源文件"""
+        return iter_source_files(
+            self.file_path,
+            include=parse_patterns(self.settings.knowledge_include),
+            exclude=parse_patterns(self.settings.knowledge_exclude),
+            recursive=self.recursive,
+        )
+
+    def _load_documents(self) -> Iterator[Document]:
+        return iter_documents(self._iter_source_files())
+
+    def _split_file(self, fpath: str):
+        """加载并切分单个文件，为每个块分配ID"""
+        splitter = self.markdown_splitter if fpath.lower().endswith(MARKDOWN_SUFFIXES) else self.text_splitter
+        docs = splitter.split_documents(iter_documents([fpath]))
+        ids = [str(uuid.uuid4()) for _ in docs]
+        return docs, ids
+
+    def _iter_chunks(self, paths: Iterable[str]) -> Iterator[Tuple[Document, str]]:
+        """逐个文件切分并产出 (块, 块ID)，同时把文件记录到清单、把块加入词法索引和属性索引"""
+        for fpath in paths:
+            docs, ids = self._split_file(fpath)
+            # diff 已经算过哈希的修改文件不再重复读取
+            self.manifest.record(fpath, ids, self.manifest.digests.pop(fpath, None))
+            for doc, chunk_id in zip(docs, ids):
+                self.lexical_index.add(chunk_id, doc.page_content)
+                self.attribute_index.add(chunk_id, doc.metadata)
+            yield from zip(docs, ids)
 
     def _create_vector_store(self):
         """从文档创建新的向量存储"""
-        documents = self._load_documents()
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        docs = text_splitter.split_documents(documents)
+        self.manifest = IndexManifest(self.file_path, index_spec=self.index_spec)
+        self.lexical_index = LexicalIndex()
+        self.attribute_index = AttributeIndex()
 
         print("Creating new vector store...")
-        db = FAISS.from_documents(docs, self.embeddings)
-        db.save_local(self.vector_store_path)
+        db = self.pipeline.add_to(None, self._iter_chunks(self._iter_source_files()))
+        if db is None:
+            raise EmptyKnowledgeBaseError(f"知识库中没有可索引的文档: {self.file_path}")
+        # 清单记录实际建成的规格；配置的规格不变时下次启动不重建
+        self.manifest.index_spec = self.pipeline.built_spec
+        if self.pipeline.built_spec != self.index_spec:
+            print(f"Built {self.pipeline.built_spec} index instead of {self.index_spec} "
+                  f"({db.index.ntotal} vectors are not enough to train it); run rebuild after adding documents.")
+        self._save(db)
+        self._apply_search_params(db)
         print("Vector store created and saved.")
         return db
 
+    def _save(self, db) -> None:
+        """
+        保存索引、块存储和清单
+
+        索引先写临时文件再替换，避免截断其他进程正在映射的文件；
+        保存后 docstore 重新指向磁盘上的块存储，释放新增块占用的内存。
+        """
+        faiss = dependable_faiss_import()
+        os.makedirs(self.vector_store_path, exist_ok=True)
+        index_file = os.path.join(self.vector_store_path, INDEX_FILE)
+        faiss.write_index(db.index, index_file + ".tmp")
+        os.replace(index_file + ".tmp", index_file)
+        ordered_ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+        ChunkStore.save(self.vector_store_path, ordered_ids, db.docstore)
+        self.lexical_index.save(self.vector_store_path)
+        self.attribute_index.save(self.vector_store_path)
+        self.manifest.save(self.vector_store_path)
+        db.docstore = LazyDocstore(ChunkStore(self.vector_store_path))
+
     def _load_or_create_vector_store(self):
         """加载或创建向量存储"""
-        index_file = os.path.join(self.vector_store_path, "index.faiss")
-        if os.path.exists(index_file):
-            print("Loading existing vector store...")
-            return FAISS.load_local(self.vector_store_path, self.embeddings, allow_dangerous_deserialization=True)
+        index_file = os.path.join(self.vector_store_path, INDEX_FILE)
+        if not os.path.exists(index_file):
+            db = self._create_vector_store()
+        elif self.load_mode == "mmap" and self._is_mmap_current():
+            print("Memory-mapping existing vector store...")
+            return self._open_mmap()
+        else:
+            self._load_in_memory()
+            self._refresh_in_memory()
+            db = self.vector_store
+        # mmap 模式下更新完成后丢弃堆上的副本，改用映射视图
+        return self._open_mmap() if self.load_mode == "mmap" else db
+
+    def _load_in_memory(self):
+        """加载可修改的向量存储：索引读入内存，块文本仍按需从块存储读取"""
+        print("Loading existing vector store...")
+        if not ChunkStore.exists(self.vector_store_path):
+            self._migrate_pickled_docstore()
+        store = ChunkStore(self.vector_store_path)
+        index = dependable_faiss_import().read_index(os.path.join(self.vector_store_path, INDEX_FILE))
+        db = FAISS(self.embeddings, index, LazyDocstore(store), store.id_map())
+        self.manifest = IndexManifest.load(self.vector_store_path, self.file_path)
+        if self.manifest is None:
+            self.manifest = self._adopt_legacy_index(db)
+        self._load_chunk_indexes(store)
+        if self.manifest.requested_spec != self.index_spec:
+            print(f"Index spec changed ({self.manifest.requested_spec} -> {self.index_spec}), rebuilding...")
+            self.vector_store = self._create_vector_store()
+            return self.vector_store
+        self._apply_search_params(db)
+        self.vector_store = db
+        return db
+
+    def _migrate_pickled_docstore(self) -> None:
+        """
+        把 LangChain save_local 生成的 index.pkl 一次性转换为块存储
+
+        只有迁移时才需要反序列化 pickle，之后不再读取它；原文件改名为 index.pkl.bak 保留，
+        确认迁移无误后可以删除。
+        """
+        pickle_file = os.path.join(self.vector_store_path, LEGACY_DOCSTORE_FILE)
+        print("Migrating pickled docstore to chunk store...")
+        db = FAISS.load_local(self.vector_store_path, self.embeddings, allow_dangerous_deserialization=True)
+        ordered_ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+        ChunkStore.save(self.vector_store_path, ordered_ids, db.docstore)
+        os.replace(pickle_file, pickle_file + ".bak")
+
+    def _load_chunk_indexes(self, store: ChunkStore) -> None:
+        """加载词法索引和属性索引；缺少的从块存储一次性构建"""
+        has_lexical = LexicalIndex.exists(self.vector_store_path)
+        has_attributes = AttributeIndex.exists(self.vector_store_path)
+        self.lexical_index = LexicalIndex.load(self.vector_store_path) if has_lexical else LexicalIndex()
+        self.attribute_index = AttributeIndex.load(self.vector_store_path) if has_attributes else AttributeIndex()
+        if has_lexical and has_attributes:
+            return
+        print("Building lexical/attribute indexes from chunk store...")
+        for position in range(len(store)):
+            doc = store.document_at(position)
+            if not has_lexical:
+                self.lexical_index.add(doc.id, doc.page_content)
+            if not has_attributes:
+                self.attribute_index.add(doc.id, doc.metadata)
+        self.lexical_index.save(self.vector_store_path)
+        self.attribute_index.save(self.vector_store_path)
+
+    def _is_mmap_current(self) -> bool:
+        """映射视图可直接使用：清单、块存储、词法/属性索引齐全，规格一致且源文件没有变化"""
+        manifest = IndexManifest.load(self.vector_store_path, self.file_path)
+        if manifest is None or manifest.requested_spec != self.index_spec:
+            return False
+        if not (ChunkStore.exists(self.vector_store_path) and LexicalIndex.exists(self.vector_store_path)
+                and AttributeIndex.exists(self.vector_store_path)):
+            return False
+        added, changed, removed = manifest.diff(self._iter_source_files())
+        if added or changed or removed:
+            return False
+        self.manifest = manifest
+        return True
+
+    def _open_mmap(self):
+        """以只读内存映射方式打开索引和块存储，多个进程共享同一份页缓存"""
+        store = ChunkStore(self.vector_store_path)
+        index = read_index_mmap(os.path.join(self.vector_store_path, INDEX_FILE), self.manifest.index_spec)
+        db = FAISS(self.embeddings, index, LazyDocstore(store), PositionalIds(store))
+        self._apply_search_params(db)
+        self.lexical_index = LexicalIndex.load(self.vector_store_path)
+        self.attribute_index = AttributeIndex.load(self.vector_store_path)
+        return db
+
+    def _apply_search_params(self, db) -> None:
+        apply_search_params(db.index, self.settings.faiss_nprobe, self.settings.faiss_ef_search)
+
+    def _adopt_legacy_index(self, db) -> IndexManifest:
+        """
+        为没有清单的旧索引生成清单
+
+        按块的 source 元数据归组；源文件仍存在的视为已是最新，
+        找不到源文件的块保持原样，不纳入清单管理。
+        """
+        manifest = IndexManifest(self.file_path)
+        by_source: Dict[str, List[str]] = {}
+        for doc_id in db.index_to_docstore_id.values():
+            doc = db.docstore.search(doc_id)
+            source = getattr(doc, "metadata", {}).get("source")
+            if source:
+                by_source.setdefault(source, []).append(doc_id)
+        for source, chunk_ids in by_source.items():
+            if os.path.isfile(source):
+                manifest.record(source, chunk_ids)
+        manifest.save(self.vector_store_path)
+        return manifest
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        增量更新向量存储：只切分和嵌入新增/修改的文件，并删除已移除文件的向量
+
+        :return: 各类变更的文件数量
+        """
+        if self.load_mode != "mmap":
+            return self._refresh_in_memory()
+        # 映射视图是只读的：有变化时先完整加载、更新并保存，再重新映射
+        if self._is_mmap_current():
+            return {"added": 0, "changed": 0, "removed": 0}
+        self._load_in_memory()
+        stats = self._refresh_in_memory()
+        self.vector_store = self._open_mmap()
+        return stats
+
+    def rebuild(self) -> None:
+        """从源文件完整重建索引（未变化的块会命中嵌入缓存）"""
+        self.vector_store = self._create_vector_store()
+        if self.load_mode == "mmap":
+            self.vector_store = self._open_mmap()
+
+    def _refresh_in_memory(self) -> Dict[str, int]:
+        added, changed, removed = self.manifest.diff(self._iter_source_files())
+        stats = {"added": len(added), "changed": len(changed), "removed": len(removed)}
+        if not (added or changed or removed):
+            # diff 可能只更新了 mtime，保存一次避免下次重复计算哈希
+            self.manifest.save(self.vector_store_path)
+            return stats
+
+        print(f"Refreshing vector store: {stats}")
+        stale_keys = removed + [self.manifest.key_for(path) for path in changed]
+        stale_ids = [chunk_id for key in stale_keys for chunk_id in self.manifest.chunk_ids(key)]
+        if stale_ids and not supports_removal(self.vector_store.index):
+            # IVF/HNSW 无法按位置删除向量，只能重建（未变化的块会命中嵌入缓存）
+            print(f"{self.manifest.index_spec} index does not support removal, rebuilding...")
+            self.vector_store = self._create_vector_store()
+            return stats
+        if stale_ids:
+            self.vector_store.delete(stale_ids)
+            self.lexical_index.remove(stale_ids)
+            self.attribute_index.remove(stale_ids)
+        for key in removed:
+            self.manifest.remove(key)
+
+        self.vector_store = self.pipeline.add_to(self.vector_store, self._iter_chunks(added + changed))
+
+        self.manifest.bump_version()
+        self._save(self.vector_store)
+        print("Vector store refreshed and saved.")
+        return stats
+
+    @property
+    def index_version(self) -> str:
+        """当前索引版本，内容变化后即不同"""
+        return self.manifest.version
+
+    def _filter_position_maps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """属性索引文档 -> 向量位置、词法索引文档 -> 属性索引文档的映射，按索引版本缓存"""
+        version = self.manifest.version
+        if self._filter_maps is None or self._filter_maps[0] != version:
+            store = self.vector_store.docstore.store
+            attribute_ids = self.attribute_index.doc_ids
+            to_position = store.positions_of(attribute_ids)
+            attribute_doc = {chunk_id: i for i, chunk_id in enumerate(attribute_ids)}
+            lexical_to_attribute = np.array([attribute_doc.get(chunk_id, -1)
+                                             for chunk_id in self.lexical_index.doc_ids], dtype=np.int64)
+            self._filter_maps = (version, to_position, lexical_to_attribute)
+        return self._filter_maps[1], self._filter_maps[2]
+
+    def filter_masks(self, filters: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把元数据过滤条件转换为掩码
+
+        :return: (按向量位置的掩码, 按词法索引文档顺序的掩码)
+        """
+        attribute_mask = self.attribute_index.mask(filters)
+        to_position, lexical_to_attribute = self._filter_position_maps()
+        vector_mask = np.zeros(self.vector_store.index.ntotal, dtype=bool)
+        selected = to_position[attribute_mask & (to_position >= 0)]
+        vector_mask[selected] = True
+        lexical_mask = (lexical_to_attribute >= 0) & attribute_mask[np.maximum(lexical_to_attribute, 0)]
+        return vector_mask, lexical_mask
+
+    def _cached_filter_masks(self, filters: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """同一次检索的向量和词法两路共用一次掩码计算"""
+        key = (self.manifest.version, filter_key(filters))
+        if self._last_masks is None or self._last_masks[0] != key:
+            self._last_masks = (key, self.filter_masks(filters))
+        return self._last_masks[1]
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """一次前向计算嵌入所有查询，返回 (n, d) 矩阵"""
+        return np.array(embed_queries(self.embeddings, texts), dtype=np.float32).reshape(len(texts), -1)
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int = 4,
+                          filters: Optional[Dict] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        用一次 FAISS 批量检索处理所有查询向量，每个查询返回 (块, L2 距离) 列表；
+        给出 filters 时在检索过程中只考虑满足元数据条件的块
+
+        filters 示例：{"space": "QA", "author": ["张三", "李四"], "updated": ("2024-01-01", None)}
+        """
+        index = self.vector_store.index
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if index.ntotal == 0 or len(vectors) == 0:
+            return [[] for _ in range(len(vectors))]
+        if filters:
+            vector_mask, _ = self._cached_filter_masks(filters)
+            if not vector_mask.any():
+                return [[] for _ in range(len(vectors))]
+            distances, positions = filtered_search(index, vectors, k, vector_mask,
+                                                   self.settings.faiss_nprobe, self.settings.faiss_ef_search)
         else:
-            return self._create_vector_store()
+            distances, positions = index.search(vectors, k)
+        results = []
+        for row_distances, row_positions in zip(distances, positions):
+            hits = []
+            for distance, position in zip(row_distances, row_positions):
+                if position < 0:
+                    continue
+                doc = self.get_document(self.vector_store.index_to_docstore_id[int(position)])
+                if doc is not None:
+                    hits.append((doc, float(distance)))
+            results.append(hits)
+        return results
+
+    def search_by_vector(self, embedding: List[float], k: int = 4,
+                         filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """用单个查询向量检索，返回 (块, L2 距离)"""
+        return self.search_by_vectors(np.array([embedding], dtype=np.float32), k, filters)[0]
+
+    def search(self, query_text: str, k: int = 4, filters: Optional[Dict] = None) -> List[Document]:
+        """向量检索，返回最相关的 k 个块"""
+        embedding = self.embeddings.embed_query(query_text)
+        return [doc for doc, _ in self.search_by_vector(embedding, k, filters)]
+
+    def lexical_search(self, query_text: str, k: int = 20, filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """BM25 检索，返回 (块ID, 分数)"""
+        lexical_mask = self._cached_filter_masks(filters)[1] if filters else None
+        return self.lexical_index.search(query_text, k, doc_mask=lexical_mask)
+
+    def get_document(self, chunk_id: str) -> Optional[Document]:
+        doc = self.vector_store.docstore.search(chunk_id)
+        return doc if isinstance(doc, Document) else None
 
     def as_retriever(self, k: int = 4):
         """将向量存储作为检索器返回"""
@@ -57,11 +430,11 @@ if __name__ == '__main__':
     # 使用 faiss_index 目录下所有 txt 和 md 文件进行测试
     kb = KnowledgeBase(file_path=os.path.join(os.path.dirname(__file__), '..', '..', 'faiss_index'))
     retriever = kb.as_retriever()
-    
+
     query = "Modern Segment Builder"
     results = retriever.get_relevant_documents(query)
-    
+
     print(f"\nQuery: {query}")
     print("\nResults:")
     for doc in results:
-        print(f"- {doc.page_content[:100]}...") 
\ No newline at end of file
+        print(f"- {doc.page_content[:100]}...")
@@ -0,0 +1,189 @@
+"""
+词法检索 - 中英文混合分词的 BM25 倒排索引
+"""
+
+import os
+import re
+import json
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+VOCAB_FILE = "lexical_vocab.json"
+TERM_PTR_FILE = "lexical_term_ptr.npy"
+DOCS_FILE = "lexical_docs.npy"
+TFS_FILE = "lexical_tfs.npy"
+DOC_LEN_FILE = "lexical_doc_len.npy"
+DOC_IDS_FILE = "lexical_doc_ids.npy"
+
+# 英文/数字标识符（保留 ABC-123、/api/v1/users、ERR_500 这类连写形式）与连续的中日韩文字
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_SPLIT_RE = re.compile(r"[-_./:#]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：标识符整体保留并额外拆出各段；中文按单字 + 相邻双字切分
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if token[0].isascii():
+            tokens.append(token)
+            parts = _SPLIT_RE.split(token)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+        else:
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    以块ID为文档键的 BM25 索引
+
+    倒排表按 CSR 形式保存：term_ptr[t]:term_ptr[t+1] 是词 t 的 (文档下标, 词频)。
+    新增的块先分词暂存，删除只做标记，save 时用向量化操作一次性合并，不重新分词旧文档。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.term_ptr = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.doc_ids: List[str] = []
+        self._alive = np.ones(0, dtype=bool)
+        self._position = {}
+        self._pending: List[Tuple[str, Counter]] = []
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, name))
+                   for name in (VOCAB_FILE, TERM_PTR_FILE, DOCS_FILE, TFS_FILE, DOC_LEN_FILE, DOC_IDS_FILE))
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        index = cls()
+        with open(os.path.join(path, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            index.vocab = {term: term_id for term_id, term in enumerate(json.load(f))}
+        index.term_ptr = np.load(os.path.join(path, TERM_PTR_FILE), mmap_mode='r')
+        index.docs = np.load(os.path.join(path, DOCS_FILE), mmap_mode='r')
+        index.tfs = np.load(os.path.join(path, TFS_FILE), mmap_mode='r')
+        index.doc_len = np.load(os.path.join(path, DOC_LEN_FILE), mmap_mode='r')
+        index.doc_ids = [doc_id.decode('utf-8') for doc_id in np.load(os.path.join(path, DOC_IDS_FILE))]
+        index._alive = np.ones(len(index.doc_ids), dtype=bool)
+        index._position = {doc_id: i for i, doc_id in enumerate(index.doc_ids)}
+        return index
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """分词并暂存一个块，save 时合并进倒排表"""
+        self._pending.append((chunk_id, Counter(tokenize(text))))
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        pending_ids = set()
+        for chunk_id in chunk_ids:
+            position = self._position.get(chunk_id)
+            if position is not None:
+                self._alive[position] = False
+            else:
+                pending_ids.add(chunk_id)
+        if pending_ids:
+            self._pending = [item for item in self._pending if item[0] not in pending_ids]
+
+    def merge(self) -> None:
+        """把暂存的新增块和删除标记合并进倒排表"""
+        if not self._pending and self._alive.all():
+            return
+        num_terms = len(self.term_ptr) - 1
+        keep_docs = np.flatnonzero(self._alive)
+        remap = np.cumsum(self._alive) - 1
+        post_terms = np.repeat(np.arange(num_terms, dtype=np.int64), np.diff(self.term_ptr))
+        keep = self._alive[self.docs] if len(self.docs) else np.zeros(0, dtype=bool)
+        terms_parts = [post_terms[keep]]
+        docs_parts = [remap[self.docs[keep]].astype(np.int32)]
+        tfs_parts = [np.asarray(self.tfs)[keep]]
+
+        doc_ids = [self.doc_ids[i] for i in keep_docs]
+        doc_len = [np.asarray(self.doc_len)[keep_docs]]
+        for chunk_id, counts in self._pending:
+            doc = len(doc_ids)
+            doc_ids.append(chunk_id)
+            term_ids = [self.vocab.setdefault(term, len(self.vocab)) for term in counts]
+            terms_parts.append(np.array(term_ids, dtype=np.int64))
+            docs_parts.append(np.full(len(term_ids), doc, dtype=np.int32))
+            tfs_parts.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            doc_len.append(np.array([sum(counts.values())], dtype=np.float32))
+
+        terms = np.concatenate(terms_parts)
+        docs = np.concatenate(docs_parts)
+        order = np.lexsort((docs, terms))
+        self.docs = docs[order]
+        self.tfs = np.concatenate(tfs_parts)[order]
+        self.term_ptr = np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=len(self.vocab))))).astype(np.int64)
+        self.doc_len = np.concatenate(doc_len).astype(np.float32)
+        self.doc_ids = doc_ids
+        self._alive = np.ones(len(doc_ids), dtype=bool)
+        self._position = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self._pending = []
+
+    def save(self, path: str) -> None:
+        self.merge()
+        os.makedirs(path, exist_ok=True)
+        terms = [None] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        with open(os.path.join(path, VOCAB_FILE + ".tmp"), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        arrays = {
+            TERM_PTR_FILE: np.asarray(self.term_ptr),
+            DOCS_FILE: np.asarray(self.docs),
+            TFS_FILE: np.asarray(self.tfs),
+            DOC_LEN_FILE: np.asarray(self.doc_len),
+            DOC_IDS_FILE: np.array([doc_id.encode('utf-8') for doc_id in self.doc_ids], dtype=bytes),
+        }
+        for name, array in arrays.items():
+            with open(os.path.join(path, name + ".tmp"), 'wb') as f:
+                np.save(f, array)
+        for name in (VOCAB_FILE, *arrays):
+            os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+    def search(self, query: str, k: int = 20, doc_mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 检索，返回按分数降序的 (块ID, 分数)
+
+        :param doc_mask: 按本索引文档顺序的布尔掩码，只在为 True 的文档中检索
+        """
+        num_docs = len(self.doc_ids)
+        if num_docs == 0:
+            return []
+        term_ids = sorted({self.vocab[term] for term in tokenize(query) if term in self.vocab})
+        if not term_ids:
+            return []
+        avgdl = float(np.mean(self.doc_len)) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len) / avgdl)
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = int(self.term_ptr[term_id]), int(self.term_ptr[term_id + 1])
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end]
+            df = end - start
+            idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            # 同一个词在一个文档中只出现一次，可以直接按下标累加
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        scores[~self._alive] = 0
+        if doc_mask is not None:
+            scores[~doc_mask] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.doc_ids[i], float(scores[i])) for i in candidates]
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self._pending)
+
@@ -0,0 +1,52 @@
+"""
+文档加载器 - 递归、流式地遍历知识库目录
+"""
+
+import os
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, Sequence
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+
+DEFAULT_INCLUDE = ("*.txt", "*.md")
+
+
+def parse_patterns(value: str) -> list:
+    """把逗号分隔的配置值解析为 glob 列表"""
+    return [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+
+
+def _matches(rel_path: str, patterns: Sequence[str]) -> bool:
+    """相对路径或文件名匹配任一 glob 即视为命中"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch(rel_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def iter_source_files(root: str, include: Sequence[str] = DEFAULT_INCLUDE,
+                      exclude: Sequence[str] = (), recursive: bool = True) -> Iterator[str]:
+    """
+    递归产出知识库中的源文件路径（按路径排序，结果稳定）
+
+    :param root: 知识库目录或单个文件
+    :param include: 需要包含的 glob，匹配相对路径或文件名
+    :param exclude: 需要排除的 glob，命中的目录整体跳过
+    :param recursive: 为 False 时只产出 root 目录下的文件，不进入子目录
+    """
+    if not os.path.isdir(root):
+        yield root
+        return
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+        dirnames[:] = sorted(d for d in dirnames if recursive and not _matches(rel_dir + d, exclude))
+        for fname in sorted(filenames):
+            rel_path = rel_dir + fname
+            if _matches(rel_path, include) and not _matches(rel_path, exclude):
+                yield os.path.join(dirpath, fname)
+
+
+def iter_documents(paths: Iterable[str], encoding: str = 'utf-8') -> Iterator[Document]:
+    """逐个文件加载文档，任何时刻只持有一个文件的内容"""
+    for fpath in paths:
+        yield from TextLoader(fpath, encoding=encoding).lazy_load()
@@ -0,0 +1,120 @@
+"""
+索引清单 - 记录每个源文件与其向量块的对应关系，用于增量更新
+"""
+
+import os
+import json
+import uuid
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_FILE = "manifest.json"
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """计算文件内容的SHA256"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class IndexManifest:
+    """
+    保存在向量索引旁边的清单文件
+
+    每个条目以相对路径为键，记录 size、mtime、sha256 以及该文件生成的 chunk_ids。
+    version 在索引内容每次变化时更新，供查询缓存判断是否失效；
+    index_spec 记录实际建成的 FAISS 索引规格（训练样本不足时可能退回 Flat），
+    requested_spec 记录建索引时配置的规格，配置变化时才需要重建。
+    digests 暂存 diff 中已计算过的内容哈希（不写入清单），record 时直接使用，避免重复读取文件。
+    """
+
+    def __init__(self, root: str, files: Optional[Dict[str, Dict]] = None, version: Optional[str] = None,
+                 index_spec: str = "Flat", requested_spec: Optional[str] = None):
+        self.root = root
+        self.files: Dict[str, Dict] = files or {}
+        self.version = version or uuid.uuid4().hex
+        self.index_spec = index_spec
+        self.requested_spec = requested_spec or index_spec
+        self.digests: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, vector_store_path: str, root: str) -> Optional["IndexManifest"]:
+        """从向量存储目录加载清单，不存在时返回 None"""
+        path = os.path.join(vector_store_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(root, data.get("files", {}), data.get("version"), data.get("index_spec", "Flat"),
+                   data.get("requested_spec"))
+
+    def save(self, vector_store_path: str) -> None:
+        """写入清单（先写临时文件再替换，避免半写状态）"""
+        os.makedirs(vector_store_path, exist_ok=True)
+        path = os.path.join(vector_store_path, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.version, "index_spec": self.index_spec,
+                       "requested_spec": self.requested_spec, "files": self.files},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def bump_version(self) -> None:
+        """索引内容发生变化后调用"""
+        self.version = uuid.uuid4().hex
+
+    def key_for(self, path: str) -> str:
+        """源文件在清单中的键（相对于知识库根目录）"""
+        if os.path.isdir(self.root):
+            return os.path.relpath(path, self.root).replace(os.sep, '/')
+        return os.path.basename(path)
+
+    def record(self, path: str, chunk_ids: List[str], sha256: Optional[str] = None) -> None:
+        """记录（或覆盖）一个源文件的条目"""
+        stat = os.stat(path)
+        self.files[self.key_for(path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256 or hash_file(path),
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def diff(self, paths: Iterable[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        对比当前源文件与清单
+
+        :return: (新增文件路径, 已修改文件路径, 已删除条目的键)
+        """
+        added, changed = [], []
+        seen = set()
+        for path in paths:
+            key = self.key_for(path)
+            seen.add(key)
+            entry = self.files.get(key)
+            if entry is None:
+                added.append(path)
+                continue
+            stat = os.stat(path)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                continue
+            # size/mtime 变化时再比较内容哈希，仅 touch 过的文件只更新时间戳
+            if stat.st_size == entry["size"]:
+                digest = hash_file(path)
+                if digest == entry["sha256"]:
+                    entry["mtime"] = stat.st_mtime
+                    continue
+                self.digests[path] = digest
+            changed.append(path)
+        removed = [key for key in self.files if key not in seen]
+        return added, changed, removed
+
+    def chunk_ids(self, key: str) -> List[str]:
+        """返回某个条目对应的 chunk_ids"""
+        return self.files.get(key, {}).get("chunk_ids", [])
+
+    def remove(self, key: str) -> None:
+        """删除条目"""
+        self.files.pop(key, None)
@@ -0,0 +1,78 @@
+"""
+查询结果缓存 - LRU + TTL，索引版本变化时自动失效
+"""
+
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、统一小写、折叠空白"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class QueryCache:
+    """
+    (规范化查询, k, 其他参数) -> 检索结果 的缓存
+
+    每次读写都带上当前索引版本，版本与缓存内记录的不一致时整体清空。
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version: Optional[str]) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, query: str, k: int, version: Optional[str], *extra: Hashable) -> Optional[Any]:
+        """命中返回缓存值，否则返回 None"""
+        if self.max_entries <= 0:
+            return None
+        key = (normalize_query(query), k) + extra
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, k: int, version: Optional[str], value: Any, *extra: Hashable) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (normalize_query(query), k) + extra
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中计数及当前大小"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,69 @@
+"""
+交叉编码器重排 - 在时间预算内对候选块重新打分
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Sequence, Tuple
+from langchain_core.documents import Document
+
+
+class CrossEncoderReranker:
+    """
+    用本地交叉编码器对 (查询, 块) 打分，一次前向处理全部候选
+
+    超过 timeout_ms 仍未完成时放弃重排，按原顺序返回；打分在独立线程中进行，
+    超时的那次计算会在后台跑完，不会阻塞调用方。后台计算（或模型加载）尚未结束时
+    新的查询直接按原顺序返回，不在其后排队，避免一次慢查询拖累后续多次查询。
+    模型在第一次使用时才加载。
+    """
+
+    def __init__(self, model_name: str, timeout_ms: int = 300):
+        self.model_name = model_name
+        self.timeout_ms = timeout_ms
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        # 最近一次提交给工作线程的任务（预加载或打分）
+        self._pending = None
+        self._submit_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def warm_up(self) -> None:
+        """在后台线程中预加载模型"""
+        with self._submit_lock:
+            self._pending = self._executor.submit(self._get_model)
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        model = self._get_model()
+        return model.predict([(query, text) for text in texts], batch_size=len(texts)).tolist()
+
+    def rerank(self, query: str, docs: Sequence[Document], k: int) -> Tuple[List[Document], bool]:
+        """
+        重排候选并取前 k 个
+
+        :return: (文档列表, 是否完成了重排)；超时或出错时按原顺序截断
+        """
+        if len(docs) <= 1:
+            return list(docs[:k]), True
+        with self._submit_lock:
+            if self._pending is not None and not self._pending.done():
+                print("Reranker is still busy with a previous query, using retrieval order.")
+                return list(docs[:k]), False
+            future = self._pending = self._executor.submit(self._score, query, [doc.page_content for doc in docs])
+        try:
+            scores = future.result(timeout=self.timeout_ms / 1000)
+        except TimeoutError:
+            print(f"Rerank exceeded {self.timeout_ms} ms, using retrieval order.")
+            return list(docs[:k]), False
+        except Exception as e:
+            print(f"Rerank failed, using retrieval order: {e}")
+            return list(docs[:k]), False
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:k]], True
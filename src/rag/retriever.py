@@ -1,6 +1,22 @@
 from .knowledge_base import KnowledgeBase
+from .attribute_index import filter_key as attribute_filter_key
+from .context_builder import ContextBuilder
+from .query_cache import QueryCache
+from .reranker import CrossEncoderReranker
+from .sharded_knowledge_base import ShardedKnowledgeBase
+from ..config.settings import Settings
+from typing import Dict, List, Optional, Sequence
+from langchain_core.documents import Document
 import os
 
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank)，rank 从 1 开始"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
 class Retriever:
     """
     从知识库中检索相关文档
@@ -9,20 +25,109 @@ class Retriever:
         if file_path is None:
             # 默认使用 faiss_index 目录
             file_path = os.path.join(os.path.dirname(__file__), '..', '..', 'faiss_index')
-        self.knowledge_base = KnowledgeBase(file_path=file_path)
-        self.retriever = self.knowledge_base.as_retriever()
+        self.settings = Settings()
+        if self.settings.knowledge_sharded:
+            self.knowledge_base = ShardedKnowledgeBase(file_path=file_path)
+        else:
+            self.knowledge_base = KnowledgeBase(file_path=file_path)
+        self.cache = QueryCache(self.settings.query_cache_size, self.settings.query_cache_ttl)
+        self.reranker = None
+        if self.settings.rerank_enabled:
+            self.reranker = CrossEncoderReranker(self.settings.rerank_model, self.settings.rerank_timeout_ms)
+            self.reranker.warm_up()
+        self.context_builder = ContextBuilder(
+            self.settings.context_token_budget(),
+            dedupe_threshold=self.settings.context_dedupe_threshold,
+        )
+
+    def retrieve(self, query_text: str, k: int = 4, filters: Optional[Dict] = None) -> List[Document]:
+        """
+        检索与查询最相关的 k 个文档块，结果按 (规范化查询, k, 过滤条件) 缓存
+
+        :param filters: 元数据过滤条件，如 {"space": "QA", "updated": ("2024-01-01", None)}，
+                        在检索过程中生效而不是事后过滤
+        """
+        return self.retrieve_batch([query_text], k, filters)[0]
+
+    def retrieve_batch(self, query_texts: Sequence[str], k: int = 4,
+                       filters: Optional[Dict] = None) -> List[List[Document]]:
+        """
+        批量检索：未命中缓存的查询一次前向计算全部嵌入，再做一次 FAISS 批量检索
+
+        :return: 与 query_texts 一一对应的文档列表
+        """
+        version = self.knowledge_base.index_version
+        filter_key = attribute_filter_key(filters)
+        results = [self.cache.get(query_text, k, version, filter_key) for query_text in query_texts]
+        pending = list(dict.fromkeys(query_text for query_text, docs in zip(query_texts, results) if docs is None))
+        if not pending:
+            return results
+
+        # 启用重排时先多取一些候选，再由交叉编码器挑出前 k 个
+        fetch_k = max(k, self.settings.rerank_candidates) if self.reranker else k
+        hybrid = self.settings.retrieval_mode == "hybrid"
+        dense_k = max(fetch_k, self.settings.hybrid_candidates) if hybrid else fetch_k
+        vectors = self.knowledge_base.embed_queries(pending)
+        dense_hits = self.knowledge_base.search_by_vectors(vectors, dense_k, filters)
+
+        retrieved = {}
+        for query_text, hits in zip(pending, dense_hits):
+            docs = [doc for doc, _ in hits]
+            if hybrid:
+                docs = self._fuse(query_text, docs, fetch_k, dense_k, filters)
+            reranked = True
+            if self.reranker:
+                docs, reranked = self.reranker.rerank(query_text, docs, k)
+            # 重排超时的降级结果不缓存，下次仍尝试重排
+            if reranked:
+                self.cache.put(query_text, k, version, docs, filter_key)
+            retrieved[query_text] = docs
+        return [docs if docs is not None else retrieved[query_text]
+                for query_text, docs in zip(query_texts, results)]
+
+    def _fuse(self, query_text: str, dense_docs: List[Document], k: int, candidates: int,
+              filters: Optional[Dict] = None) -> List[Document]:
+        """把向量检索的候选与 BM25 候选用 RRF 融合后取前 k 个"""
+        lexical_hits = self.knowledge_base.lexical_search(query_text, candidates, filters)
 
-    def query(self, query_text: str) -> str:
+        by_id = {doc.id: doc for doc in dense_docs}
+        fused = reciprocal_rank_fusion(
+            [[doc.id for doc in dense_docs], [chunk_id for chunk_id, _ in lexical_hits]],
+            k=self.settings.rrf_k,
+        )
+        docs = []
+        for chunk_id in fused:
+            doc = by_id.get(chunk_id) or self.knowledge_base.get_document(chunk_id)
+            if doc is not None:
+                docs.append(doc)
+            if len(docs) == k:
+                break
+        return docs
+
+    def query(self, query_text: str, k: int = 4, token_budget: int = None, filters: Optional[Dict] = None) -> str:
         """
-        根据查询文本检索相关文档，并格式化为字符串
+        根据查询文本检索相关文档，去重合并后按 token 预算格式化为字符串
         """
-        docs = self.retriever.invoke(query_text)
-        context = "\n\n".join([doc.page_content for doc in docs])
-        return context
+        docs = self.retrieve(query_text, k, filters)
+        return self.context_builder.build(docs, token_budget)
+
+    def query_batch(self, query_texts: Sequence[str], k: int = 4, token_budget: int = None,
+                    filters: Optional[Dict] = None) -> List[str]:
+        """批量版 query，返回与 query_texts 一一对应的上下文字符串"""
+        return [self.context_builder.build(docs, token_budget)
+                for docs in self.retrieve_batch(query_texts, k, filters)]
+
+    def refresh(self) -> Dict[str, int]:
+        """增量更新知识库；索引有变化时缓存随版本号自动失效"""
+        return self.knowledge_base.refresh()
+
+    def cache_stats(self) -> Dict:
+        """查询缓存的命中统计"""
+        return self.cache.stats()
 
 if __name__ == '__main__':
     retriever = Retriever()
     context = retriever.query("如何测试用户登录？")
     print("----- Retrieved Context -----")
     print(context)
-    print("-----------------------------") 
\ No newline at end of file
+    print("-----------------------------")
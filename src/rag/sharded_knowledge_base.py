@@ -0,0 +1,161 @@
+"""
+分片知识库 - 每个子目录（如 Confluence 空间、Jira 项目）一个独立索引，检索时并行扇出
+"""
+
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from ..config.settings import Settings
+from .embedding_cache import embed_queries
+from .knowledge_base import EmptyKnowledgeBaseError, KnowledgeBase, get_knowledge_embeddings
+from .loader import iter_source_files, parse_patterns
+
+# 知识库根目录下的文件组成的默认分片
+ROOT_SHARD = "(root)"
+
+
+def has_root_files(file_path: str, settings: Settings) -> bool:
+    """知识库根目录下（不含子目录）是否有符合包含/排除规则的源文件"""
+    files = iter_source_files(
+        file_path,
+        include=parse_patterns(settings.knowledge_include),
+        exclude=parse_patterns(settings.knowledge_exclude),
+        recursive=False,
+    )
+    return next(files, None) is not None
+
+
+def discover_shards(file_path: str, settings: Optional[Settings] = None) -> List[str]:
+    """
+    知识库目录下的每个（非隐藏）子目录是一个分片；根目录下直接存放的文件组成默认分片 ROOT_SHARD
+    """
+    shards = sorted(name for name in os.listdir(file_path)
+                    if not name.startswith('.') and os.path.isdir(os.path.join(file_path, name)))
+    if has_root_files(file_path, settings or Settings()):
+        shards.insert(0, ROOT_SHARD)
+    return shards
+
+
+class ShardedKnowledgeBase:
+    """
+    由多个 KnowledgeBase 组成的知识库
+
+    分片 <name> 的源文件位于 file_path/<name>，索引保存在 vector_store_path/<name>，
+    可以单独刷新或重建而不影响其他分片。根目录下直接存放的文件组成默认分片 ROOT_SHARD，
+    索引保存在 vector_store_path 本身（与不分片时的位置相同）。没有文档的分片打印警告后跳过。
+    检索时查询只嵌入一次，
+    各分片在线程池中并行检索（FAISS 检索期间释放 GIL），再按距离/分数合并 top-k。
+    对外提供与 KnowledgeBase 相同的检索接口，Retriever 无需区分两者。
+    """
+
+    def __init__(self, file_path: str, vector_store_path: str = "faiss_index",
+                 shards: Optional[Sequence[str]] = None, index_spec: str = None, load_mode: str = None):
+        self.file_path = file_path
+        self.vector_store_path = vector_store_path
+        self.settings = Settings()
+        if shards is None:
+            configured = self.settings.knowledge_shards.strip()
+            if configured in ("", "auto"):
+                shards = discover_shards(file_path, self.settings)
+            else:
+                shards = parse_patterns(configured)
+                if ROOT_SHARD not in shards and has_root_files(file_path, self.settings):
+                    print(f"Files at the root of {file_path} are not indexed; "
+                          f"add '{ROOT_SHARD}' to KNOWLEDGE_SHARDS to include them.")
+        if not shards:
+            raise ValueError(f"知识库目录下没有可用的分片: {file_path}")
+        self.shards: Dict[str, KnowledgeBase] = {}
+        # 各分片共用同一个嵌入模型，避免重复加载
+        self.embeddings = get_knowledge_embeddings(self.settings)
+        for name in shards:
+            print(f"Loading shard '{name}'...")
+            root = name == ROOT_SHARD
+            try:
+                shard = KnowledgeBase(
+                    file_path=file_path if root else os.path.join(file_path, name),
+                    vector_store_path=vector_store_path if root else os.path.join(vector_store_path, name),
+                    index_spec=index_spec,
+                    load_mode=load_mode,
+                    embeddings=self.embeddings,
+                    recursive=not root,
+                )
+            except EmptyKnowledgeBaseError:
+                print(f"Shard '{name}' has no documents, skipping it.")
+                continue
+            self.shards[name] = shard
+        if not self.shards:
+            raise EmptyKnowledgeBaseError(f"知识库的所有分片都没有可索引的文档: {file_path}")
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.settings.shard_search_workers, len(self.shards))),
+            thread_name_prefix="shard-search",
+        )
+
+    def _select(self, shards: Optional[Sequence[str]]) -> List[KnowledgeBase]:
+        if shards is None:
+            return list(self.shards.values())
+        unknown = set(shards) - set(self.shards)
+        if unknown:
+            raise ValueError(f"未知的分片: {sorted(unknown)}")
+        return [self.shards[name] for name in shards]
+
+    def _fan_out(self, shards: List[KnowledgeBase], fn) -> list:
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._executor.map(fn, shards))
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return np.array(embed_queries(self.embeddings, texts), dtype=np.float32).reshape(len(texts), -1)
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int = 4, filters: Optional[Dict] = None,
+                          shards: Optional[Sequence[str]] = None) -> List[List[Tuple[Document, float]]]:
+        """各分片并行做一次批量检索，每个查询按 L2 距离合并 top-k"""
+        results = self._fan_out(self._select(shards), lambda shard: shard.search_by_vectors(vectors, k, filters))
+        merged = []
+        for row in range(len(vectors)):
+            hits = [hit for shard_hits in results for hit in shard_hits[row]]
+            hits.sort(key=lambda hit: hit[1])
+            merged.append(hits[:k])
+        return merged
+
+    def search_by_vector(self, embedding: List[float], k: int = 4, filters: Optional[Dict] = None,
+                         shards: Optional[Sequence[str]] = None) -> List[Tuple[Document, float]]:
+        """各分片并行检索 top-k，按 L2 距离合并"""
+        return self.search_by_vectors(np.array([embedding], dtype=np.float32), k, filters, shards)[0]
+
+    def search(self, query_text: str, k: int = 4, filters: Optional[Dict] = None,
+               shards: Optional[Sequence[str]] = None) -> List[Document]:
+        embedding = self.embeddings.embed_query(query_text)
+        return [doc for doc, _ in self.search_by_vector(embedding, k, filters, shards)]
+
+    def lexical_search(self, query_text: str, k: int = 20, filters: Optional[Dict] = None,
+                       shards: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """各分片并行 BM25 检索，按分数合并（各分片的 IDF 独立统计，分数只作近似比较）"""
+        results = self._fan_out(self._select(shards), lambda shard: shard.lexical_search(query_text, k, filters))
+        merged = [hit for shard_hits in results for hit in shard_hits]
+        merged.sort(key=lambda hit: hit[1], reverse=True)
+        return merged[:k]
+
+    def get_document(self, chunk_id: str) -> Optional[Document]:
+        for shard in self.shards.values():
+            doc = shard.get_document(chunk_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def refresh(self, shard: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """增量更新一个或全部分片，返回各分片的变更统计"""
+        names = [shard] if shard else list(self.shards)
+        return {name: self._select([name])[0].refresh() for name in names}
+
+    def rebuild(self, shard: str) -> None:
+        """只重建指定分片，其他分片保持不变"""
+        self._select([shard])[0].rebuild()
+
+    @property
+    def index_version(self) -> str:
+        """各分片版本的组合，任一分片变化即不同"""
+        combined = "|".join(f"{name}={kb.index_version}" for name, kb in sorted(self.shards.items()))
+        return hashlib.sha256(combined.encode('utf-8')).hexdigest()[:16]
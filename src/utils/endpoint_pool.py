@@ -0,0 +1,160 @@
+"""
+Ollama 节点池 - 多个 Ollama 地址之间按在途请求数最少路由，健康检查失败或熔断的节点自动摘除
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import requests
+from .resilience import CircuitBreaker, get_circuit_breaker
+
+
+def parse_endpoints(settings) -> List[str]:
+    """OLLAMA_BASE_URLS（逗号分隔）优先，未配置时只使用 OLLAMA_BASE_URL"""
+    urls = [url.strip().rstrip("/") for url in settings.ollama_base_urls.split(",") if url.strip()]
+    return list(dict.fromkeys(urls)) or [settings.ollama_base_url.rstrip("/")]
+
+
+class OllamaEndpoint:
+    """一个 Ollama 节点：地址、熔断器、在途请求数与最近一次健康检查结果"""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self.outstanding = 0
+        self.healthy = True
+        self.last_error = ""
+        self.checked_at = 0.0
+        self.requests = 0
+        self.failures = 0
+
+
+class EndpointPool:
+    """
+    Ollama 节点池
+
+    - 路由：在可用节点中选在途请求最少的一个，数量相同时轮流选择；
+    - 被动摘除：节点的熔断器打开后不再分配请求，到期后由一次真实请求探测；
+    - 主动检查：后台线程每 health_interval 秒请求各节点的 /api/tags（与 check_model_availability 相同），
+      无法访问或没有所需模型的节点标记为不健康，恢复后重新加入并关闭其熔断器。
+
+    所有节点都不可用时仍会返回其中一个，由熔断器抛出 CircuitOpenError 或由请求本身报错。
+    """
+
+    def __init__(self, urls: Sequence[str], model: str, settings, health_interval: float = 15.0):
+        self.model = model
+        self.endpoints = [OllamaEndpoint(url, get_circuit_breaker(url, settings)) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._session = requests.Session()
+        self._health_thread = None
+        if len(self.endpoints) > 1 and health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._health_thread.start()
+
+    def acquire(self, exclude: Iterable[str] = ()) -> OllamaEndpoint:
+        """选出下一个请求使用的节点；exclude 中的节点（本次请求已失败过的）仅在别无选择时使用"""
+        excluded = set(exclude)
+        with self._lock:
+            available = [endpoint for endpoint in self.endpoints
+                         if endpoint.healthy and endpoint.breaker.available()]
+            candidates = [endpoint for endpoint in available if endpoint.url not in excluded] or available
+            if not candidates:
+                # 全部不可用：交给熔断器报错，或在健康信息过时的情况下直接尝试
+                candidates = [endpoint for endpoint in self.endpoints if endpoint.url not in excluded] or self.endpoints
+            self._turn += 1
+            offset = self._turn % len(candidates)
+            rotated = candidates[offset:] + candidates[:offset]
+            return min(rotated, key=lambda endpoint: endpoint.outstanding)
+
+    def has_alternative(self, exclude: Iterable[str]) -> bool:
+        """除 exclude 外是否还有可用节点（有则重试时不必退避等待）"""
+        excluded = set(exclude)
+        with self._lock:
+            return any(endpoint.url not in excluded and endpoint.healthy and endpoint.breaker.available()
+                       for endpoint in self.endpoints)
+
+    @contextmanager
+    def lease(self, endpoint: OllamaEndpoint) -> Iterator[OllamaEndpoint]:
+        """请求期间计入节点的在途请求数"""
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        try:
+            yield endpoint
+        except Exception:
+            with self._lock:
+                endpoint.failures += 1
+            raise
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+
+    def check_health(self, timeout: float = 5.0) -> Dict[str, bool]:
+        """检查所有节点，返回 {地址: 是否健康}"""
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                response = self._session.get(f"{endpoint.url}/api/tags", timeout=timeout)
+                if response.status_code != 200:
+                    error = f"状态码 {response.status_code}"
+                else:
+                    models = response.json().get("models", [])
+                    found = any(model.get("name") == self.model for model in models)
+                    error = "" if found else f"没有模型 {self.model}"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            with self._lock:
+                changed = endpoint.healthy != (not error)
+                endpoint.healthy = not error
+                endpoint.last_error = error
+                endpoint.checked_at = time.time()
+            if not error and endpoint.breaker.state != "closed":
+                # 节点可达且有模型：提前结束熔断
+                endpoint.breaker.record()
+            if changed:
+                print(f"Ollama endpoint {endpoint.url} ejected: {error}" if error
+                      else f"Ollama endpoint {endpoint.url} is healthy again.")
+            results[endpoint.url] = not error
+        return results
+
+    def _health_loop(self) -> None:
+        while True:
+            try:
+                self.check_health()
+            except Exception as e:
+                print(f"Ollama health check failed: {e}")
+            time.sleep(self.health_interval)
+
+    def snapshot(self) -> List[Dict]:
+        """各节点的健康状态、熔断状态与请求计数"""
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.healthy,
+                    "last_error": endpoint.last_error,
+                    "breaker": endpoint.breaker.state,
+                    "outstanding": endpoint.outstanding,
+                    "requests": endpoint.requests,
+                    "failures": endpoint.failures,
+                }
+                for endpoint in self.endpoints
+            ]
+
+
+_pools: Dict[tuple, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(settings, model: Optional[str] = None) -> EndpointPool:
+    """按 (节点列表, 模型) 共享的节点池，进程内所有客户端共用在途计数和健康检查"""
+    urls = parse_endpoints(settings)
+    model = model or settings.llama_model
+    key = (tuple(urls), model)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = EndpointPool(urls, model, settings, settings.ollama_health_interval)
+        return _pools[key]
@@ -66,6 +66,7 @@ class ConfluencePageFetcher:
         meta = {
             'title': page['title'],
             'id': page['id'],
+            'space': self.space_key,
             'parent_id': page.get('parent_id'),
             'author': page.get('author'),
             'created': page.get('created'),
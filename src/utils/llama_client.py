@@ -2,84 +2,668 @@
 LLaMA客户端 - 与Ollama API通信
 """
 
+import asyncio
+import itertools
+import threading
+import time
 import requests
 import json
-from typing import Dict, Optional
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+from requests.adapters import HTTPAdapter
 from ..config.settings import Settings
+from .endpoint_pool import get_endpoint_pool
+from .resilience import (
+    LlamaConnectionError,
+    LlamaError,
+    LlamaHTTPError,
+    LlamaResponseError,
+    LlamaTimeoutError,
+    LlamaUnexpectedError,
+    backoff_delay,
+)
+from .response_cache import CacheHint, ResponseCache, request_key
+from .scheduler import PRIORITY_INTERACTIVE, get_scheduler
+
+T = TypeVar("T")
+
+# Ollama 在最后一个响应中返回的统计字段
+STATS_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+
+
+class ChatStream:
+    """
+    流式生成的结果：迭代得到逐段文本，迭代结束后 stats 为本次生成的统计信息
+
+    统计信息随结果返回而不是保存在客户端上，多个会话共用同一个客户端时互不影响。
+    命中响应缓存时 stats 带 cached 标记；出错或中途停止迭代时 stats 可能为空。
+    """
+
+    def __init__(self, chunks: Iterator[str], stats: Dict):
+        self._chunks = chunks
+        self.stats = stats
+
+    def __iter__(self) -> Iterator[str]:
+        return self._chunks
+
+    def close(self) -> None:
+        """不再需要剩余内容时调用：停止读取 Ollama 的响应并释放调度槽位"""
+        self._chunks.close()
+
+
+class AsyncChatStream:
+    """ChatStream 的异步版本，用 async for 迭代"""
+
+    def __init__(self, chunks: AsyncIterator[str], stats: Dict):
+        self._chunks = chunks
+        self.stats = stats
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._chunks
+
+
+def error_text(error: Exception) -> str:
+    """generate_content / stream_content 对外返回的错误说明文本"""
+    if isinstance(error, LlamaHTTPError):
+        return str(error)
+    return f"生成内容时出现错误：{str(error) or type(error).__name__}"
+
+
+@contextmanager
+def _recorded(endpoint):
+    """
+    把在 endpoint 上执行的一次请求的结果记录到该节点的熔断器
+
+    LlamaError 原样记录并带上节点地址；其他异常转换为可重试的 LlamaUnexpectedError 后记录并抛出，
+    不会被当作成功；调用方放弃请求（GeneratorExit、任务取消）时不计成功或失败。
+    """
+    try:
+        yield
+    except LlamaError as e:
+        e.endpoint = endpoint.url
+        endpoint.breaker.record(e)
+        raise
+    except Exception as e:
+        error = LlamaUnexpectedError(f"调用 Ollama 时出现异常：{type(e).__name__}: {e}")
+        error.endpoint = endpoint.url
+        endpoint.breaker.record(error)
+        raise error from e
+    except BaseException:
+        endpoint.breaker.release()
+        raise
+    else:
+        endpoint.breaker.record(None)
+
+
+@contextmanager
+def _translate_errors():
+    """把 requests 的异常转换为 LlamaError"""
+    try:
+        yield
+    except (requests.exceptions.JSONDecodeError, json.JSONDecodeError) as e:
+        # requests 的 JSONDecodeError 同时继承 RequestException，必须先于下面的连接错误处理：
+        # 响应已完整收到只是内容无法解析，重试无意义，也不应计入熔断
+        raise LlamaResponseError(f"无法解析 Ollama 的响应：{e}") from e
+    except requests.exceptions.ConnectTimeout as e:
+        raise LlamaConnectionError(f"连接 Ollama 超时：{e}") from e
+    except requests.exceptions.Timeout as e:
+        raise LlamaTimeoutError(f"等待 Ollama 响应超时：{e}") from e
+    except requests.exceptions.ConnectionError as e:
+        raise LlamaConnectionError(f"无法连接 Ollama：{e}") from e
+    except requests.exceptions.RequestException as e:
+        # 如读取过程中连接断开（ChunkedEncodingError）
+        raise LlamaConnectionError(f"与 Ollama 的连接中断：{e}") from e
+    except ValueError as e:
+        raise LlamaResponseError(f"无法解析 Ollama 的响应：{e}") from e
+
+
+def _check_status(status_code: int, body: str) -> None:
+    if status_code == 200:
+        return
+    try:
+        detail = json.loads(body).get("error", "")
+    except (ValueError, AttributeError):
+        detail = ""
+    raise LlamaHTTPError(status_code, detail)
+
+
+class PromptEvalMeter:
+    """
+    累计 Ollama 的 prompt 评估统计，用于衡量前缀 KV 缓存的效果
+
+    Ollama 复用缓存的前缀时，prompt_eval_count 只包含新计算的 token。以同一系统提示词下
+    见过的最大 prompt_eval_count（通常是冷启动时的完整评估）为基准，每次调用少评估的 token 数
+    乘以平均每 token 评估耗时，即为省下时间的估算值（用户提示词长度不同会带来一定误差）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peak: Dict[str, int] = {}
+        self.calls = 0
+        self.prompt_eval_count = 0
+        self.prompt_eval_duration = 0
+        self.total_duration = 0
+        self.saved_tokens = 0
+
+    def record(self, system_prompt: str, stats: Dict) -> None:
+        count = stats.get("prompt_eval_count")
+        if count is None:
+            return
+        with self._lock:
+            self.calls += 1
+            self.prompt_eval_count += count
+            self.prompt_eval_duration += stats.get("prompt_eval_duration", 0)
+            self.total_duration += stats.get("total_duration", 0)
+            peak = self._peak.get(system_prompt, 0)
+            if count > peak:
+                self._peak[system_prompt] = count
+            else:
+                self.saved_tokens += peak - count
+
+    def report(self) -> Dict:
+        """累计的 prompt 评估 token 数与耗时（秒）、占总耗时的比例，以及估算省下的时间"""
+        with self._lock:
+            seconds_per_token = (self.prompt_eval_duration / 1e9 / self.prompt_eval_count
+                                 if self.prompt_eval_count else 0.0)
+            return {
+                "calls": self.calls,
+                "prompt_eval_tokens": self.prompt_eval_count,
+                "prompt_eval_seconds": self.prompt_eval_duration / 1e9,
+                "prompt_eval_share": self.prompt_eval_duration / self.total_duration if self.total_duration else 0.0,
+                "saved_tokens_estimate": self.saved_tokens,
+                "saved_seconds_estimate": self.saved_tokens * seconds_per_token,
+            }
 
 class LlamaClient:
     """LLaMA模型客户端，使用Ollama API"""
     
     def __init__(self):
         self.settings = Settings()
-        self.base_url = self.settings.ollama_base_url
         self.model = self.settings.llama_model
+        # Ollama 节点池（OLLAMA_BASE_URLS 配置多个地址时按在途请求数最少路由）；base_url 为第一个节点
+        self.pool = get_endpoint_pool(self.settings, self.model)
+        self.base_url = self.pool.endpoints[0].url
         self.temperature = self.settings.model_temperature
         self.max_tokens = self.settings.max_tokens
+        # (连接超时, 读超时)，每个请求单独生效
+        self.timeout = (self.settings.ollama_connect_timeout, self.settings.ollama_read_timeout)
+        # 复用 TCP 连接的会话，每个节点的连接池大小与 Ollama 的并行槽位数一致
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.pool.endpoints),
+                              pool_maxsize=max(1, self.settings.ollama_num_parallel))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # 可重试错误（连接失败、超时、5xx）换节点或按指数退避重试；节点连续失败时熔断，快速失败
+        self.max_retries = max(0, self.settings.llm_max_retries)
+        # 所有客户端共用的请求调度器；对话等交互请求默认优先于批量任务
+        self.scheduler = get_scheduler(self.settings)
+        self.priority = PRIORITY_INTERACTIVE
+        # prompt 评估耗时统计（衡量系统提示词前缀缓存的效果）
+        self.prompt_meter = PromptEvalMeter()
+        self.response_cache = self._create_response_cache()
         
-    def generate_content(self, prompt: str, system_prompt: str = None) -> str:
-        """生成内容"""
-        try:
-            # 构建请求数据
-            messages = []
-            
-            if system_prompt:
-                messages.append({
-                    "role": "system",
-                    "content": system_prompt
-                })
-            
+    def _create_response_cache(self) -> Optional[ResponseCache]:
+        if not self.settings.llm_cache_path:
+            return None
+        return ResponseCache(
+            self.settings.llm_cache_path,
+            max_bytes=self.settings.llm_cache_max_mb * 1024 * 1024,
+            ttl_seconds=self.settings.llm_cache_ttl,
+            embed=self._embed_prompt if self.settings.llm_cache_semantic else None,
+            threshold=self.settings.llm_cache_semantic_threshold,
+        )
+    
+    def _embed_prompt(self, text: str) -> List[float]:
+        """语义缓存用的问题向量；与知识库共用进程内的嵌入模型（第一次用到时才加载）"""
+        from ..rag.knowledge_base import get_knowledge_embeddings
+        return get_knowledge_embeddings(self.settings).embed_query(text)
+    
+    def _cache_get(self, data: Dict, use_cache: bool, hint: Optional[CacheHint]) -> Optional[Tuple[str, Dict]]:
+        """命中缓存时返回 (回答, 生成该回答时的统计信息)，统计信息带 cached 标记"""
+        if self.response_cache is None or not use_cache:
+            return None
+        cached = self.response_cache.get(data, hint)
+        if cached is None:
+            return None
+        content, stats = cached
+        return content, dict(stats, cached=True)
+    
+    def _cache_put(self, data: Dict, content: str, stats: Dict, use_cache: bool,
+                   hint: Optional[CacheHint]) -> None:
+        """保存成功的回答（错误说明不缓存）"""
+        if self.response_cache is None or not use_cache:
+            return
+        if content:
+            self.response_cache.put(data, content, stats, hint)
+        
+    def _build_payload(self, prompt: str, system_prompt: Optional[str], stream: bool) -> Dict:
+        """构建 /api/chat 请求数据"""
+        messages = []
+        
+        if system_prompt:
             messages.append({
-                "role": "user", 
-                "content": prompt
+                "role": "system",
+                "content": system_prompt
             })
-            
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": self.temperature,
-                    "num_predict": self.max_tokens
-                }
+        
+        messages.append({
+            "role": "user", 
+            "content": prompt
+        })
+        
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            # 生成结束后模型在内存中保留的时间，避免批量任务的间隙里模型被卸载
+            "keep_alive": self._keep_alive(),
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens,
+                "num_ctx": self.settings.context_window
             }
-            
+        }
+    
+    def _keep_alive(self):
+        """OLLAMA_KEEP_ALIVE 可以是时长（30m）或秒数（-1 表示常驻）"""
+        keep_alive = self.settings.ollama_keep_alive
+        return int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+    
+    def _parse_stats(self, result: Dict, data: Dict) -> Dict:
+        """提取 Ollama 在最后一个响应中返回的统计信息（耗时单位为纳秒），并计入 prompt 评估统计"""
+        stats = {key: result.get(key) for key in STATS_FIELDS if result.get(key) is not None}
+        if stats.get("eval_count") and stats.get("eval_duration"):
+            stats["tokens_per_second"] = stats["eval_count"] / (stats["eval_duration"] / 1e9)
+        messages = data.get("messages", [])
+        system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        self.prompt_meter.record(system_prompt, stats)
+        return stats
+    
+    def _on_endpoint(self, call: Callable[[str], T], failed: set) -> T:
+        """在节点池选出的节点上执行一次请求，并记录到该节点的熔断器和在途计数"""
+        endpoint = self.pool.acquire(failed)
+        endpoint.breaker.before_call()
+        with self.pool.lease(endpoint), _recorded(endpoint):
+            return call(endpoint.url)
+    
+    def _retry_delay(self, attempt: int, failed: set) -> float:
+        """还有没失败过的可用节点时立即换节点重试，否则指数退避"""
+        if self.pool.has_alternative(failed):
+            return 0.0
+        return backoff_delay(attempt, self.settings.llm_retry_backoff, self.settings.llm_retry_backoff_max)
+    
+    def _with_retries(self, attempt_call: Callable[[set], T]) -> T:
+        """
+        执行请求；可重试的错误换节点或退避后重试，熔断打开时直接抛出 CircuitOpenError
+        
+        attempt_call 接收本次请求已失败过的节点集合，重试时优先避开这些节点
+        """
+        failed = set()
+        for attempt in itertools.count():
+            try:
+                return attempt_call(failed)
+            except LlamaError as e:
+                if not e.transient or attempt >= self.max_retries:
+                    raise
+                failed.add(getattr(e, "endpoint", None))
+                delay = self._retry_delay(attempt, failed)
+                print(f"Ollama request failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def generate(self, prompt: str, system_prompt: str = None, use_cache: bool = True,
+                 priority: Optional[int] = None, cache_hint: Optional[CacheHint] = None) -> str:
+        """
+        生成内容，失败时抛出 LlamaError（批量任务应使用这个接口，避免把错误说明当作结果保存）
+        
+        :param use_cache: 是否读写响应缓存（配置了 LLM_CACHE_PATH 时）；False 时强制重新生成。
+                          客户端由多个会话共用，是否使用缓存只能按调用传入
+        :param priority: 调度优先级，默认跟随 self.priority；批量任务传 PRIORITY_BATCH
+        :param cache_hint: 语义缓存的依据（用户问题与检索上下文），提示词中带检索上下文时应当给出
+        """
+        data = self._build_payload(prompt, system_prompt, stream=False)
+        cached = self._cache_get(data, use_cache, cache_hint)
+        if cached is not None:
+            return cached[0]
+        
+        # 经调度器排队；完全相同且仍在进行中的请求共用一次生成；每次重试重新排队，退避期间不占用槽位。
+        # 节点在调度线程中真正发出请求时才选择，在途计数更准确
+        content, stats = self._with_retries(lambda failed: self.scheduler.run(
+            lambda: self._on_endpoint(lambda url: self._chat(data, url), failed),
+            self.priority if priority is None else priority,
+            key=request_key(data),
+        ))
+        self._cache_put(data, content, stats, use_cache, cache_hint)
+        return content
+    
+    def generate_content(self, prompt: str, system_prompt: str = None, use_cache: bool = True,
+                         priority: Optional[int] = None, cache_hint: Optional[CacheHint] = None) -> str:
+        """生成内容；出错时返回错误说明文本（用于直接展示给用户的场景）"""
+        try:
+            return self.generate(prompt, system_prompt, use_cache, priority, cache_hint)
+        except Exception as e:
+            return error_text(e)
+    
+    def _chat(self, data: Dict, base_url: str) -> Tuple[str, Dict]:
+        """向指定节点发送一次非流式请求（在调度线程中执行），返回 (回答, 统计信息)"""
+        with _translate_errors():
             # 发送请求到Ollama API
-            response = requests.post(
-                f"{self.base_url}/api/chat",
+            response = self.session.post(
+                f"{base_url}/api/chat",
                 json=data,
-                timeout=60
+                timeout=self.timeout
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("message", {}).get("content", "")
-            else:
-                return f"API请求失败，状态码: {response.status_code}"
-                
+            _check_status(response.status_code, response.text)
+            result = response.json()
+        
+        if result.get("error"):
+            raise LlamaResponseError(result["error"])
+        return result.get("message", {}).get("content", ""), self._parse_stats(result, data)
+    
+    def stream(self, prompt: str, system_prompt: str = None, use_cache: bool = True,
+               priority: Optional[int] = None, cache_hint: Optional[CacheHint] = None) -> ChatStream:
+        """
+        流式生成内容，逐段产出 Ollama 返回的文本，失败时在迭代过程中抛出 LlamaError
+        
+        Ollama 以 NDJSON 逐行返回，最后一行 done 为 true 并带有 eval_count、eval_duration 等统计，
+        迭代结束后可从返回对象的 stats 读取。与 generate 共用响应缓存，命中时一次产出完整回答。
+        只有在还没有产出任何文本时才会重试。参数含义同 generate。
+        """
+        stats: Dict = {}
+        return ChatStream(self._stream(prompt, system_prompt, use_cache, priority, cache_hint, stats), stats)
+    
+    def _stream(self, prompt: str, system_prompt: Optional[str], use_cache: bool, priority: Optional[int],
+                cache_hint: Optional[CacheHint], stats: Dict) -> Iterator[str]:
+        data = self._build_payload(prompt, system_prompt, stream=True)
+        cached = self._cache_get(data, use_cache, cache_hint)
+        if cached is not None:
+            stats.update(cached[1])
+            yield cached[0]
+            return
+        
+        failed = set()
+        for attempt in itertools.count():
+            parts = []
+            try:
+                for content in self.scheduler.stream(
+                    lambda: self._stream_on_endpoint(data, failed, stats),
+                    self.priority if priority is None else priority,
+                ):
+                    parts.append(content)
+                    yield content
+                self._cache_put(data, "".join(parts), stats, use_cache, cache_hint)
+                return
+            except LlamaError as e:
+                if parts or not e.transient or attempt >= self.max_retries:
+                    raise
+                failed.add(getattr(e, "endpoint", None))
+                delay = self._retry_delay(attempt, failed)
+                print(f"Ollama stream failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def stream_content(self, prompt: str, system_prompt: str = None, use_cache: bool = True,
+                       priority: Optional[int] = None, cache_hint: Optional[CacheHint] = None) -> ChatStream:
+        """流式生成内容；出错时产出错误说明文本而不是抛出异常（用于直接展示给用户的场景）"""
+        stream = self.stream(prompt, system_prompt, use_cache, priority, cache_hint)
+        return ChatStream(self._error_as_text(stream), stream.stats)
+    
+    @staticmethod
+    def _error_as_text(chunks: Iterator[str]) -> Iterator[str]:
+        try:
+            yield from chunks
         except Exception as e:
-            return f"生成内容时出现错误：{str(e)}"
+            yield error_text(e)
+    
+    def _stream_on_endpoint(self, data: Dict, failed: set, stats: Dict) -> Iterator[str]:
+        """在节点池选出的节点上发送一次流式请求，整个流期间计入该节点的在途请求数"""
+        endpoint = self.pool.acquire(failed)
+        endpoint.breaker.before_call()
+        with self.pool.lease(endpoint), _recorded(endpoint):
+            yield from self._stream_chat(data, endpoint.url, stats)
+    
+    def _stream_chat(self, data: Dict, base_url: str, stats: Dict) -> Iterator[str]:
+        """向指定节点发送一次流式请求（在调度线程中消费），逐段产出文本，结束时把统计信息写入 stats"""
+        with _translate_errors():
+            with self.session.post(
+                f"{base_url}/api/chat",
+                json=data,
+                stream=True,
+                # 读超时针对相邻两段输出之间的间隔，而不是整个回答
+                timeout=self.timeout
+            ) as response:
+                if response.status_code != 200:
+                    _check_status(response.status_code, response.text)
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LlamaResponseError(chunk["error"])
+                    content = chunk.get("message", {}).get("content", "")
+                    if content:
+                        yield content
+                    if chunk.get("done"):
+                        stats.update(self._parse_stats(chunk, data))
+                        return
+        raise LlamaResponseError("Ollama 的流式响应在完成前中断")
     
     def check_model_availability(self) -> bool:
-        """检查模型是否可用"""
+        """检查模型是否可用（任一节点有该模型即可），同时刷新节点池的健康状态"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return any(model.get("name") == self.model for model in models)
-            return False
+            return any(self.pool.check_health().values())
         except:
             return False
     
+    def preload_model(self) -> bool:
+        """在每个节点上把模型加载到内存并按 OLLAMA_KEEP_ALIVE 保留，第一次生成不必再等待加载"""
+        data = {"model": self.model, "keep_alive": self._keep_alive()}
+        loaded = True
+        for endpoint in self.pool.endpoints:
+            try:
+                response = self.session.post(
+                    f"{endpoint.url}/api/generate",
+                    json=data,
+                    timeout=(self.timeout[0], 300)  # 加载大模型可能需要较长时间
+                )
+                loaded &= response.status_code == 200
+            except:
+                loaded = False
+        return loaded
+    
     def pull_model(self) -> bool:
-        """拉取模型（如果不存在）"""
+        """在每个节点上拉取模型（如果不存在）"""
+        data = {"name": self.model}
+        pulled = True
+        for endpoint in self.pool.endpoints:
+            try:
+                response = self.session.post(
+                    f"{endpoint.url}/api/pull",
+                    json=data,
+                    timeout=300  # 5分钟超时，拉取模型可能需要时间
+                )
+                pulled &= response.status_code == 200
+            except:
+                pulled = False
+        return pulled
+    
+    def close(self) -> None:
+        """关闭连接池和响应缓存"""
+        self.session.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+
+class AsyncLlamaClient(LlamaClient):
+    """
+    LLaMA模型异步客户端，基于 httpx.AsyncClient
+    
+    连接池保持长连接；信号量把同时在途的请求数限制为 OLLAMA_NUM_PARALLEL × 节点数，
+    与 Ollama 服务端的并行槽位一致，多余的请求在客户端排队而不是挤占服务端队列。
+    节点选择、重试与熔断规则与同步接口相同。
+    异步接口不经过 RequestScheduler，适合独立运行的批处理脚本，不要与交互服务混用同一个 Ollama。
+    同步接口（generate_content 等）仍可使用；需要逐条统计时使用 agenerate_with_stats。
+    """
+    
+    def __init__(self, max_in_flight: Optional[int] = None):
+        super().__init__()
+        import httpx
+        self.max_in_flight = max(1, max_in_flight or self.settings.ollama_num_parallel * len(self.pool.endpoints))
+        connect_timeout, read_timeout = self.timeout
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_in_flight,
+                                max_keepalive_connections=self.max_in_flight),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+    
+    async def __aenter__(self) -> "AsyncLlamaClient":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def aclose(self) -> None:
+        """关闭异步连接池和同步会话"""
+        await self.client.aclose()
+        self.close()
+    
+    @staticmethod
+    def _translate_async_error(error: Exception) -> LlamaError:
+        import httpx
+        if isinstance(error, LlamaError):
+            return error
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return LlamaConnectionError(f"无法连接 Ollama：{error or type(error).__name__}")
+        if isinstance(error, httpx.TimeoutException):
+            return LlamaTimeoutError(f"等待 Ollama 响应超时：{error or type(error).__name__}")
+        if isinstance(error, httpx.TransportError):
+            return LlamaConnectionError(f"与 Ollama 的连接中断：{error or type(error).__name__}")
+        if isinstance(error, ValueError):
+            return LlamaResponseError(f"无法解析 Ollama 的响应：{error}")
+        return LlamaUnexpectedError(f"调用 Ollama 时出现异常：{type(error).__name__}: {error}")
+    
+    async def _achat(self, data: Dict, timeout: Optional[float], failed: set) -> Tuple[str, Dict]:
+        """取得信号量后选择节点并发送一次请求"""
+        import httpx
+        request_timeout = httpx.Timeout(timeout, connect=self.timeout[0]) if timeout else httpx.USE_CLIENT_DEFAULT
+        async with self._semaphore:
+            endpoint = self.pool.acquire(failed)
+            endpoint.breaker.before_call()
+            with self.pool.lease(endpoint), _recorded(endpoint):
+                try:
+                    response = await self.client.post(f"{endpoint.url}/api/chat", json=data, timeout=request_timeout)
+                    _check_status(response.status_code, response.text)
+                    result = response.json()
+                    if result.get("error"):
+                        raise LlamaResponseError(result["error"])
+                except Exception as e:
+                    raise self._translate_async_error(e) from e
+        return result.get("message", {}).get("content", ""), self._parse_stats(result, data)
+    
+    async def agenerate(self, prompt: str, system_prompt: str = None, timeout: Optional[float] = None,
+                        use_cache: bool = True, cache_hint: Optional[CacheHint] = None) -> Tuple[str, Dict]:
+        """
+        异步生成内容，返回 (文本, 统计信息)，失败时抛出 LlamaError；重试与熔断规则同 generate
+        
+        :param timeout: 本次请求的读超时（秒），默认使用 OLLAMA_READ_TIMEOUT；在信号量上排队的时间不计入
+        :param use_cache: 同 generate
+        :param cache_hint: 同 generate
+        """
+        data = self._build_payload(prompt, system_prompt, stream=False)
+        cached = self._cache_get(data, use_cache, cache_hint)
+        if cached is not None:
+            return cached
+        failed = set()
+        for attempt in itertools.count():
+            try:
+                content, stats = await self._achat(data, timeout, failed)
+            except LlamaError as e:
+                if not e.transient or attempt >= self.max_retries:
+                    raise
+                failed.add(getattr(e, "endpoint", None))
+                await asyncio.sleep(self._retry_delay(attempt, failed))
+            else:
+                self._cache_put(data, content, stats, use_cache, cache_hint)
+                return content, stats
+    
+    async def agenerate_with_stats(self, prompt: str, system_prompt: str = None,
+                                   timeout: Optional[float] = None, use_cache: bool = True,
+                                   cache_hint: Optional[CacheHint] = None) -> Tuple[str, Dict]:
+        """异步生成内容，返回 (文本, 统计信息)；出错时返回 (错误说明文本, {})"""
         try:
-            data = {"name": self.model}
-            response = requests.post(
-                f"{self.base_url}/api/pull",
-                json=data,
-                timeout=300  # 5分钟超时，拉取模型可能需要时间
-            )
-            return response.status_code == 200
-        except:
-            return False 
\ No newline at end of file
+            return await self.agenerate(prompt, system_prompt, timeout, use_cache, cache_hint)
+        except Exception as e:
+            return error_text(e), {}
+    
+    async def agenerate_content(self, prompt: str, system_prompt: str = None,
+                                timeout: Optional[float] = None, use_cache: bool = True,
+                                cache_hint: Optional[CacheHint] = None) -> str:
+        """异步生成内容，出错时与 generate_content 一样返回错误说明文本"""
+        content, _ = await self.agenerate_with_stats(prompt, system_prompt, timeout, use_cache, cache_hint)
+        return content
+    
+    def astream_content(self, prompt: str, system_prompt: str = None, use_cache: bool = True,
+                        cache_hint: Optional[CacheHint] = None) -> AsyncChatStream:
+        """异步流式生成内容，行为与 stream_content 相同（不重试）；整个流期间占用一个并行槽位"""
+        stats: Dict = {}
+        return AsyncChatStream(self._astream(prompt, system_prompt, use_cache, cache_hint, stats), stats)
+    
+    async def _astream(self, prompt: str, system_prompt: Optional[str], use_cache: bool,
+                       cache_hint: Optional[CacheHint], stats: Dict) -> AsyncIterator[str]:
+        try:
+            data = self._build_payload(prompt, system_prompt, stream=True)
+            cached = self._cache_get(data, use_cache, cache_hint)
+            if cached is not None:
+                stats.update(cached[1])
+                yield cached[0]
+                return
+            parts = []
+            async with self._semaphore:
+                endpoint = self.pool.acquire()
+                endpoint.breaker.before_call()
+                with self.pool.lease(endpoint):
+                    async for content in self._astream_endpoint(data, endpoint, stats):
+                        parts.append(content)
+                        yield content
+            self._cache_put(data, "".join(parts), stats, use_cache, cache_hint)
+        except Exception as e:
+            yield error_text(e)
+    
+    async def _astream_endpoint(self, data: Dict, endpoint, stats: Dict) -> AsyncIterator[str]:
+        """在指定节点上发送一次流式请求，并把结果记录到该节点的熔断器"""
+        with _recorded(endpoint):
+            try:
+                async with self.client.stream("POST", f"{endpoint.url}/api/chat", json=data) as response:
+                    if response.status_code != 200:
+                        _check_status(response.status_code, (await response.aread()).decode("utf-8", "replace"))
+                
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise LlamaResponseError(chunk["error"])
+                        content = chunk.get("message", {}).get("content", "")
+                        if content:
+                            yield content
+                        if chunk.get("done"):
+                            stats.update(self._parse_stats(chunk, data))
+                            return
+                raise LlamaResponseError("Ollama 的流式响应在完成前中断")
+            except Exception as e:
+                raise self._translate_async_error(e) from e
+    
+    async def agenerate_many(self, prompts: Sequence[str], system_prompt: str = None,
+                             timeout: Optional[float] = None, use_cache: bool = True) -> List[str]:
+        """并发生成多条内容，结果与 prompts 顺序一致；同时在途的请求不超过 max_in_flight"""
+        return list(await asyncio.gather(
+            *(self.agenerate_content(prompt, system_prompt, timeout, use_cache) for prompt in prompts)
+        ))
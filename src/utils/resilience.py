@@ -0,0 +1,133 @@
+"""
+调用 Ollama 的容错工具 - 结构化异常、指数退避与熔断器
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+# 可以重试的 HTTP 状态码（限流、服务端暂时不可用）
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+class LlamaError(Exception):
+    """调用模型失败；transient 为 True 的错误可以重试"""
+
+    transient = False
+
+
+class LlamaConnectionError(LlamaError):
+    """无法连接 Ollama（服务未启动、连接被拒绝、连接超时）"""
+
+    transient = True
+
+
+class LlamaTimeoutError(LlamaError):
+    """已连接但读取响应超时"""
+
+    transient = True
+
+
+class LlamaHTTPError(LlamaError):
+    """Ollama 返回了非 200 状态码"""
+
+    def __init__(self, status_code: int, detail: str = ""):
+        self.status_code = status_code
+        self.detail = detail
+        self.transient = status_code in RETRYABLE_STATUS
+        super().__init__(f"API请求失败，状态码: {status_code}" + (f"（{detail}）" if detail else ""))
+
+
+class LlamaResponseError(LlamaError):
+    """响应无法解析，或模型在生成过程中返回了错误"""
+
+
+class LlamaUnexpectedError(LlamaError):
+    """调用过程中出现的其他异常；无法判断节点是否正常，按可重试处理并计入熔断"""
+
+    transient = True
+
+
+class CircuitOpenError(LlamaError):
+    """熔断器处于打开状态，请求未发出即失败"""
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """第 attempt 次重试（从 0 开始）前的等待时间：指数退避加全抖动，避免大量请求同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续 failure_threshold 次可重试的失败（连接失败、超时、5xx）后打开，
+    之后 reset_timeout 秒内的请求直接抛出 CircuitOpenError；到期后放行一个探测请求（半开），
+    探测成功则关闭，失败则重新打开。不可重试的错误（如 404 模型不存在）说明服务仍可达，按成功处理。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """请求发出前调用；熔断打开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining > 0:
+                raise CircuitOpenError(f"Ollama 暂不可用（连续失败 {self.failures} 次），{remaining:.0f} 秒后重试")
+            if self._probing:
+                raise CircuitOpenError("Ollama 暂不可用，正在探测服务是否恢复")
+            self.state = "half_open"
+            self._probing = True
+
+    def available(self) -> bool:
+        """当前是否会放行请求（不改变状态）"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self._probing:
+                return False
+            return self.state == "half_open" or time.monotonic() >= self._opened_at + self.reset_timeout
+
+    def record(self, error: Optional[LlamaError] = None) -> None:
+        """记录一次请求结果；error 为 None 或不可重试的错误时视为服务正常"""
+        with self._lock:
+            self._probing = False
+            if error is None or not error.transient:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """请求被调用方放弃（如提前停止读取流式响应、任务被取消），结果未知：只结束半开探测，不计成功或失败"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str, settings) -> CircuitBreaker:
+    """每个 Ollama 地址一个熔断器，进程内所有客户端共用"""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(settings.llm_breaker_threshold, settings.llm_breaker_reset)
+        return _breakers[endpoint]
@@ -0,0 +1,194 @@
+"""
+模型响应缓存 - 以完整请求的哈希为键，把 Ollama 的回答持久化到SQLite
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+
+
+# 不影响回答内容的请求字段，不参与键的计算
+_IGNORED_FIELDS = ("stream", "keep_alive")
+
+
+def request_key(payload: Dict) -> str:
+    """完整请求（模型、全部消息、生成参数）的SHA256；是否流式、模型保留时间不影响结果，不参与计算"""
+    canonical = {key: value for key, value in payload.items() if key not in _IGNORED_FIELDS}
+    return hashlib.sha256(
+        json.dumps(canonical, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+class CacheHint(NamedTuple):
+    """
+    语义匹配的依据
+
+    RAG 对话的最后一条消息是“检索到的上下文 + 用户问题”，整体嵌入时问题常被截断，
+    上下文相近的不同问题会互相命中。调用方单独给出 question（只嵌入它）和 context
+    （计入 scope，上下文相同才可能语义命中）。
+    """
+    question: str
+    context: str = ""
+
+
+def request_scope(payload: Dict, context: str = "") -> str:
+    """
+    去掉最后一条用户消息后的请求哈希（给出 context 时一并计入）：
+    只有同一模型、同一系统提示词和参数（以及同一检索上下文）下的回答才做语义匹配
+    """
+    scoped = dict(payload, messages=payload.get("messages", [])[:-1])
+    if context:
+        scoped["context"] = hashlib.sha256(context.encode('utf-8')).hexdigest()
+    return request_key(scoped)
+
+
+class ResponseCache:
+    """
+    基于SQLite的模型响应缓存
+
+    - 精确匹配：键为完整请求的哈希，同一问题再次提交时直接返回保存的回答；
+    - 语义匹配（可选）：同时保存用户问题（CacheHint.question，未给出时为最后一条用户消息）
+      的归一化向量，精确匹配失败时在同一 scope 内找余弦相似度不低于 threshold 的最近条目；
+    - 淘汰：超过 ttl_seconds（0 为不过期）的条目视为失效，总大小超过 max_bytes
+      时按最近访问时间淘汰到上限的 90%。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 0,
+                 embed: Optional[Callable[[str], List[float]]] = None, threshold: float = 0.95):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.threshold = threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, scope TEXT NOT NULL, response TEXT NOT NULL, stats TEXT NOT NULL, "
+            "vector BLOB, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses(scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._size()
+
+    def _size(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(CAST(response AS BLOB)) + LENGTH(stats) + COALESCE(LENGTH(vector), 0)), 0) "
+            "FROM responses"
+        ).fetchone()[0]
+
+    def _fresh_after(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0
+
+    def _vector(self, payload: Dict, hint: Optional[CacheHint]) -> Optional[np.ndarray]:
+        messages = payload.get("messages") or []
+        if self.embed is None or not messages:
+            return None
+        text = hint.question if hint else messages[-1].get("content", "")
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    @staticmethod
+    def _scope(payload: Dict, hint: Optional[CacheHint]) -> str:
+        return request_scope(payload, hint.context if hint else "")
+
+    def get(self, payload: Dict, hint: Optional[CacheHint] = None) -> Optional[Tuple[str, Dict]]:
+        """命中返回 (回答, 统计信息)，否则返回 None；hint 只影响语义匹配"""
+        key = request_key(payload)
+        fresh_after = self._fresh_after()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, response, stats FROM responses WHERE key = ? AND created >= ?", (key, fresh_after)
+            ).fetchone()
+        semantic = False
+        if row is None and self.embed is not None:
+            row = self._nearest(self._scope(payload, hint), self._vector(payload, hint), fresh_after)
+            semantic = row is not None
+        if row is None:
+            self.misses += 1
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+            self._conn.commit()
+        self.hits += 1
+        self.semantic_hits += semantic
+        return row[1], json.loads(row[2])
+
+    def _nearest(self, scope: str, vector: Optional[np.ndarray], fresh_after: float):
+        if vector is None:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, response, stats, vector FROM responses "
+                "WHERE scope = ? AND vector IS NOT NULL AND created >= ?", (scope, fresh_after)
+            ).fetchall()
+        candidates = [row for row in rows if len(row[3]) == vector.nbytes]
+        if not candidates:
+            return None
+        matrix = np.frombuffer(b"".join(row[3] for row in candidates), dtype=np.float32).reshape(len(candidates), -1)
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        return candidates[best][:3] if similarities[best] >= self.threshold else None
+
+    def put(self, payload: Dict, response: str, stats: Optional[Dict] = None,
+            hint: Optional[CacheHint] = None) -> None:
+        """保存一次成功的回答，并在超出容量时淘汰最久未访问的条目"""
+        vector = self._vector(payload, hint)
+        now = time.time()
+        row = (
+            request_key(payload), self._scope(payload, hint), response,
+            json.dumps(stats or {}), vector.tobytes() if vector is not None else None, now, now,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, response, stats, vector, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", row
+            )
+            self._total_bytes += len(response.encode('utf-8')) + len(row[3]) + (len(row[4]) if row[4] else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # 先删除过期条目，再按数据库重新统计（其他进程可能也写入了），最后批量删除最旧的条目
+        if self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (self._fresh_after(),))
+        self._total_bytes = self._size()
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(CAST(response AS BLOB)) + LENGTH(stats) + COALESCE(LENGTH(vector), 0) "
+                "FROM responses ORDER BY last_access LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                doomed.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,226 @@
+"""
+请求调度器 - 所有 LlamaClient 共用的生成请求队列（优先级、合并相同请求、全局并发上限）
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+from .endpoint_pool import parse_endpoints
+
+# 数值越小越先处理
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# 流式任务结束标记
+_END = object()
+
+
+class _Job:
+    __slots__ = ("fn", "priority", "key", "future", "enqueued")
+
+    def __init__(self, fn: Callable[[], Any], priority: int, key: Optional[Hashable]):
+        self.fn = fn
+        self.priority = priority
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    生成请求调度器
+
+    - 优先级队列：交互请求（对话、单次生成）排在批量任务前面；
+    - 预留槽位：批量任务最多占用 max_concurrency - reserved_interactive 个槽位，
+      批量任务跑满时交互请求仍有空闲槽位，不必等批量请求生成完；
+    - 合并：键相同（同一完整请求）且仍在排队或生成中的请求共用一个结果；
+    - 指标：各优先级的排队数、在途数、等待时间（最近 metrics_window 个请求）。
+    """
+
+    def __init__(self, max_concurrency: int = 4, reserved_interactive: int = 1, metrics_window: int = 256):
+        self.max_concurrency = max(1, max_concurrency)
+        # 只有一个槽位时无法预留，批量任务与交互请求只按优先级排队
+        self.batch_limit = max(1, self.max_concurrency - max(0, reserved_interactive))
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._inflight: Dict[Hashable, _Job] = {}
+        self._running = 0
+        self._running_batch = 0
+        self._workers = []
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self._waits = {PRIORITY_INTERACTIVE: deque(maxlen=metrics_window), PRIORITY_BATCH: deque(maxlen=metrics_window)}
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, name=f"llm-scheduler-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, fn: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE,
+               key: Optional[Hashable] = None) -> Future:
+        """
+        提交一个生成任务，返回 Future
+
+        :param key: 合并键，None 表示不合并；键相同的任务仍在排队时按更高的优先级处理
+        """
+        with self._cond:
+            self.submitted += 1
+            if key is not None and key in self._inflight:
+                job = self._inflight[key]
+                self.coalesced += 1
+                if priority < job.priority and not job.future.running():
+                    # 交互请求合并到排队中的批量任务：重新以交互优先级入队，旧条目出队时跳过
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._seq), job))
+                    self._cond.notify_all()
+                return job.future
+            job = _Job(fn, priority, key)
+            if key is not None:
+                self._inflight[key] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._start_workers()
+            self._cond.notify_all()
+            return job.future
+
+    def run(self, fn: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE, key: Optional[Hashable] = None) -> Any:
+        """提交任务并等待结果"""
+        return self.submit(fn, priority, key).result()
+
+    def stream(self, fn: Callable[[], Iterator[Any]], priority: int = PRIORITY_INTERACTIVE) -> Iterator[Any]:
+        """
+        调度一个流式任务：fn 返回的迭代器在调度线程中消费，逐段转交给调用方
+
+        整个流期间占用一个槽位；流式任务不参与合并。
+        调用方提前停止迭代（break 后关闭生成器、迭代中抛出异常）时，调度线程在下一段到达时停止读取，
+        关闭 fn 返回的迭代器（连同其中的 HTTP 响应）并释放槽位。
+        """
+        channel: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+
+        def pump():
+            items = None
+            try:
+                items = fn()
+                for item in items:
+                    if cancelled.is_set():
+                        break
+                    channel.put(item)
+            finally:
+                close = getattr(items, "close", None)
+                if close is not None:
+                    close()
+                channel.put(_END)
+
+        future = self.submit(pump, priority)
+        try:
+            while True:
+                item = channel.get()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            cancelled.set()
+        # pump 中的异常在这里抛给调用方
+        future.result()
+
+    def _next_job(self) -> _Job:
+        with self._cond:
+            while True:
+                while self._heap and (self._heap[0][2].future.done() or self._heap[0][2].future.running()
+                                      or self._heap[0][0] != self._heap[0][2].priority):
+                    # 跳过已提升优先级的旧条目
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    priority, _, job = self._heap[0]
+                    if priority < PRIORITY_BATCH or self._running_batch < self.batch_limit:
+                        heapq.heappop(self._heap)
+                        job.future.set_running_or_notify_cancel()
+                        self._running += 1
+                        if priority >= PRIORITY_BATCH:
+                            self._running_batch += 1
+                        self._waits[PRIORITY_BATCH if priority >= PRIORITY_BATCH else PRIORITY_INTERACTIVE].append(
+                            time.monotonic() - job.enqueued)
+                        return job
+                self._cond.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            try:
+                result = job.fn()
+            except BaseException as e:
+                error, result = e, None
+            else:
+                error = None
+            with self._cond:
+                self._running -= 1
+                if job.priority >= PRIORITY_BATCH:
+                    self._running_batch -= 1
+                if job.key is not None and self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def metrics(self) -> Dict:
+        """排队深度、在途数、合并次数与各优先级的等待时间（秒）"""
+        with self._cond:
+            queued = {}
+            for priority, _, job in self._heap:
+                if priority == job.priority and not (job.future.done() or job.future.running()):
+                    name = "batch" if priority >= PRIORITY_BATCH else "interactive"
+                    queued[name] = queued.get(name, 0) + 1
+            waits = {}
+            for priority, samples in self._waits.items():
+                ordered = sorted(samples)
+                name = "batch" if priority >= PRIORITY_BATCH else "interactive"
+                waits[name] = {
+                    "count": len(ordered),
+                    "avg": sum(ordered) / len(ordered) if ordered else 0.0,
+                    "p95": ordered[int(len(ordered) * 0.95)] if ordered else 0.0,
+                    "max": ordered[-1] if ordered else 0.0,
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "batch_limit": self.batch_limit,
+                "queued": queued,
+                "running": self._running,
+                "running_batch": self._running_batch,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_seconds": waits,
+            }
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(settings) -> RequestScheduler:
+    """进程内共享的调度器，所有 LlamaClient 的请求都经过它，因此并发上限是全局的（默认为各节点并行槽位之和）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                max_concurrency=settings.llm_max_concurrency
+                or settings.ollama_num_parallel * len(parse_endpoints(settings)),
+                reserved_interactive=settings.llm_reserved_interactive,
+            )
+        return _scheduler
@@ -82,18 +82,28 @@ def main():
         - **测试数据生成**：选择数据类型生成测试数据
         - **批量处理**：上传文件批量生成
         """)
+        st.markdown("---")
+        # 勾选后跳过模型响应缓存，重新生成；组件由所有会话共用，只按本会话的调用传入
+        use_cache = not st.checkbox("🔄 忽略缓存重新生成", value=False)
+        st.caption("✅ 知识库已就绪" if agent.rag_ready else "⏳ 知识库正在后台加载，首次检索时会等待加载完成")
+        with st.expander("📈 模型请求调度"):
+            st.json(agent.llama_client.scheduler.metrics())
+            st.caption("Prompt 评估（批量生成）")
+            st.json(test_generator.llama_client.prompt_meter.report())
+            st.caption("Ollama 节点")
+            st.json(agent.llama_client.pool.snapshot())
     
     # 主内容区域
     if mode == "💬 智能对话":
-        chat_interface(agent)
+        chat_interface(agent, use_cache)
     elif mode == "📝 测试用例生成":
-        test_case_interface(test_generator)
+        test_case_interface(test_generator, use_cache)
     elif mode == "🔧 测试数据生成":
         test_data_interface(data_generator)
     elif mode == "📊 批量处理":
-        batch_interface(test_generator, data_generator)
+        batch_interface(test_generator, data_generator, use_cache)
 
-def chat_interface(agent):
+def chat_interface(agent, use_cache=True):
     """智能对话界面"""
     st.header("💬 智能对话模式")
     
@@ -126,24 +136,32 @@ def chat_interface(agent):
                 st.write(user_input)
         
         # 生成AI响应
-        with st.spinner("🤔 AI正在思考..."):
-            try:
-                response_data = agent.chat(user_input)
-                
-                # 显示AI响应
-                with chat_container:
-                    with st.chat_message("assistant"):
-                        st.write(response_data.get("response"))
-                        # 如果有上下文，则在可扩展组件中显示
-                        # if response_data.get("context"):
-                        #     with st.expander("🔍 查看检索上下文"):
-                                # st.markdown(response_data.get("context"))
-                
-                # 保存到会话历史
-                st.session_state.chat_history.append((user_input, response_data))
-                
-            except Exception as e:
-                st.error(f"处理请求时出现错误：{str(e)}")
+        try:
+            # 检索在 spinner 内完成，之后边生成边显示
+            with st.spinner("🤔 AI正在思考..."):
+                response_data = agent.chat_stream(user_input, use_cache=use_cache)
+            
+            # 显示AI响应
+            with chat_container:
+                with st.chat_message("assistant"):
+                    stream = response_data["response"]
+                    response_data["response"] = st.write_stream(stream)
+                    # 统计信息随本次的流返回，不读共享客户端上的状态
+                    stats = stream.stats
+                    if stats.get("cached"):
+                        st.caption("来自响应缓存")
+                    elif stats.get("tokens_per_second"):
+                        st.caption(f"{stats['eval_count']} tokens · {stats['tokens_per_second']:.1f} tokens/s")
+                    # 如果有上下文，则在可扩展组件中显示
+                    # if response_data.get("context"):
+                    #     with st.expander("🔍 查看检索上下文"):
+                            # st.markdown(response_data.get("context"))
+            
+            # 保存到会话历史
+            st.session_state.chat_history.append((user_input, response_data))
+            
+        except Exception as e:
+            st.error(f"处理请求时出现错误：{str(e)}")
     
     # 清空对话按钮
     if st.button("🗑️ 清空对话"):
@@ -152,7 +170,7 @@ def chat_interface(agent):
         # st.experimental_rerun()
 
 
-def test_case_interface(test_generator):
+def test_case_interface(test_generator, use_cache=True):
     """测试用例生成界面"""
     st.header("📝 测试用例生成")
     
@@ -194,16 +212,20 @@ def test_case_interface(test_generator):
         if generate_button and feature_description:
             with st.spinner("⚡ 正在生成测试用例..."):
                 try:
-                    test_cases = test_generator.generate_from_description(feature_description, test_framework)
-                    st.markdown(test_cases)
-                    
-                    # 下载按钮
-                    st.download_button(
-                        label="📄 下载测试用例",
-                        data=test_cases,
-                        file_name=f"test_cases_{feature_description[:10]}.md",
-                        mime="text/markdown"
-                    )
+                    test_cases, error = test_generator.generate_from_description(feature_description, test_framework,
+                                                                                 use_cache=use_cache)
+                    if error:
+                        st.error(f"生成测试用例时出现错误：{error}")
+                    else:
+                        st.markdown(test_cases)
+                        
+                        # 下载按钮
+                        st.download_button(
+                            label="📄 下载测试用例",
+                            data=test_cases,
+                            file_name=f"test_cases_{feature_description[:10]}.md",
+                            mime="text/markdown"
+                        )
                     
                 except Exception as e:
                     st.error(f"生成测试用例时出现错误：{str(e)}")
@@ -265,7 +287,7 @@ def test_data_interface(data_generator):
                 except Exception as e:
                     st.error(f"生成测试数据时出现错误：{str(e)}")
 
-def batch_interface(test_generator, data_generator):
+def batch_interface(test_generator, data_generator, use_cache=True):
     """批量处理界面"""
     st.header("📊 批量处理")
     
@@ -285,7 +307,14 @@ def batch_interface(test_generator, data_generator):
             if st.button("🚀 批量生成", type="primary"):
                 with st.spinner("⚡ 正在批量生成测试用例..."):
                     try:
-                        result = test_generator.generate_from_features(content, output_format)
+                        progress = st.progress(0.0)
+                        
+                        def on_progress(done, total, scenario_name, ok):
+                            status = "✅" if ok else "❌"
+                            progress.progress(done / total, text=f"{done}/{total} {status} {scenario_name}")
+                        
+                        result = test_generator.generate_from_features(content, output_format, on_progress=on_progress,
+                                                                       use_cache=use_cache)
                         
                         if output_format == "json":
                             st.json(json.loads(result))
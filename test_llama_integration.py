@@ -61,14 +61,14 @@ def test_test_case_generator():
     generator = TestCaseGenerator()
     
     try:
-        result = generator.generate_from_description("用户登录功能", "pytest")
-        if result and "错误" not in result:
+        result, error = generator.generate_from_description("用户登录功能", "pytest")
+        if result and not error:
             print("✅ 测试用例生成器工作正常")
             print(f"生成示例: {result[:100]}...")
             return True
         else:
             print("❌ 测试用例生成器异常")
-            print(f"结果: {result}")
+            print(f"错误: {error}")
             return False
     except Exception as e:
         print(f"❌ 测试用例生成器测试失败: {e}")
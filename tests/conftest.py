@@ -0,0 +1,207 @@
+"""
+测试公共夹具 - 本地 Ollama 替身服务、隔离的进程级单例（节点池、熔断器、调度器）与确定性的嵌入模型
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import zlib
+from typing import Dict, List
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.rag import knowledge_base
+from src.rag.lexical import tokenize
+from src.utils import endpoint_pool, resilience, scheduler
+
+MODEL = "test-model"
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    """轮询等待条件成立（用于等待请求到达替身节点或进入调度器）"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    按词哈希的词袋向量（L2 归一化），代替真实的嵌入模型
+
+    共享词越多的文本距离越近，足以验证检索流程；calls 记录嵌入过的文本数。
+    """
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            vector[zlib.crc32(token.encode("utf-8")) % self.dim] += 1
+        return (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def write_files(root, files: Dict[str, str]) -> None:
+    """在 root 下按相对路径写入文本文件（自动创建子目录）"""
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+
+class StubOllama:
+    """
+    一个 Ollama 节点的替身
+
+    - GET /api/tags：has_model 为 True 时列出 MODEL，tags_status 非 200 时返回该状态码；
+    - POST /api/chat：接下来 fail 次返回 status，之后返回 reply（stream 为 True 时按 NDJSON 分段返回）；
+      gate 未放行前请求一直挂起，用于制造在途请求；chunk_delay 为流式分段之间的间隔，streamed 为已写出的分段数。
+    """
+
+    def __init__(self):
+        self.reply = "你好，世界"
+        self.fail = 0
+        self.status = 503
+        self.has_model = True
+        self.tags_status = 200
+        self.chat_calls = 0
+        self.chunk_delay = 0.0
+        self.streamed = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def close(self) -> None:
+        self.gate.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if stub.tags_status != 200:
+                    return self._send(stub.tags_status, {"error": "unavailable"})
+                models = [{"name": MODEL}] if stub.has_model else []
+                self._send(200, {"models": models})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.chat_calls += 1
+                stub.gate.wait()
+                if stub.fail > 0:
+                    stub.fail -= 1
+                    return self._send(stub.status, {"error": f"stub status {stub.status}"})
+                done = {"done": True, "eval_count": 3, "eval_duration": 150000000}
+                if not request.get("stream"):
+                    return self._send(200, dict(done, message={"content": stub.reply}))
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunks = [{"message": {"content": part}, "done": False} for part in stub.reply]
+                try:
+                    for chunk in chunks + [dict(done, message={"content": ""})]:
+                        line = json.dumps(chunk).encode("utf-8") + b"\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                        stub.streamed += 1
+                        time.sleep(stub.chunk_delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前关闭了连接
+                    self.close_connection = True
+
+        return Handler
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(monkeypatch):
+    """
+    每个测试使用独立的节点池、熔断器、调度器和共享嵌入模型；关闭响应缓存、预加载与后台健康检查，重试不退避；
+    知识库使用 Flat 索引、单进程嵌入、不落盘嵌入缓存
+    """
+    monkeypatch.setattr(endpoint_pool, "_pools", {})
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(scheduler, "_scheduler", None)
+    monkeypatch.setattr(knowledge_base, "_shared_embeddings", {})
+    for name, value in {
+        "LLAMA_MODEL": MODEL,
+        "LLM_CACHE_PATH": "",
+        "OLLAMA_PRELOAD": "False",
+        "OLLAMA_HEALTH_INTERVAL": "0",
+        "LLM_MAX_RETRIES": "2",
+        "LLM_RETRY_BACKOFF": "0.01",
+        "LLM_BREAKER_THRESHOLD": "5",
+        "LLM_BREAKER_RESET": "30",
+        "EMBEDDING_CACHE_PATH": "",
+        "EMBEDDING_WORKERS": "1",
+        "FAISS_INDEX_SPEC": "Flat",
+        "VECTOR_STORE_LOAD_MODE": "memory",
+        "KNOWLEDGE_INCLUDE": "*.txt,*.md",
+        "KNOWLEDGE_EXCLUDE": "",
+        "KNOWLEDGE_SHARDS": "auto",
+        "RETRIEVAL_MODE": "hybrid",
+        "RERANK_ENABLED": "False",
+    }.items():
+        monkeypatch.setenv(name, value)
+
+
+@pytest.fixture
+def ollama():
+    """启动 Ollama 替身：ollama(n) 返回 n 个节点，测试结束后关闭"""
+    stubs: List[StubOllama] = []
+
+    def start(count: int = 1) -> List[StubOllama]:
+        started = [StubOllama() for _ in range(count)]
+        stubs.extend(started)
+        return started
+
+    yield start
+    for stub in stubs:
+        stub.close()
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """按给定的替身节点创建 LlamaClient（其余配置见 isolated_settings）"""
+    from src.utils.llama_client import LlamaClient
+
+    def make(stubs: List[StubOllama], **env) -> LlamaClient:
+        monkeypatch.setenv("OLLAMA_BASE_URL", stubs[0].url)
+        monkeypatch.setenv("OLLAMA_BASE_URLS", ",".join(stub.url for stub in stubs))
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return LlamaClient()
+
+    return make
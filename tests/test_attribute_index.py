@@ -0,0 +1,122 @@
+"""
+属性索引测试 - 离散字段位图、日期区间、增删合并与保存，以及知识库检索时的元数据过滤
+"""
+
+import pytest
+from src.rag.attribute_index import AttributeIndex, filter_key, parse_date
+from src.rag.knowledge_base import KnowledgeBase
+from .conftest import HashEmbeddings, write_files
+
+
+@pytest.fixture
+def index():
+    index = AttributeIndex()
+    index.add("a", {"space": "QA", "author": "张三", "updated": "2024-01-15T08:00:00.000Z"})
+    index.add("b", {"space": "DEV", "author": "李四", "updated": "2024-03-01"})
+    index.add("c", {"space": "QA", "author": "李四", "created": "2023/12/31"})
+    index.add("d", {"space": "", "project": "PAY", "updated": "2024-06-30"})
+    index.merge()
+    return index
+
+
+def selected(index: AttributeIndex, filters) -> list:
+    return [doc_id for doc_id, hit in zip(index.doc_ids, index.mask(filters)) if hit]
+
+
+def test_parse_date():
+    assert parse_date("2024-05-01") == 20240501
+    assert parse_date("2024-05-01T10:00:00.000Z") == 20240501
+    assert parse_date("2024/05/01") == 20240501
+    assert parse_date(None) == 0
+    assert parse_date("五月") == 0
+
+
+def test_categorical_masks(index):
+    assert selected(index, {"space": "QA"}) == ["a", "c"]
+    assert selected(index, {"author": ["张三", "李四"]}) == ["a", "b", "c"]
+    assert selected(index, {"space": "QA", "author": "李四"}) == ["c"]
+    assert selected(index, {"project": "PAY"}) == ["d"]
+    # 未出现过的取值和空字符串都匹配不到任何文档
+    assert selected(index, {"space": "OPS"}) == []
+    assert selected(index, {"space": ""}) == []
+    assert selected(index, {}) == ["a", "b", "c", "d"]
+
+
+def test_date_ranges(index):
+    assert selected(index, {"updated": ("2024-01-01", "2024-03-01")}) == ["a", "b"]
+    assert selected(index, {"updated": ("2024-02-01", None)}) == ["b", "d"]
+    assert selected(index, {"updated": (None, "2024-01-15")}) == ["a"]
+    # 没有该日期字段的文档不会被任何区间选中
+    assert selected(index, {"updated": (None, None)}) == ["a", "b", "d"]
+    assert selected(index, {"created": ("2023-12-31", "2023-12-31")}) == ["c"]
+    assert selected(index, {"space": "QA", "updated": ("2024-01-01", None)}) == ["a"]
+
+
+def test_unsupported_field_raises(index):
+    with pytest.raises(ValueError):
+        index.mask({"title": "登录"})
+
+
+def test_remove_and_add_are_applied_on_merge(index):
+    index.remove(["a"])
+    assert selected(index, {"space": "QA"}) == ["c"]
+    index.add("e", {"space": "QA", "updated": "2024-02-02"})
+    index.add("f", {"space": "QA"})
+    index.remove(["f"])
+    assert len(index) == 4
+
+    index.merge()
+    assert index.doc_ids == ["b", "c", "d", "e"]
+    assert selected(index, {"space": "QA"}) == ["c", "e"]
+    assert selected(index, {"updated": ("2024-02-01", "2024-03-01")}) == ["b", "e"]
+
+
+def test_bitmaps_cover_more_than_one_byte():
+    index = AttributeIndex()
+    for i in range(20):
+        index.add(f"doc{i}", {"author": "张三" if i % 3 == 0 else "李四"})
+    index.merge()
+    assert selected(index, {"author": "张三"}) == [f"doc{i}" for i in range(0, 20, 3)]
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.remove(["b"])
+    index.save(str(tmp_path))
+    assert AttributeIndex.exists(str(tmp_path))
+
+    loaded = AttributeIndex.load(str(tmp_path))
+    assert loaded.doc_ids == ["a", "c", "d"]
+    for filters in ({"space": "QA"}, {"author": "李四"}, {"updated": ("2024-01-01", None)}):
+        assert selected(loaded, filters) == selected(index, filters)
+
+    # 加载后新增的块沿用已有取值编码
+    loaded.add("e", {"space": "QA"})
+    loaded.merge()
+    assert selected(loaded, {"space": "QA"}) == ["a", "c", "e"]
+
+
+def test_filter_key_is_order_independent():
+    assert filter_key(None) is None
+    assert filter_key({}) is None
+    assert filter_key({"space": "QA", "author": ["张三"]}) == filter_key({"author": ["张三"], "space": "QA"})
+    assert filter_key({"space": "QA"}) != filter_key({"space": "DEV"})
+
+
+def test_knowledge_base_search_applies_filters(tmp_path):
+    source = tmp_path / "knowledge"
+    write_files(source, {
+        "qa.md": "---\nspace: QA\nupdated: 2024-01-10\n---\n# 登录\n\n用户登录 测试步骤",
+        "dev.md": "---\nspace: DEV\nupdated: 2024-05-10\n---\n# 登录\n\n用户登录 接口设计",
+        "notes.txt": "用户登录 备忘",
+    })
+    kb = KnowledgeBase(str(source), str(tmp_path / "index"), embeddings=HashEmbeddings())
+
+    hits = kb.search("用户登录", k=3, filters={"space": "QA"})
+    assert [doc.metadata["space"] for doc in hits] == ["QA"]
+    hits = kb.search("用户登录", k=3, filters={"updated": ("2024-03-01", None)})
+    assert [doc.metadata["space"] for doc in hits] == ["DEV"]
+    assert kb.search("用户登录", k=3, filters={"space": "OPS"}) == []
+
+    lexical = kb.lexical_search("登录", filters={"space": ["QA", "DEV"]})
+    assert len(lexical) == 2
+    assert len(kb.lexical_search("登录")) == 3
@@ -0,0 +1,193 @@
+"""
+块存储测试 - 保存与读取、追加写入、压缩、LazyDocstore 的新增与删除，以及旧 pickle 索引的迁移
+"""
+
+import os
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from src.rag.chunk_store import DATA_FILE, ChunkStore, LazyDocstore, PositionalIds
+from src.rag.knowledge_base import KnowledgeBase
+from .conftest import HashEmbeddings, write_files
+
+
+def doc(text: str, **metadata) -> Document:
+    return Document(page_content=text, metadata=metadata)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    """保存了三个块的块存储目录"""
+    path = str(tmp_path / "store")
+    docs = {
+        "id-b": doc("第一块：用户登录", source="login.md", start_index=0),
+        "id-a": doc("第二块：创建订单", source="order.md", start_index=0),
+        "id-c": doc("third chunk", source="notes.txt", tags=["x", "y"]),
+    }
+    ChunkStore.save(path, ["id-b", "id-a", "id-c"], InMemoryDocstore(docs))
+    return path
+
+
+def data_size(path: str) -> int:
+    return os.path.getsize(os.path.join(path, DATA_FILE))
+
+
+def test_save_and_read_back(store_path):
+    store = ChunkStore(store_path)
+    try:
+        assert ChunkStore.exists(store_path)
+        assert len(store) == 3
+        assert [store.id_at(i) for i in range(3)] == ["id-b", "id-a", "id-c"]
+        assert store.id_map() == {0: "id-b", 1: "id-a", 2: "id-c"}
+
+        first = store.document_at(0)
+        assert (first.id, first.page_content) == ("id-b", "第一块：用户登录")
+        assert first.metadata == {"source": "login.md", "start_index": 0}
+        assert store.document_at(2).metadata["tags"] == ["x", "y"]
+
+        assert [store.position_of(chunk_id) for chunk_id in ("id-a", "id-b", "id-c")] == [1, 0, 2]
+        assert store.position_of("id-z") is None
+        assert store.position_of("an-id-longer-than-any-stored") is None
+        assert store.positions_of(["id-c", "missing", "id-b"]).tolist() == [2, -1, 0]
+    finally:
+        store.close()
+
+
+def test_positional_ids_view(store_path):
+    store = ChunkStore(store_path)
+    try:
+        ids = PositionalIds(store)
+        assert len(ids) == 3
+        assert list(ids) == [0, 1, 2]
+        assert ids[1] == "id-a"
+        with pytest.raises(KeyError):
+            ids[3]
+    finally:
+        store.close()
+
+
+def test_lazy_docstore_add_delete_and_search(store_path):
+    docstore = LazyDocstore(ChunkStore(store_path))
+    try:
+        assert docstore.search("id-a").page_content == "第二块：创建订单"
+        assert docstore.search("missing") == "ID missing not found."
+
+        docstore.add({"id-d": doc("新增块")})
+        assert docstore.search("id-d").page_content == "新增块"
+        with pytest.raises(ValueError):
+            docstore.add({"id-d": doc("重复")})
+
+        docstore.delete(["id-a", "id-d"])
+        assert docstore.search("id-a") == "ID id-a not found."
+        assert docstore.search("id-d") == "ID id-d not found."
+        assert "id-d" not in docstore.deleted
+
+        # 删除后重新加入同一个ID
+        docstore.add({"id-a": doc("替换后的第二块")})
+        assert docstore.search("id-a").page_content == "替换后的第二块"
+    finally:
+        docstore.store.close()
+
+
+def test_save_appends_only_new_chunks(store_path):
+    before = data_size(store_path)
+    store = ChunkStore(store_path)
+    old_offsets = store.offsets.copy()
+    docstore = LazyDocstore(store)
+    docstore.add({"id-d": doc("追加的块")})
+    docstore.delete(["id-c"])
+
+    ChunkStore.save(store_path, ["id-b", "id-a", "id-d"], docstore)
+    store.close()
+
+    reopened = ChunkStore(store_path)
+    try:
+        # 已有记录沿用原偏移，数据文件只在末尾追加新记录
+        assert reopened.offsets[:2].tolist() == old_offsets[:2].tolist()
+        assert reopened.offsets[2][0] == before
+        assert data_size(store_path) > before
+        assert [reopened.document_at(i).page_content for i in range(3)] == \
+            ["第一块：用户登录", "第二块：创建订单", "追加的块"]
+        assert reopened.position_of("id-c") is None
+    finally:
+        reopened.close()
+
+
+def test_replaced_chunk_is_rewritten(store_path):
+    store = ChunkStore(store_path)
+    docstore = LazyDocstore(store)
+    docstore.delete(["id-a"])
+    docstore.add({"id-a": doc("新的第二块")})
+    ChunkStore.save(store_path, ["id-b", "id-a", "id-c"], docstore)
+    store.close()
+
+    reopened = ChunkStore(store_path)
+    try:
+        assert reopened.document_at(1).page_content == "新的第二块"
+    finally:
+        reopened.close()
+
+
+def test_save_compacts_when_mostly_garbage(store_path):
+    store = ChunkStore(store_path)
+    docstore = LazyDocstore(store)
+    docstore.delete(["id-b", "id-a"])
+    ChunkStore.save(store_path, ["id-c"], docstore)
+    store.close()
+
+    compacted = ChunkStore(store_path)
+    try:
+        start, end = compacted.offsets[0].tolist()
+        assert (start, end) == (0, data_size(store_path))
+        assert compacted.document_at(0).page_content == "third chunk"
+    finally:
+        compacted.close()
+
+
+def test_compact_preserves_order_and_detects_replaced_file(store_path):
+    store = ChunkStore(store_path)
+    data_path = os.path.join(store_path, DATA_FILE)
+    ChunkStore.compact(store_path)
+    # 压缩替换了数据文件，旧的句柄不能再用于追加
+    assert not store.is_current_file(data_path)
+
+    docstore = LazyDocstore(store)
+    docstore.add({"id-d": doc("压缩后新增")})
+    ChunkStore.save(store_path, ["id-b", "id-a", "id-c", "id-d"], docstore)
+    store.close()
+
+    reopened = ChunkStore(store_path)
+    try:
+        assert [reopened.document_at(i).page_content for i in range(4)] == \
+            ["第一块：用户登录", "第二块：创建订单", "third chunk", "压缩后新增"]
+    finally:
+        reopened.close()
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "empty")
+    ChunkStore.save(path, [], InMemoryDocstore({}))
+    store = ChunkStore(path)
+    try:
+        assert len(store) == 0
+        assert store.position_of("id-a") is None
+        assert store.positions_of(["id-a"]).tolist() == [-1]
+    finally:
+        store.close()
+
+
+def test_pickled_docstore_is_migrated_once(tmp_path):
+    write_files(tmp_path / "knowledge", {"login.txt": "用户登录 输入用户名和密码"})
+    index_path = tmp_path / "index"
+    source = str(tmp_path / "knowledge" / "login.txt")
+    legacy = FAISS.from_documents([doc("用户登录 输入用户名和密码", source=source)], HashEmbeddings())
+    legacy.save_local(str(index_path))
+
+    kb = KnowledgeBase(str(tmp_path / "knowledge"), str(index_path), embeddings=HashEmbeddings())
+    assert ChunkStore.exists(str(index_path))
+    assert not (index_path / "index.pkl").exists()
+    assert (index_path / "index.pkl.bak").exists()
+    assert [hit.page_content for hit in kb.search("用户登录", k=1)] == ["用户登录 输入用户名和密码"]
+    # 旧索引中的源文件仍存在，按已是最新处理，不重新嵌入
+    assert kb.refresh() == {"added": 0, "changed": 0, "removed": 0}
@@ -0,0 +1,119 @@
+"""
+Markdown 切分测试 - frontmatter 元数据、标题路径、起始偏移，以及表格/代码块不被拆开
+"""
+
+from langchain_core.documents import Document
+from src.rag.chunker import MarkdownChunker, parse_frontmatter
+
+PAGE = """---
+title: 登录设计
+id: 12345
+url: https://wiki.example.com/pages/12345
+space: QA
+labels: [auth]
+---
+# 登录
+
+登录页面说明。
+
+## 密码规则
+
+密码至少 8 位。
+
+| 字段 | 规则 |
+| --- | --- |
+| 密码 | 至少 8 位 |
+
+## 锁定策略
+
+```python
+def lock(user):
+
+    user.locked = True
+```
+"""
+
+
+def split(text: str, chunk_size: int = 1000, **metadata):
+    chunker = MarkdownChunker(chunk_size=chunk_size, chunk_overlap=10)
+    return chunker.split_documents([Document(page_content=text, metadata=dict(metadata))])
+
+
+def test_parse_frontmatter():
+    meta, body = parse_frontmatter(PAGE)
+    assert meta["title"] == "登录设计"
+    assert meta["id"] == 12345
+    assert PAGE[body:].startswith("# 登录")
+
+    assert parse_frontmatter("# 没有 frontmatter") == ({}, 0)
+    assert parse_frontmatter("---\n未闭合的 frontmatter") == ({}, 0)
+    assert parse_frontmatter("---\n- 列表\n---\n正文") == ({}, 0)
+    assert parse_frontmatter("---\ntitle: [未闭合\n---\n正文") == ({}, 0)
+
+
+def test_frontmatter_fields_are_copied_into_every_chunk():
+    chunks = split(PAGE, source="login.md")
+    assert len(chunks) == 3
+    for chunk in chunks:
+        assert chunk.metadata["source"] == "login.md"
+        assert chunk.metadata["title"] == "登录设计"
+        assert chunk.metadata["id"] == "12345"
+        assert chunk.metadata["url"] == "https://wiki.example.com/pages/12345"
+        assert chunk.metadata["space"] == "QA"
+        # 不在 FRONTMATTER_FIELDS 中的字段不写入
+        assert "labels" not in chunk.metadata
+    assert all("title:" not in chunk.page_content for chunk in chunks)
+
+
+def test_chunks_follow_headings_and_record_section():
+    chunks = split(PAGE)
+    assert [chunk.metadata["section"] for chunk in chunks] == ["登录", "登录 > 密码规则", "登录 > 锁定策略"]
+    assert chunks[0].page_content == "# 登录\n\n登录页面说明。"
+    for chunk in chunks:
+        start = chunk.metadata["start_index"]
+        assert PAGE[start:start + len(chunk.page_content)] == chunk.page_content
+
+
+def test_tables_and_code_blocks_stay_whole():
+    chunks = split(PAGE)
+    assert "| --- | --- |\n| 密码 | 至少 8 位 |" in chunks[1].page_content
+    # 代码块中的空行和 # 注释不会被当作段落或标题
+    assert chunks[2].page_content.endswith("```python\ndef lock(user):\n\n    user.locked = True\n```")
+
+
+def test_heading_without_body_joins_next_section():
+    chunks = split("# 概述\n\n## 背景\n\n正文内容。\n")
+    assert len(chunks) == 1
+    assert chunks[0].page_content == "# 概述\n\n## 背景\n\n正文内容。"
+    assert chunks[0].metadata["section"] == "概述 > 背景"
+
+
+def test_deep_headings_split_only_when_chunk_is_long_enough():
+    text = "## 章节\n\n短段落。\n\n### 小节\n\n小节正文。\n"
+    assert len(split(text)) == 1
+    assert len(split(text, chunk_size=30)) == 2
+
+
+def test_long_block_is_split_at_sentence_ends():
+    sentence = "这是一句测试用的句子。"
+    text = "# 长段落\n\n" + sentence * 20
+    chunks = split(text, chunk_size=50)
+    assert len(chunks) > 2
+    assert all(len(chunk.page_content) <= 50 for chunk in chunks)
+    assert all(chunk.page_content.endswith("。") for chunk in chunks[1:])
+    assert "".join(chunk.page_content for chunk in chunks[1:]) == sentence * 20
+
+
+def test_long_table_is_split_by_rows():
+    rows = "".join(f"| 用例{i:02d} | 通过 |\n" for i in range(20))
+    chunks = split("| 用例 | 结果 |\n| --- | --- |\n" + rows, chunk_size=80)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert all(line.startswith("|") and line.endswith("|") for line in chunk.page_content.splitlines())
+
+
+def test_unbreakable_text_is_cut_with_overlap():
+    text = "字" * 120
+    chunks = split(text, chunk_size=50)
+    assert [chunk.metadata["start_index"] for chunk in chunks] == [0, 40, 80]
+    assert [len(chunk.page_content) for chunk in chunks] == [50, 50, 40]
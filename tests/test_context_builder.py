@@ -0,0 +1,84 @@
+"""
+上下文组装测试 - 相邻块合并、近似重复去除与 token 预算
+"""
+
+from langchain_core.documents import Document
+from src.rag.context_builder import ContextBuilder, estimate_tokens
+
+TEXT = "第一段介绍登录流程。" * 3 + "第二段介绍密码规则。" * 3 + "第三段介绍锁定策略。" * 3
+
+
+def chunk(start: int, end: int, source: str = "login.md") -> Document:
+    return Document(page_content=TEXT[start:end], metadata={"source": source, "start_index": start})
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("登录") == 2
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("登录 abcdefgh") == 2 + 3
+
+
+def test_overlapping_and_adjacent_chunks_are_merged():
+    builder = ContextBuilder(token_budget=1000)
+    # 重叠（切分时的 chunk_overlap）与首尾相接的块按原文顺序合并，检索顺序无关
+    docs = [chunk(30, 70), chunk(0, 40), chunk(70, 90)]
+    assert builder.build(docs) == TEXT[0:90]
+
+
+def test_chunks_from_other_sources_or_far_apart_stay_separate():
+    builder = ContextBuilder(token_budget=1000, separator="\n---\n")
+    docs = [chunk(0, 20), chunk(60, 90), chunk(20, 40, source="other.md")]
+    assert builder.build(docs).split("\n---\n") == [TEXT[0:20], TEXT[60:90], TEXT[20:40]]
+
+
+def test_merged_group_keeps_best_rank():
+    builder = ContextBuilder(token_budget=1000, separator="|")
+    docs = [chunk(60, 90), chunk(0, 20, source="other.md"), chunk(40, 61)]
+    assert builder.build(docs).split("|") == [TEXT[40:90], TEXT[0:20]]
+
+
+def test_chunks_bridged_by_a_later_chunk_are_merged():
+    builder = ContextBuilder(token_budget=1000)
+    assert builder.build([chunk(0, 30), chunk(60, 90), chunk(25, 65)]) == TEXT[0:90]
+
+
+def test_near_duplicates_are_dropped():
+    builder = ContextBuilder(token_budget=1000, dedupe_threshold=0.8, separator="|")
+    original = ("订单提交后系统生成订单号并发送确认邮件给用户，用户可以在订单列表查看状态，"
+                "支付完成后订单状态变为待发货，仓库拣货出库后变为已发货，用户签收后订单完成。")
+    docs = [
+        Document(page_content=original, metadata={"source": "a.md"}),
+        # 另一份文档里几乎相同的段落，只有结尾不同
+        Document(page_content=original[:-1] + "，可申请售后。", metadata={"source": "b.md"}),
+        Document(page_content="退款申请需要在七天内提交。", metadata={"source": "c.md"}),
+    ]
+    assert builder.build(docs).split("|") == [original, "退款申请需要在七天内提交。"]
+
+    strict = ContextBuilder(token_budget=1000, dedupe_threshold=1.0)
+    assert len(strict.build(docs).split("\n\n")) == 3
+
+
+def test_budget_drops_lower_ranked_groups():
+    first, second, third = "甲" * 40, "乙" * 40, "丙" * 10
+    docs = [Document(page_content=text) for text in (first, second, third)]
+    builder = ContextBuilder(token_budget=60, separator="\n\n")
+    # 第二段放不下时跳过，仍尝试放入更短的第三段
+    assert builder.build(docs) == first + "\n\n" + third
+    assert estimate_tokens(builder.build(docs)) <= 60
+    assert builder.build(docs, token_budget=200) == "\n\n".join((first, second, third))
+
+
+def test_top_group_is_truncated_when_it_alone_exceeds_budget():
+    builder = ContextBuilder(token_budget=10)
+    context = builder.build([Document(page_content="登" * 50), Document(page_content="短")])
+    assert context == "登" * 10
+
+
+def test_stats_reports_savings():
+    builder = ContextBuilder(token_budget=1000)
+    docs = [chunk(0, 40), chunk(30, 70)]
+    stats = builder.stats(docs)
+    assert stats["raw_tokens"] == 80
+    assert stats["context_tokens"] == 70
+    assert stats["budget"] == 1000
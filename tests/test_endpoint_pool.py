@@ -0,0 +1,112 @@
+"""
+节点池测试 - 按在途请求数路由、失败换节点、不健康节点的摘除与恢复
+"""
+
+import threading
+import pytest
+from src.config.settings import Settings
+from src.utils.endpoint_pool import EndpointPool
+from .conftest import MODEL, wait_until
+
+
+def test_acquire_prefers_least_outstanding():
+    urls = ["http://node-a", "http://node-b", "http://node-c"]
+    pool = EndpointPool(urls, MODEL, Settings(), health_interval=0)
+    a, b, c = pool.endpoints
+
+    with pool.lease(a), pool.lease(a), pool.lease(b):
+        assert {pool.acquire().url for _ in range(6)} == {c.url}
+        with pool.lease(c):
+            # b 与 c 各有一个在途请求，a 有两个
+            assert {pool.acquire().url for _ in range(6)} == {b.url, c.url}
+    assert a.outstanding == b.outstanding == c.outstanding == 0
+
+
+def test_acquire_avoids_failed_nodes_while_others_are_available():
+    pool = EndpointPool(["http://node-a", "http://node-b"], MODEL, Settings(), health_interval=0)
+    assert {pool.acquire(exclude={"http://node-a"}).url for _ in range(4)} == {"http://node-b"}
+    # 全部失败过时仍返回一个节点
+    assert pool.acquire(exclude={"http://node-a", "http://node-b"}) in pool.endpoints
+
+
+def test_concurrent_requests_spread_across_nodes(ollama, make_client):
+    stubs = ollama(2)
+    client = make_client(stubs)
+    for stub in stubs:
+        stub.gate.clear()
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(client.generate("第一个问题")))
+    first.start()
+    wait_until(lambda: sum(stub.chat_calls for stub in stubs) == 1)
+    second = threading.Thread(target=lambda: results.append(client.generate("第二个问题")))
+    second.start()
+    wait_until(lambda: sum(stub.chat_calls for stub in stubs) == 2)
+
+    # 第一个请求还在节点上时，第二个请求分配到了空闲节点
+    assert [stub.chat_calls for stub in stubs] == [1, 1]
+    for stub in stubs:
+        stub.gate.set()
+    first.join(5)
+    second.join(5)
+    assert results == ["你好，世界", "你好，世界"]
+
+
+def test_failed_request_fails_over_to_another_node(ollama, make_client):
+    broken, healthy = ollama(2)
+    broken.fail = 100
+    client = make_client([broken, healthy])
+
+    assert [client.generate(f"问题 {i}") for i in range(4)] == ["你好，世界"] * 4
+    assert broken.chat_calls >= 1
+    assert healthy.chat_calls == 4
+
+
+def test_streaming_fails_over_before_first_chunk(ollama, make_client):
+    broken, healthy = ollama(2)
+    broken.fail = 100
+    client = make_client([broken, healthy])
+
+    for i in range(4):
+        stream = client.stream(f"问题 {i}")
+        assert "".join(stream) == "你好，世界"
+        assert stream.stats["eval_count"] == 3
+    assert broken.chat_calls >= 1
+
+
+@pytest.mark.parametrize("breakage", ["missing_model", "tags_error"])
+def test_unhealthy_node_is_ejected_and_readmitted(ollama, make_client, breakage):
+    sick, healthy = ollama(2)
+    client = make_client([sick, healthy])
+    pool = client.pool
+    if breakage == "missing_model":
+        sick.has_model = False
+    else:
+        sick.tags_status = 500
+
+    assert pool.check_health() == {sick.url: False, healthy.url: True}
+    assert {pool.acquire().url for _ in range(6)} == {healthy.url}
+    for i in range(3):
+        client.generate(f"问题 {i}")
+    assert sick.chat_calls == 0
+    assert pool.snapshot()[0]["healthy"] is False
+
+    sick.has_model = True
+    sick.tags_status = 200
+    assert pool.check_health() == {sick.url: True, healthy.url: True}
+    assert {pool.acquire().url for _ in range(6)} == {sick.url, healthy.url}
+
+
+def test_health_check_closes_breaker_of_recovered_node(ollama, make_client):
+    sick, healthy = ollama(2)
+    client = make_client([sick, healthy], LLM_BREAKER_THRESHOLD=1)
+    sick.fail = 100
+    for i in range(4):
+        client.generate(f"问题 {i}")
+    sick_endpoint = client.pool.endpoints[0]
+    assert sick_endpoint.breaker.state == "open"
+
+    sick.fail = 0
+    client.pool.check_health()
+    assert sick_endpoint.breaker.state == "closed"
+    assert {client.pool.acquire().url for _ in range(6)} == {sick.url, healthy.url}
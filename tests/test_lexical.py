@@ -0,0 +1,114 @@
+"""
+词法检索测试 - 分词、BM25 索引的新增/删除/保存，以及与向量检索的倒数排名融合
+"""
+
+import numpy as np
+import pytest
+from src.rag import knowledge_base as knowledge_base_module
+from src.rag.lexical import LexicalIndex, tokenize
+from src.rag.retriever import Retriever, reciprocal_rank_fusion
+from .conftest import HashEmbeddings, write_files
+
+
+def test_tokenize_keeps_identifiers_and_splits_cjk():
+    tokens = tokenize("调用 /api/v1/users 返回 ERR_500")
+    assert "/api/v1/users" not in tokens  # 开头的斜杠不属于标识符
+    assert {"api/v1/users", "api", "v1", "users", "err_500", "err", "500"} <= set(tokens)
+    assert {"调", "用", "调用", "返回"} <= set(tokens)
+    assert tokenize("ＡＢＣ－１２３") == ["abc-123", "abc", "123"]
+
+
+@pytest.fixture
+def index():
+    index = LexicalIndex()
+    index.add("login", "用户登录 输入用户名和密码")
+    index.add("order", "创建订单 提交订单 订单号")
+    index.add("error", "支付失败时返回 ERR_500 错误码")
+    index.merge()
+    return index
+
+
+def test_search_ranks_by_bm25(index):
+    assert [chunk_id for chunk_id, _ in index.search("订单")] == ["order"]
+    assert index.search("err_500")[0][0] == "error"
+    hits = index.search("登录 订单")
+    assert {chunk_id for chunk_id, _ in hits} == {"login", "order"}
+    assert all(score > 0 for _, score in hits)
+    assert index.search("不存在的词汇") == []
+
+
+def test_search_respects_k_and_doc_mask(index):
+    assert len(index.search("订单 登录 支付", k=2)) == 2
+    mask = np.array([chunk_id != "order" for chunk_id in index.doc_ids])
+    assert [chunk_id for chunk_id, _ in index.search("订单 登录", doc_mask=mask)] == ["login"]
+
+
+def test_remove_hides_documents_until_merged(index):
+    index.remove(["order"])
+    assert index.search("订单") == []
+    assert len(index) == 2
+
+    # 还未合并的块删除时直接丢弃
+    index.add("refund", "申请退款")
+    index.remove(["refund"])
+    index.merge()
+    assert index.doc_ids == ["login", "error"]
+    assert index.search("退款") == []
+    assert index.search("登录")[0][0] == "login"
+
+
+def test_added_documents_are_searchable_after_merge(index):
+    index.add("refund", "申请退款 退款原因")
+    assert index.search("退款") == []
+    index.merge()
+    assert [chunk_id for chunk_id, _ in index.search("退款")] == ["refund"]
+    assert index.search("订单")[0][0] == "order"
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.remove(["login"])
+    index.add("refund", "申请退款")
+    index.save(str(tmp_path))
+    assert LexicalIndex.exists(str(tmp_path))
+
+    loaded = LexicalIndex.load(str(tmp_path))
+    assert loaded.doc_ids == ["order", "error", "refund"]
+    for query in ("订单", "退款", "err_500", "登录"):
+        assert loaded.search(query) == index.search(query)
+
+    # 加载后的索引仍可继续增删
+    loaded.add("search", "搜索商品")
+    loaded.remove(["order"])
+    loaded.merge()
+    assert loaded.doc_ids == ["error", "refund", "search"]
+    assert loaded.search("搜索")[0][0] == "search"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]], k=60)
+    # a：1/61 + 1/63，c：1/63 + 1/61，并列时保持先出现的顺序
+    assert fused[:2] == ["a", "c"]
+    assert set(fused[2:]) == {"b", "d"}
+    assert reciprocal_rank_fusion([["x", "y"], []]) == ["x", "y"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_hybrid_retrieval_finds_exact_identifier(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base_module, "get_knowledge_embeddings", lambda settings: HashEmbeddings())
+    monkeypatch.setenv("QUERY_CACHE_SIZE", "0")
+    source = tmp_path / "knowledge"
+    files = {f"note{i}.txt": f"支付网关 第{i}条 超时 重试 记录" for i in range(8)}
+    files["error.txt"] = "JIRA-4321 支付网关"
+    write_files(source, files)
+    monkeypatch.chdir(tmp_path)
+
+    retriever = Retriever(str(source))
+    assert retriever.knowledge_base.vector_store.index.ntotal == 9
+    docs = retriever.retrieve("JIRA-4321 的处理记录", k=3)
+    assert "JIRA-4321 支付网关" in [doc.page_content for doc in docs]
+
+    monkeypatch.setenv("RETRIEVAL_MODE", "vector")
+    vector_only = Retriever(str(source))
+    # 只用向量检索时，问题编号被其他共享词淹没
+    docs = vector_only.retrieve("JIRA-4321 的处理记录", k=3)
+    assert "JIRA-4321 支付网关" not in [doc.page_content for doc in docs]
@@ -0,0 +1,140 @@
+"""
+索引清单与增量更新测试 - 新增、修改、删除文件的识别，以及只重新嵌入变化的文件
+"""
+
+import os
+import pytest
+from src.rag import manifest as manifest_module
+from src.rag.knowledge_base import KnowledgeBase
+from src.rag.manifest import IndexManifest
+from .conftest import HashEmbeddings, write_files
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    """记录 hash_file 读取过的文件"""
+    calls = []
+    original = manifest_module.hash_file
+
+    def counting(path, *args, **kwargs):
+        calls.append(os.path.basename(path))
+        return original(path, *args, **kwargs)
+
+    monkeypatch.setattr(manifest_module, "hash_file", counting)
+    return calls
+
+
+def touch_later(path, seconds: float = 10) -> None:
+    """把文件的修改时间推后，模拟文件被重新写入"""
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + seconds))
+
+
+def recorded(root, names):
+    manifest = IndexManifest(str(root))
+    for name in names:
+        manifest.record(str(root / name), [f"{name}-0"])
+    return manifest
+
+
+def test_diff_reports_added_changed_and_removed(tmp_path):
+    write_files(tmp_path, {"keep.txt": "不变", "grow.txt": "短", "same_size.txt": "甲乙", "gone.txt": "删除"})
+    manifest = recorded(tmp_path, ["keep.txt", "grow.txt", "same_size.txt", "gone.txt"])
+
+    write_files(tmp_path, {"grow.txt": "变长了的内容", "same_size.txt": "丙丁", "new.txt": "新增"})
+    touch_later(tmp_path / "same_size.txt")
+    os.remove(tmp_path / "gone.txt")
+    paths = [str(tmp_path / name) for name in ("keep.txt", "grow.txt", "same_size.txt", "new.txt")]
+
+    added, changed, removed = manifest.diff(paths)
+    assert [os.path.basename(path) for path in added] == ["new.txt"]
+    assert sorted(os.path.basename(path) for path in changed) == ["grow.txt", "same_size.txt"]
+    assert removed == ["gone.txt"]
+
+
+def test_touched_file_only_updates_mtime(tmp_path):
+    write_files(tmp_path, {"a.txt": "内容"})
+    manifest = recorded(tmp_path, ["a.txt"])
+    touch_later(tmp_path / "a.txt")
+
+    assert manifest.diff([str(tmp_path / "a.txt")]) == ([], [], [])
+    assert manifest.files["a.txt"]["mtime"] == os.stat(tmp_path / "a.txt").st_mtime
+
+
+def test_manifest_round_trips(tmp_path):
+    write_files(tmp_path, {"docs/a.md": "# 标题"})
+    manifest = recorded(tmp_path, ["docs/a.md"])
+    manifest.index_spec, manifest.requested_spec = "Flat", "IVF256,Flat"
+    manifest.save(str(tmp_path / "index"))
+
+    loaded = IndexManifest.load(str(tmp_path / "index"), str(tmp_path))
+    assert loaded.files == manifest.files
+    assert loaded.version == manifest.version
+    assert (loaded.index_spec, loaded.requested_spec) == ("Flat", "IVF256,Flat")
+    assert loaded.chunk_ids("docs/a.md") == ["docs/a.md-0"]
+    assert IndexManifest.load(str(tmp_path / "missing"), str(tmp_path)) is None
+
+
+def test_record_reuses_digest_computed_by_diff(tmp_path, hash_calls):
+    write_files(tmp_path, {"a.txt": "甲乙"})
+    manifest = recorded(tmp_path, ["a.txt"])
+    write_files(tmp_path, {"a.txt": "丙丁"})
+    touch_later(tmp_path / "a.txt")
+    path = str(tmp_path / "a.txt")
+    hash_calls.clear()
+
+    assert manifest.diff([path])[1] == [path]
+    manifest.record(path, ["a-1"], manifest.digests.pop(path, None))
+    assert hash_calls == ["a.txt"]
+    assert manifest.files["a.txt"]["sha256"] == manifest_module.hash_file(path)
+
+
+@pytest.fixture
+def knowledge(tmp_path):
+    source = tmp_path / "knowledge"
+    write_files(source, {
+        "login.txt": "用户登录 输入用户名和密码 点击登录按钮",
+        "order.txt": "创建订单 选择商品 提交订单",
+        "docs/refund.md": "# 退款\n\n申请退款 填写退款原因",
+    })
+    return source
+
+
+def make_kb(tmp_path, source, embeddings=None) -> KnowledgeBase:
+    return KnowledgeBase(str(source), str(tmp_path / "index"), embeddings=embeddings or HashEmbeddings())
+
+
+def test_refresh_reembeds_only_changed_files(tmp_path, knowledge, hash_calls):
+    embeddings = HashEmbeddings()
+    kb = make_kb(tmp_path, knowledge, embeddings)
+    assert kb.vector_store.index.ntotal == 3
+    version = kb.index_version
+
+    write_files(knowledge, {"order.txt": "创建订单 选择赠品 提交订单", "search.txt": "搜索商品 按关键字过滤"})
+    touch_later(knowledge / "order.txt")
+    os.remove(knowledge / "docs" / "refund.md")
+    embeddings.calls = 0
+    hash_calls.clear()
+
+    assert kb.refresh() == {"added": 1, "changed": 1, "removed": 1}
+    assert embeddings.calls == 2
+    # 修改文件大小不变，diff 算过一次哈希，记录时不再读取
+    assert hash_calls.count("order.txt") == 1
+    assert kb.index_version != version
+    assert sorted(kb.manifest.files) == ["login.txt", "order.txt", "search.txt"]
+    assert kb.vector_store.index.ntotal == 3
+    assert [doc.page_content for doc in kb.search("选择赠品", k=1)] == ["创建订单 选择赠品 提交订单"]
+    assert kb.lexical_search("退款") == []
+
+    assert kb.refresh() == {"added": 0, "changed": 0, "removed": 0}
+
+
+def test_reload_picks_up_changes_made_while_stopped(tmp_path, knowledge):
+    make_kb(tmp_path, knowledge)
+    write_files(knowledge, {"login.txt": "用户登录 支持短信验证码"})
+
+    embeddings = HashEmbeddings()
+    kb = make_kb(tmp_path, knowledge, embeddings)
+    assert embeddings.calls == 1
+    assert kb.vector_store.index.ntotal == 3
+    assert [doc.page_content for doc in kb.search("短信验证码", k=1)] == ["用户登录 支持短信验证码"]
@@ -0,0 +1,227 @@
+"""
+容错测试 - 熔断器的打开与半开探测、可重试与不可重试错误、未预期异常与放弃的请求的熔断计数、生成器把错误与结果分开返回
+"""
+
+import asyncio
+import time
+import pytest
+from src.utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LlamaConnectionError,
+    LlamaHTTPError,
+    LlamaUnexpectedError,
+)
+from .conftest import wait_until
+
+
+def test_breaker_opens_after_consecutive_transient_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(LlamaConnectionError("refused"))
+    assert breaker.state == "closed"
+
+    breaker.before_call()
+    breaker.record(LlamaConnectionError("refused"))
+    assert breaker.state == "open"
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record(LlamaConnectionError("refused"))
+    breaker.record()
+    breaker.record(LlamaConnectionError("refused"))
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_opens_for_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record(LlamaHTTPError(503))
+    assert breaker.state == "open"
+    time.sleep(0.06)
+
+    assert breaker.available()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # 探测请求在途时其他请求仍然快速失败
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # 探测失败重新打开，再次到期后探测成功则关闭
+    breaker.record(LlamaHTTPError(503))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_non_transient_errors_do_not_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(LlamaHTTPError(404, "model not found"))
+    assert breaker.state == "closed"
+
+
+def test_released_probe_is_neither_success_nor_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record(LlamaHTTPError(503))
+    time.sleep(0.06)
+    breaker.before_call()
+    assert not breaker.available()
+
+    # 探测请求被放弃：保持半开，下一个请求继续探测
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.failures == 1
+    breaker.before_call()
+    breaker.record()
+    assert breaker.state == "closed"
+
+
+def boom(*args, **kwargs):
+    raise RuntimeError("boom")
+
+
+def test_unexpected_exceptions_count_as_failures(ollama, make_client, monkeypatch):
+    stub, = ollama(1)
+    client = make_client([stub], LLM_BREAKER_THRESHOLD=3, LLM_MAX_RETRIES=0)
+    monkeypatch.setattr(client, "_parse_stats", boom)
+    breaker = client.pool.endpoints[0].breaker
+
+    with pytest.raises(LlamaUnexpectedError) as excinfo:
+        client.generate("你好")
+    assert isinstance(excinfo.value.__cause__, RuntimeError)
+    assert excinfo.value.endpoint == stub.url
+    assert breaker.failures == 1
+
+    with pytest.raises(LlamaUnexpectedError):
+        "".join(client.stream("你好"))
+    assert breaker.failures == 2
+
+
+def test_async_unexpected_exceptions_count_as_failures(ollama, make_client, monkeypatch):
+    from src.utils.llama_client import AsyncLlamaClient
+
+    stub, = ollama(1)
+    make_client([stub], LLM_BREAKER_THRESHOLD=3, LLM_MAX_RETRIES=0)
+    client = AsyncLlamaClient()
+    monkeypatch.setattr(client.client, "post", boom)
+    monkeypatch.setattr(client.client, "stream", boom)
+    breaker = client.pool.endpoints[0].breaker
+
+    async def run():
+        with pytest.raises(LlamaUnexpectedError):
+            await client.agenerate("你好")
+        chunks = [chunk async for chunk in client.astream_content("你好")]
+        await client.client.aclose()
+        return chunks
+
+    assert "boom" in "".join(asyncio.run(run()))
+    assert breaker.failures == 2
+    assert stub.chat_calls == 0
+
+
+def test_abandoned_stream_is_not_recorded_as_success(ollama, make_client):
+    stub, = ollama(1)
+    stub.fail = 1
+    client = make_client([stub], LLM_MAX_RETRIES=0)
+    breaker = client.pool.endpoints[0].breaker
+    with pytest.raises(LlamaHTTPError):
+        client.generate("你好")
+    assert breaker.failures == 1
+
+    stub.reply = "字" * 200
+    stub.chunk_delay = 0.01
+    stream = client.stream("写一篇长文")
+    assert next(iter(stream)) == "字"
+    stream.close()
+    wait_until(lambda: client.scheduler.metrics()["running"] == 0)
+    # 结果未知，不清零此前的失败计数
+    assert breaker.failures == 1
+
+
+def test_transient_status_is_retried(ollama, make_client):
+    stub, = ollama(1)
+    stub.fail = 2
+    client = make_client([stub])
+
+    assert client.generate("你好") == "你好，世界"
+    assert stub.chat_calls == 3
+
+
+def test_not_found_is_not_retried(ollama, make_client):
+    stub, = ollama(1)
+    stub.fail = 100
+    stub.status = 404
+    client = make_client([stub])
+
+    with pytest.raises(LlamaHTTPError) as excinfo:
+        client.generate("你好")
+    assert excinfo.value.status_code == 404
+    assert not excinfo.value.transient
+    assert stub.chat_calls == 1
+    assert client.pool.endpoints[0].breaker.state == "closed"
+
+
+def test_not_found_is_not_retried_on_another_node(ollama, make_client):
+    stubs = ollama(2)
+    for stub in stubs:
+        stub.fail = 100
+        stub.status = 404
+    client = make_client(stubs)
+
+    with pytest.raises(LlamaHTTPError):
+        client.generate("你好")
+    assert sum(stub.chat_calls for stub in stubs) == 1
+
+
+def test_client_fails_fast_while_breaker_is_open_and_recovers_after_probe(ollama, make_client):
+    stub, = ollama(1)
+    stub.fail = 100
+    client = make_client([stub], LLM_BREAKER_THRESHOLD=2, LLM_BREAKER_RESET=0.2, LLM_MAX_RETRIES=0)
+
+    for _ in range(2):
+        with pytest.raises(LlamaHTTPError):
+            client.generate("你好")
+    with pytest.raises(CircuitOpenError):
+        client.generate("你好")
+    assert stub.chat_calls == 2
+    assert "暂不可用" in client.generate_content("你好")
+
+    stub.fail = 0
+    time.sleep(0.25)
+    assert client.generate("你好") == "你好，世界"
+    assert client.pool.endpoints[0].breaker.state == "closed"
+    assert stub.chat_calls == 3
+
+
+def test_generator_reports_errors_separately_from_results(ollama, make_client):
+    from src.generators.test_case_generator import TestCaseGenerator
+
+    stub, = ollama(1)
+    stub.fail = 100
+    stub.status = 404
+    make_client([stub])
+    generator = TestCaseGenerator()
+
+    for test_cases, error in (
+        generator.generate_from_description("用户登录"),
+        generator.generate_api_test_cases({"path": "/login", "method": "POST"}),
+        generator.generate_automation_code("用例：输入正确密码后登录成功"),
+    ):
+        # 错误说明不会被当作测试用例或代码返回
+        assert test_cases == ""
+        assert "404" in error
+
+    stub.fail = 0
+    assert generator.generate_from_description("用户登录") == ("你好，世界", None)
@@ -0,0 +1,129 @@
+"""
+响应缓存测试 - 精确命中与未命中、按问题和检索上下文的语义匹配、客户端按调用读写缓存，以及语义缓存与知识库共用嵌入模型
+"""
+
+import hashlib
+import numpy as np
+from src.rag import knowledge_base
+from src.utils.response_cache import CacheHint, ResponseCache
+from .conftest import HashEmbeddings, write_files
+
+
+def payload(content: str, system: str = "你是测试助手") -> dict:
+    return {
+        "model": "test-model",
+        "messages": [{"role": "system", "content": system}, {"role": "user", "content": content}],
+        "options": {"temperature": 0.7},
+    }
+
+
+def bag_of_chars(text: str) -> np.ndarray:
+    """按字符哈希的词袋向量：字符相同的文本相似度高，用于代替嵌入模型"""
+    vector = np.zeros(64, dtype=np.float32)
+    for char in text.strip("？?。 "):
+        vector[int(hashlib.md5(char.encode("utf-8")).hexdigest(), 16) % 64] += 1
+    return vector
+
+
+def test_exact_hit_and_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    assert cache.get(payload("如何登录")) is None
+
+    cache.put(payload("如何登录"), "输入用户名和密码", {"eval_count": 3})
+    assert cache.get(payload("如何登录")) == ("输入用户名和密码", {"eval_count": 3})
+    assert cache.get(payload("如何注销")) is None
+    assert cache.get(payload("如何登录", system="另一个系统提示词")) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path)
+    cache.put(payload("如何登录"), "输入用户名和密码")
+    cache.close()
+    assert ResponseCache(path).get(payload("如何登录")) == ("输入用户名和密码", {})
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), ttl_seconds=60)
+    cache.put(payload("如何登录"), "输入用户名和密码")
+    cache._conn.execute("UPDATE responses SET created = created - 120")
+    assert cache.get(payload("如何登录")) is None
+
+
+def test_semantic_match_uses_question_and_context(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), embed=bag_of_chars, threshold=0.9)
+    context = "登录页面包含用户名、密码输入框和记住我选项。" * 20
+
+    def rag(question: str, ctx: str = context) -> tuple:
+        return payload(f"参考资料：\n{ctx}\n\n问题：{question}"), CacheHint(question, ctx)
+
+    request, hint = rag("如何登录？")
+    cache.put(request, "输入用户名和密码", hint=hint)
+
+    # 措辞不同的同一问题、同一上下文：语义命中
+    assert cache.get(*rag("如何登录")) == ("输入用户名和密码", {})
+    assert cache.semantic_hits == 1
+    # 同一上下文下的不同问题：不命中（整体嵌入时会被上下文淹没而误命中）
+    assert cache.get(*rag("密码忘了怎么重置")) is None
+    # 同一问题、不同上下文：不在同一 scope，不命中
+    assert cache.get(*rag("如何登录", "注册页面需要填写邮箱。")) is None
+
+
+def test_client_reads_and_writes_cache_per_call(ollama, make_client, tmp_path):
+    stub, = ollama(1)
+    client = make_client([stub], LLM_CACHE_PATH=tmp_path / "responses.sqlite")
+
+    assert client.generate("你好") == "你好，世界"
+    assert client.generate("你好") == "你好，世界"
+    assert stub.chat_calls == 1
+
+    # use_cache=False 强制重新生成，也不影响其他调用
+    assert client.generate("你好", use_cache=False) == "你好，世界"
+    assert stub.chat_calls == 2
+    assert client.generate("另一个问题") == "你好，世界"
+    assert stub.chat_calls == 3
+
+
+def test_client_stream_hit_reports_cached_stats(ollama, make_client, tmp_path):
+    stub, = ollama(1)
+    client = make_client([stub], LLM_CACHE_PATH=tmp_path / "responses.sqlite")
+
+    first = client.stream("你好")
+    assert "".join(first) == "你好，世界"
+    assert not first.stats.get("cached")
+
+    second = client.stream("你好")
+    assert "".join(second) == "你好，世界"
+    assert second.stats["cached"] is True
+    assert second.stats["eval_count"] == 3
+    assert stub.chat_calls == 1
+
+
+def test_client_does_not_cache_errors(ollama, make_client, tmp_path):
+    stub, = ollama(1)
+    stub.fail = 1
+    stub.status = 404
+    client = make_client([stub], LLM_CACHE_PATH=tmp_path / "responses.sqlite")
+
+    assert "404" in client.generate_content("你好")
+    assert client.generate_content("你好") == "你好，世界"
+    assert stub.chat_calls == 2
+
+
+def test_semantic_cache_shares_knowledge_base_embeddings(ollama, make_client, tmp_path, monkeypatch):
+    created = []
+
+    def create(settings):
+        created.append(HashEmbeddings())
+        return created[-1]
+
+    monkeypatch.setattr(knowledge_base, "create_knowledge_embeddings", create)
+    write_files(tmp_path / "knowledge", {"login.txt": "用户登录 输入用户名和密码"})
+    kb = knowledge_base.KnowledgeBase(str(tmp_path / "knowledge"), str(tmp_path / "index"))
+    stub, = ollama(1)
+    client = make_client([stub], LLM_CACHE_PATH=tmp_path / "responses.sqlite", LLM_CACHE_SEMANTIC=True)
+
+    assert client._embed_prompt("如何登录") == kb.embeddings.embed_query("如何登录")
+    # 语义缓存没有再加载一份嵌入模型
+    assert created == [kb.embeddings]
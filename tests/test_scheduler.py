@@ -0,0 +1,172 @@
+"""
+调度器测试 - 合并相同请求、交互请求优先于批量任务、为交互请求预留槽位、提前停止的流式任务释放槽位
+"""
+
+import threading
+import time
+from src.utils.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+from .conftest import wait_until
+
+
+def blocking_job(gate: threading.Event, log: list, name: str):
+    def run():
+        gate.wait(5)
+        log.append(name)
+        return name
+    return run
+
+
+def test_identical_requests_are_coalesced():
+    scheduler = RequestScheduler(max_concurrency=2)
+    gate = threading.Event()
+    log = []
+
+    first = scheduler.submit(blocking_job(gate, log, "a"), key="same")
+    second = scheduler.submit(blocking_job(gate, log, "b"), key="same")
+    other = scheduler.submit(blocking_job(gate, log, "c"), key="other")
+    assert first is second
+    gate.set()
+
+    assert first.result(5) == "a"
+    assert other.result(5) == "c"
+    assert sorted(log) == ["a", "c"]
+    metrics = scheduler.metrics()
+    assert metrics["submitted"] == 3
+    assert metrics["coalesced"] == 1
+
+    # 完成后不再合并
+    assert scheduler.run(blocking_job(gate, log, "d"), key="same") == "d"
+
+
+def test_coalesced_interactive_request_promotes_queued_batch_job():
+    scheduler = RequestScheduler(max_concurrency=1, reserved_interactive=0)
+    gate = threading.Event()
+    log = []
+    scheduler.submit(blocking_job(gate, log, "blocker"))
+    wait_until(lambda: scheduler.metrics()["running"] == 1)
+
+    scheduler.submit(blocking_job(gate, log, "batch"), PRIORITY_BATCH)
+    shared = scheduler.submit(blocking_job(gate, log, "shared"), PRIORITY_BATCH, key="k")
+    assert scheduler.submit(blocking_job(gate, log, "dup"), PRIORITY_INTERACTIVE, key="k") is shared
+    gate.set()
+
+    shared.result(5)
+    wait_until(lambda: len(log) == 3)
+    assert log == ["blocker", "shared", "batch"]
+
+
+def test_client_coalesces_identical_generate_calls(ollama, make_client):
+    stub, = ollama(1)
+    stub.gate.clear()
+    client = make_client([stub])
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.generate("同一个问题"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: client.scheduler.metrics()["coalesced"] == 2)
+    stub.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["你好，世界"] * 3
+    assert stub.chat_calls == 1
+
+
+def test_interactive_requests_run_before_queued_batch_work():
+    scheduler = RequestScheduler(max_concurrency=1, reserved_interactive=0)
+    gate = threading.Event()
+    log = []
+    scheduler.submit(blocking_job(gate, log, "blocker"))
+    wait_until(lambda: scheduler.metrics()["running"] == 1)
+
+    batch = [scheduler.submit(blocking_job(gate, log, f"batch-{i}"), PRIORITY_BATCH) for i in range(3)]
+    interactive = scheduler.submit(blocking_job(gate, log, "interactive"), PRIORITY_INTERACTIVE)
+    assert scheduler.metrics()["queued"] == {"batch": 3, "interactive": 1}
+    gate.set()
+
+    interactive.result(5)
+    for future in batch:
+        future.result(5)
+    assert log == ["blocker", "interactive", "batch-0", "batch-1", "batch-2"]
+
+
+def test_batch_work_leaves_a_slot_for_interactive_requests():
+    scheduler = RequestScheduler(max_concurrency=2, reserved_interactive=1)
+    batch_gate = threading.Event()
+    log = []
+    batch = [scheduler.submit(blocking_job(batch_gate, log, f"batch-{i}"), PRIORITY_BATCH) for i in range(3)]
+    wait_until(lambda: scheduler.metrics()["running_batch"] == 1)
+
+    # 批量任务仍在生成时，交互请求使用预留的槽位立即完成
+    interactive = scheduler.submit(lambda: log.append("interactive") or "done", PRIORITY_INTERACTIVE)
+    assert interactive.result(5) == "done"
+    assert log == ["interactive"]
+    assert scheduler.metrics()["running_batch"] == 1
+
+    batch_gate.set()
+    for future in batch:
+        future.result(5)
+    assert log[1:] == ["batch-0", "batch-1", "batch-2"]
+
+
+def test_failures_propagate_to_every_coalesced_caller():
+    scheduler = RequestScheduler(max_concurrency=1)
+    gate = threading.Event()
+
+    def fail():
+        gate.wait(5)
+        raise RuntimeError("boom")
+
+    first = scheduler.submit(fail, key="k")
+    second = scheduler.submit(fail, key="k")
+    gate.set()
+    for future in (first, second):
+        assert isinstance(future.exception(5), RuntimeError)
+    assert scheduler.metrics()["failed"] == 1
+
+
+def test_abandoned_stream_stops_pump_and_frees_slot():
+    scheduler = RequestScheduler(max_concurrency=1)
+    produced = []
+    closed = threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                time.sleep(0.005)
+                yield i
+        finally:
+            closed.set()
+
+    stream = scheduler.stream(source)
+    assert next(stream) == 0
+    stream.close()
+
+    assert closed.wait(5)
+    wait_until(lambda: scheduler.metrics()["running"] == 0)
+    assert len(produced) < 1000
+    # 槽位已释放，后续任务可以立即运行
+    assert scheduler.run(lambda: "next") == "next"
+
+
+def test_client_stream_closed_early_releases_connection(ollama, make_client):
+    stub, = ollama(1)
+    stub.reply = "字" * 500
+    stub.chunk_delay = 0.01
+    client = make_client([stub])
+
+    stream = client.stream("写一篇长文")
+    assert next(iter(stream)) == "字"
+    stream.close()
+
+    wait_until(lambda: client.scheduler.metrics()["running"] == 0, timeout=2)
+    assert client.pool.endpoints[0].outstanding == 0
+    # 连接已关闭，替身节点不再继续写出剩余分段
+    streamed = stub.streamed
+    time.sleep(0.2)
+    assert stub.streamed - streamed <= 2
+    assert stub.streamed < 500
+    stub.chunk_delay = 0
+    assert "".join(client.stream("你好")) == "字" * 500
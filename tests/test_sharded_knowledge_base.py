@@ -0,0 +1,127 @@
+"""
+分片知识库测试 - 子目录与根目录默认分片的发现、并行检索结果的合并，以及单个分片的刷新
+"""
+
+import os
+import pytest
+from src.rag import sharded_knowledge_base as sharded_module
+from src.rag.knowledge_base import EmptyKnowledgeBaseError
+from src.rag.sharded_knowledge_base import ROOT_SHARD, ShardedKnowledgeBase, discover_shards
+from .conftest import HashEmbeddings, write_files
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = HashEmbeddings()
+    monkeypatch.setattr(sharded_module, "get_knowledge_embeddings", lambda settings: embeddings)
+    return embeddings
+
+
+@pytest.fixture
+def knowledge(tmp_path):
+    source = tmp_path / "knowledge"
+    write_files(source, {
+        "readme.txt": "知识库说明 目录结构",
+        "QA/login.txt": "用户登录 测试用例 密码错误",
+        "QA/cases/order.txt": "创建订单 测试用例 库存不足",
+        "DEV/login.md": "# 登录接口\n\n用户登录 接口 返回令牌",
+        "EMPTY/image.png": "不是文本",
+        ".hidden/secret.txt": "隐藏目录",
+    })
+    return source
+
+
+def make_kb(tmp_path, source, **kwargs) -> ShardedKnowledgeBase:
+    return ShardedKnowledgeBase(str(source), str(tmp_path / "index"), **kwargs)
+
+
+def test_discover_shards(knowledge, tmp_path):
+    assert discover_shards(str(knowledge)) == [ROOT_SHARD, "DEV", "EMPTY", "QA"]
+    os.remove(knowledge / "readme.txt")
+    assert discover_shards(str(knowledge)) == ["DEV", "EMPTY", "QA"]
+
+
+def test_shards_are_indexed_separately(tmp_path, knowledge, embeddings):
+    kb = make_kb(tmp_path, knowledge)
+    # 没有可索引文档的分片被跳过
+    assert list(kb.shards) == [ROOT_SHARD, "DEV", "QA"]
+    assert kb.shards["QA"].vector_store.index.ntotal == 2
+    assert kb.shards["DEV"].vector_store.index.ntotal == 1
+    # 根目录分片只包含根目录下的文件，索引位于 vector_store_path 本身
+    assert kb.shards[ROOT_SHARD].vector_store.index.ntotal == 1
+    assert kb.shards[ROOT_SHARD].vector_store_path == str(tmp_path / "index")
+    assert kb.shards["QA"].vector_store_path == os.path.join(str(tmp_path / "index"), "QA")
+    # 各分片共用同一个嵌入模型
+    assert all(shard.embeddings is embeddings for shard in kb.shards.values())
+
+
+def test_search_merges_hits_from_all_shards(tmp_path, knowledge, embeddings):
+    kb = make_kb(tmp_path, knowledge)
+    hits = kb.search_by_vector(embeddings.embed_query("用户登录"), k=3)
+    assert len(hits) == 3
+    assert [distance for _, distance in hits] == sorted(distance for _, distance in hits)
+    assert {doc.page_content for doc, _ in hits[:2]} == \
+        {"用户登录 测试用例 密码错误", "# 登录接口\n\n用户登录 接口 返回令牌"}
+
+    assert [doc.page_content for doc in kb.search("知识库说明", k=1)] == ["知识库说明 目录结构"]
+    assert [doc.page_content for doc in kb.search("用户登录", k=4, shards=["QA"])][0] == "用户登录 测试用例 密码错误"
+    assert all("QA" in doc.metadata["source"] for doc in kb.search("用户登录", k=4, shards=["QA"]))
+    with pytest.raises(ValueError):
+        kb.search("用户登录", shards=["OPS"])
+
+
+def test_batch_search_keeps_query_order(tmp_path, knowledge, embeddings):
+    kb = make_kb(tmp_path, knowledge)
+    results = kb.search_by_vectors(kb.embed_queries(["创建订单", "知识库说明"]), k=1)
+    assert [[doc.page_content for doc, _ in hits] for hits in results] == \
+        [["创建订单 测试用例 库存不足"], ["知识库说明 目录结构"]]
+
+
+def test_lexical_search_and_get_document(tmp_path, knowledge, embeddings):
+    kb = make_kb(tmp_path, knowledge)
+    hits = kb.lexical_search("测试用例")
+    assert {kb.get_document(chunk_id).page_content for chunk_id, _ in hits[:2]} == \
+        {"用户登录 测试用例 密码错误", "创建订单 测试用例 库存不足"}
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+    assert len(kb.lexical_search("用户登录", k=1)) == 1
+
+    doc = kb.get_document(hits[0][0])
+    assert "测试用例" in doc.page_content
+    assert kb.get_document("missing") is None
+
+
+def test_configured_shards(tmp_path, knowledge, embeddings, monkeypatch, capsys):
+    monkeypatch.setenv("KNOWLEDGE_SHARDS", "QA")
+    kb = make_kb(tmp_path, knowledge)
+    assert list(kb.shards) == ["QA"]
+    assert f"add '{ROOT_SHARD}' to KNOWLEDGE_SHARDS" in capsys.readouterr().out
+
+    monkeypatch.setenv("KNOWLEDGE_SHARDS", f"{ROOT_SHARD},DEV")
+    assert list(make_kb(tmp_path, knowledge).shards) == [ROOT_SHARD, "DEV"]
+
+    with pytest.raises(EmptyKnowledgeBaseError):
+        make_kb(tmp_path, knowledge, shards=["EMPTY"])
+
+
+def test_refresh_one_shard(tmp_path, knowledge, embeddings):
+    kb = make_kb(tmp_path, knowledge)
+    version = kb.index_version
+    dev_version = kb.shards["DEV"].index_version
+    write_files(knowledge, {"QA/search.txt": "搜索商品 测试用例", "DEV/search.txt": "搜索接口"})
+
+    assert kb.refresh("QA") == {"QA": {"added": 1, "changed": 0, "removed": 0}}
+    assert kb.shards["QA"].vector_store.index.ntotal == 3
+    assert kb.shards["DEV"].index_version == dev_version
+    assert kb.index_version != version
+
+    stats = kb.refresh()
+    assert stats["DEV"] == {"added": 1, "changed": 0, "removed": 0}
+    assert stats["QA"] == stats[ROOT_SHARD] == {"added": 0, "changed": 0, "removed": 0}
+
+
+def test_reload_reuses_saved_shards(tmp_path, knowledge, embeddings):
+    make_kb(tmp_path, knowledge)
+    embeddings.calls = 0
+    kb = make_kb(tmp_path, knowledge)
+    assert embeddings.calls == 0
+    assert [doc.page_content for doc in kb.search("创建订单", k=1)] == ["创建订单 测试用例 库存不足"]